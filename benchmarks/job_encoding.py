@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for the job record encoding
+Compares the old jobs.json layout (indented to_dict output, ISO timestamps,
+every job parsed into a Job) with compact records and lazily built Jobs
+
+Usage: python benchmarks/job_encoding.py [--jobs N]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from queuectl.job import Job
+
+class LegacyJob:
+    """Job as loaded before records went compact: a __dict__ object with parsed ISO dates"""
+
+    def __init__(self, data):
+        self.__dict__.update(data)
+        self.created_at = datetime.fromisoformat(data["created_at"])
+        self.updated_at = datetime.fromisoformat(data["updated_at"])
+        self.next_run_at = datetime.fromisoformat(data["next_run_at"]) if data["next_run_at"] else None
+
+def make_jobs(count):
+    return [
+        Job(id=f"job{i:08d}", command=f"echo {i}", priority=i % 3,
+            state=("pending", "completed", "dead")[i % 3])
+        for i in range(count)
+    ]
+
+def measure(label, encoded, load):
+    """Time and trace the memory of loading `encoded` with `load`"""
+    start = time.perf_counter()
+    load(encoded)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    loaded = load(encoded)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del loaded
+    print(f"  {label:<28} {elapsed * 1000:8.1f} ms  {peak / 2**20:8.1f} MiB peak")
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare legacy and compact job encodings')
+    parser.add_argument('--jobs', type=int, default=100000, help='Number of jobs (default: 100000)')
+    args = parser.parse_args()
+
+    jobs = make_jobs(args.jobs)
+    legacy = json.dumps([job.to_dict() for job in jobs], indent=2)
+    compact = json.dumps([job.to_record() for job in jobs], separators=(',', ':'))
+
+    print(f"{args.jobs} jobs")
+    print(f"  {'legacy file':<28} {len(legacy) / 2**20:8.1f} MiB")
+    print(f"  {'compact file':<28} {len(compact) / 2**20:8.1f} MiB")
+
+    print("Load every job")
+    old = measure("legacy parse + LegacyJob", legacy, lambda s: [LegacyJob(d) for d in json.loads(s)])
+    new = measure("compact parse + Job", compact, lambda s: [Job.from_dict(d) for d in json.loads(s)])
+    print(f"  speedup {old / new:.1f}x")
+
+    print("Count jobs per state (status, stats recount)")
+    old = measure("legacy parse + LegacyJob", legacy,
+                  lambda s: Counter(job.state for job in (LegacyJob(d) for d in json.loads(s))))
+    new = measure("compact records only", compact, lambda s: Counter(r["state"] for r in json.loads(s)))
+    print(f"  speedup {old / new:.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Stress benchmark for the claim path
+Runs N worker processes against M jobs and checks every job ran exactly once
+
+Usage: python benchmarks/stress_claim.py [--workers N] [--jobs M] [--backend json|sqlite|journal] [--prefetch K]
+"""
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from queuectl.config import get_config
+from queuectl.job_queue import JobQueue
+from queuectl.worker_manager import WorkerManager
+
+def configure(data_dir, backend):
+    """Point the (unsaved) configuration at a scratch data directory"""
+    config = get_config()
+    config.config['data_dir'] = data_dir
+    config.config['storage_backend'] = backend
+
+def drain(data_dir, backend, prefetch):
+    """Worker loop that exits once the queue is empty"""
+    configure(data_dir, backend)
+    manager = WorkerManager()
+    sys.stdout = open(os.devnull, 'w')
+    while True:
+        jobs = manager.queue.claim_batch(prefetch)
+        if not jobs:
+            break
+        for job in jobs:
+            manager.process_job(job)
+
+def main():
+    parser = argparse.ArgumentParser(description='Stress test concurrent job claiming')
+    parser.add_argument('--workers', type=int, default=8, help='Number of worker processes (default: 8)')
+    parser.add_argument('--jobs', type=int, default=200, help='Number of jobs (default: 200)')
+    parser.add_argument('--backend', default='json', help='Storage backend (default: json)')
+    parser.add_argument('--prefetch', type=int, default=1, help='Jobs claimed per storage round-trip (default: 1)')
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix='queuectl-stress-')
+    executed_log = os.path.join(data_dir, 'executed.log')
+    configure(data_dir, args.backend)
+
+    try:
+        queue = JobQueue()
+        for i in range(args.jobs):
+            queue.enqueue({"id": f"stress{i}", "command": f"echo stress{i} >> {executed_log}"})
+
+        print(f"Running {args.workers} worker(s) against {args.jobs} job(s) [{args.backend}, prefetch {args.prefetch}]")
+        start = time.time()
+        workers = [
+            multiprocessing.Process(target=drain, args=(data_dir, args.backend, args.prefetch))
+            for _ in range(args.workers)
+        ]
+        for p in workers:
+            p.start()
+        for p in workers:
+            p.join()
+        elapsed = time.time() - start
+
+        with open(executed_log) as f:
+            runs = Counter(line.strip() for line in f if line.strip())
+        duplicates = {job_id: n for job_id, n in runs.items() if n > 1}
+        missing = args.jobs - len(runs)
+
+        print(f"Executed {sum(runs.values())} run(s) in {elapsed:.2f}s ({args.jobs / elapsed:.1f} jobs/s)")
+        print(f"Stats: {queue.get_stats()}")
+        assert not duplicates, f"Jobs executed more than once: {duplicates}"
+        assert missing == 0, f"{missing} job(s) never executed"
+        print("✓ Every job executed exactly once")
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -6,7 +6,58 @@ queuectl - A CLI-based background job queue system
 import sys
 import argparse
 import json
-from .commands import enqueue, worker, status, list_jobs, dlq, config
+from datetime import datetime
+from .job import to_local
+from .commands import enqueue, worker, status, list_jobs, dlq, config, storage, daemon, gc, logs, template, graph, throttle, schedule
+
+def parse_time(value):
+    """ISO time argument; an offset is converted to naive local time like stored jobs"""
+    try:
+        return to_local(datetime.fromisoformat(value))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid ISO time: {value!r}")
+
+def positive_int(value):
+    """Integer argument that must be at least 1"""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: {value!r}")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1: {value}")
+    return number
+
+def non_negative_int(value):
+    """Integer argument that must be at least 0"""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: {value!r}")
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"must not be negative: {value}")
+    return number
+
+def add_listing_arguments(parser):
+    """Pagination, filter and output options shared by list and dlq list"""
+    parser.add_argument('--limit', type=positive_int, help='Show at most N jobs')
+    parser.add_argument('--offset', type=non_negative_int, default=0, help='Skip the first N matching jobs')
+    parser.add_argument('--since', type=parse_time, help='Only jobs created at or after this ISO time')
+    parser.add_argument('--until', type=parse_time, help='Only jobs created before this ISO time')
+    parser.add_argument('--command-contains', help='Only jobs whose command contains this text')
+    parser.add_argument('--sort', default='created', choices=['created', 'updated'], help='Timestamp to order by (default: created)')
+    parser.add_argument('--desc', action='store_true', help='Newest first')
+    parser.add_argument('--format', default='table', choices=['table', 'jsonl'], help='Output format (default: table)')
+
+def listing_filters(args) -> dict:
+    return {
+        'since': args.since,
+        'until': args.until,
+        'command_contains': args.command_contains,
+        'sort': args.sort,
+        'descending': args.desc,
+        'offset': args.offset,
+        'limit': args.limit,
+    }
 
 def main():
     parser = argparse.ArgumentParser(
@@ -17,26 +68,52 @@ def main():
 
     # Enqueue command
     enqueue_parser = subparsers.add_parser('enqueue', help='Add a new job to the queue')
-    enqueue_parser.add_argument('job_json', help='Job definition in JSON format')
+    enqueue_parser.add_argument('job_json', nargs='?', help='Job definition in JSON format')
+    enqueue_parser.add_argument('--file', help='Enqueue jobs from a JSON Lines file (one job per line)')
+    enqueue_parser.add_argument('--stdin', action='store_true', help='Enqueue jobs from JSON Lines on stdin')
+    enqueue_parser.add_argument('--chunk-size', type=positive_int, help='Jobs per storage write for bulk enqueue (default: enqueue_chunk_size)')
+    enqueue_parser.add_argument('--queue', help='Queue for jobs that do not name one (default: default)')
 
     # Worker command
     worker_parser = subparsers.add_parser('worker', help='Manage worker processes')
     worker_subparsers = worker_parser.add_subparsers(dest='worker_command')
     worker_start_parser = worker_subparsers.add_parser('start', help='Start worker processes')
     worker_start_parser.add_argument('--count', type=int, default=1, help='Number of workers (default: 1)')
+    worker_start_parser.add_argument('--prefetch', type=positive_int, default=1, help='Jobs leased per storage round-trip (default: 1)')
+    worker_start_parser.add_argument('--engine', choices=['process', 'asyncio'], default='process', help='Execution engine (default: process)')
+    worker_start_parser.add_argument('--concurrency', type=positive_int, default=10, help='Concurrent jobs per worker with --engine asyncio (default: 10)')
+    worker_start_parser.add_argument('--min', type=int, dest='min_workers', help='Autoscale: minimum workers (default: 1)')
+    worker_start_parser.add_argument('--max', type=int, dest='max_workers', help='Autoscale: maximum workers; enables the autoscaling supervisor')
+    worker_start_parser.add_argument('--queue', default='default', help='Queues to work, as name[:weight],... (default: default)')
     worker_stop_parser = worker_subparsers.add_parser('stop', help='Stop worker processes')
 
     # Status command
     status_parser = subparsers.add_parser('status', help='Show summary of all job states & active workers')
+    status_parser.add_argument('--verify', action='store_true', help='Recount all jobs and report drifted state counters')
+    status_parser.add_argument('--repair', action='store_true', help='With --verify, reset drifted counters to the recount')
 
     # List command
     list_parser = subparsers.add_parser('list', help='List jobs by state')
     list_parser.add_argument('--state', help='Filter by state (pending, processing, completed, failed, dead)')
+    list_parser.add_argument('--queue', help='Only list jobs in this queue')
+    add_listing_arguments(list_parser)
+
+    # Logs command
+    logs_parser = subparsers.add_parser('logs', help='Show the output of a job')
+    logs_parser.add_argument('job_id', help='Job ID')
+    logs_parser.add_argument('--follow', '-f', action='store_true', help='Keep printing output while the job runs')
+    logs_parser.add_argument('--tail', type=int, help='Only print the last N lines')
+
+    # Graph command
+    graph_parser = subparsers.add_parser('graph', help='Show the dependencies and dependents of a job')
+    graph_parser.add_argument('job_id', help='Job ID')
 
     # DLQ command
     dlq_parser = subparsers.add_parser('dlq', help='Manage Dead Letter Queue')
     dlq_subparsers = dlq_parser.add_subparsers(dest='dlq_command')
     dlq_list_parser = dlq_subparsers.add_parser('list', help='List jobs in DLQ')
+    dlq_list_parser.add_argument('--queue', help='Only list dead jobs in this queue')
+    add_listing_arguments(dlq_list_parser)
     dlq_retry_parser = dlq_subparsers.add_parser('retry', help='Retry a job from DLQ')
     dlq_retry_parser.add_argument('job_id', help='Job ID to retry')
 
@@ -44,13 +121,67 @@ def main():
     config_parser = subparsers.add_parser('config', help='Manage configuration')
     config_subparsers = config_parser.add_subparsers(dest='config_command')
     config_set_parser = config_subparsers.add_parser('set', help='Set configuration value')
-    config_set_parser.add_argument('key', help='Config key (max_retries, backoff_base)')
+    config_set_parser.add_argument('key', help='Config key (max_retries, backoff_base, storage_backend)')
     config_set_parser.add_argument('value', help='Config value')
 
+    # Template command
+    template_parser = subparsers.add_parser('template', help='Manage command templates')
+    template_subparsers = template_parser.add_subparsers(dest='template_command')
+    template_add_parser = template_subparsers.add_parser('add', help='Register a template, e.g. "convert {src} -resize {w} {dst}"')
+    template_add_parser.add_argument('name', help='Template name')
+    template_add_parser.add_argument('template', help='Command with {placeholders}; run without a shell')
+    template_subparsers.add_parser('list', help='List templates')
+    template_remove_parser = template_subparsers.add_parser('remove', help='Remove a template')
+    template_remove_parser.add_argument('name', help='Template name')
+
+    # Schedule command
+    schedule_parser = subparsers.add_parser('schedule', help='Manage jobs enqueued with run_at or schedule')
+    schedule_subparsers = schedule_parser.add_subparsers(dest='schedule_command')
+    schedule_subparsers.add_parser('list', help='List scheduled jobs, soonest first')
+    schedule_remove_parser = schedule_subparsers.add_parser('remove', help='Cancel a scheduled job')
+    schedule_remove_parser.add_argument('job_id', help='Job ID')
+
+    # Throttle command
+    throttle_parser = subparsers.add_parser('throttle', help='Limit the claim rate and concurrency of a queue or tag')
+    throttle_subparsers = throttle_parser.add_subparsers(dest='throttle_command')
+    throttle_set_parser = throttle_subparsers.add_parser('set', help='Set limits, e.g. "tag:payments --rate 10/s --max-in-flight 4"')
+    throttle_set_parser.add_argument('target', help='queue:<name> or tag:<name>')
+    throttle_set_parser.add_argument('--rate', help='Token-bucket rate: N/s, N/m or N/h')
+    throttle_set_parser.add_argument('--burst', type=int, help='Bucket size (default: one second of tokens, at least 1)')
+    throttle_set_parser.add_argument('--max-in-flight', type=int, help='Most jobs processing at once')
+    throttle_subparsers.add_parser('list', help='List throttles')
+    throttle_remove_parser = throttle_subparsers.add_parser('remove', help='Remove a throttle')
+    throttle_remove_parser.add_argument('target', help='queue:<name> or tag:<name>')
+
+    # Storage command
+    storage_parser = subparsers.add_parser('storage', help='Manage job storage')
+    storage_subparsers = storage_parser.add_subparsers(dest='storage_command')
+    storage_subparsers.add_parser('compact', help='Fold the storage journal into a new snapshot')
+
+    # GC command
+    gc_parser = subparsers.add_parser('gc', help='Move expired completed and dead jobs to the archive')
+    gc_parser.add_argument('--every', type=float, help='Keep running, collecting every N seconds')
+
+    # Daemon command
+    daemon_parser = subparsers.add_parser('daemon', help='Manage the queue daemon')
+    daemon_subparsers = daemon_parser.add_subparsers(dest='daemon_command')
+    daemon_subparsers.add_parser('start', help='Serve queue operations over a local socket (foreground)')
+    daemon_subparsers.add_parser('stop', help='Stop the running daemon')
+    daemon_subparsers.add_parser('status', help='Show daemon status')
+
     args = parser.parse_args()
 
     try:
-        if args.command == 'enqueue':
+        if args.command == 'enqueue' and (args.file or args.stdin):
+            if args.file:
+                with open(args.file, 'r') as f:
+                    enqueue.handle_bulk_enqueue(f, args.chunk_size, args.queue)
+            else:
+                enqueue.handle_bulk_enqueue(sys.stdin, args.chunk_size, args.queue)
+        elif args.command == 'enqueue':
+            if not args.job_json:
+                enqueue_parser.print_help()
+                sys.exit(1)
             try:
                 job_data = json.loads(args.job_json)
             except json.JSONDecodeError:
@@ -63,21 +194,35 @@ def main():
                     print("Example: queuectl enqueue '{\"id\":\"job1\",\"command\":\"echo test\"}'", file=sys.stderr)
                     sys.exit(1)
                 job_data = json.loads(job_str)
-            enqueue.handle_enqueue(job_data)
+            enqueue.handle_enqueue(job_data, args.queue)
         elif args.command == 'worker':
-            if args.worker_command == 'start':
-                worker.start_workers(args.count)
+            if args.worker_command == 'start' and (args.min_workers is not None or args.max_workers is not None):
+                min_workers = args.min_workers if args.min_workers is not None else 1
+                max_workers = args.max_workers if args.max_workers is not None else max(min_workers, args.count)
+                if min_workers > max_workers:
+                    print("Error: --min cannot be greater than --max", file=sys.stderr)
+                    sys.exit(1)
+                worker.start_autoscaled(min_workers, max_workers, args.prefetch, args.engine, args.concurrency, args.queue)
+            elif args.worker_command == 'start':
+                worker.start_workers(args.count, args.prefetch, args.engine, args.concurrency, args.queue)
             elif args.worker_command == 'stop':
                 worker.stop_workers()
             else:
                 worker_parser.print_help()
         elif args.command == 'status':
-            status.show_status()
+            if args.repair and not args.verify:
+                print("Error: --repair requires --verify", file=sys.stderr)
+                sys.exit(1)
+            status.show_status(args.verify, args.repair)
         elif args.command == 'list':
-            list_jobs.show_list(args.state)
+            list_jobs.show_list(args.state, args.queue, args.format, **listing_filters(args))
+        elif args.command == 'logs':
+            logs.show_logs(args.job_id, args.follow, args.tail)
+        elif args.command == 'graph':
+            graph.show_graph(args.job_id)
         elif args.command == 'dlq':
             if args.dlq_command == 'list':
-                dlq.list_dlq()
+                dlq.list_dlq(args.queue, args.format, **listing_filters(args))
             elif args.dlq_command == 'retry':
                 dlq.retry_job(args.job_id)
             else:
@@ -87,6 +232,47 @@ def main():
                 config.set_config(args.key, args.value)
             else:
                 config_parser.print_help()
+        elif args.command == 'template':
+            if args.template_command == 'add':
+                template.add(args.name, args.template)
+            elif args.template_command == 'list':
+                template.list_templates()
+            elif args.template_command == 'remove':
+                template.remove(args.name)
+            else:
+                template_parser.print_help()
+        elif args.command == 'schedule':
+            if args.schedule_command == 'list':
+                schedule.list_schedule()
+            elif args.schedule_command == 'remove':
+                schedule.remove(args.job_id)
+            else:
+                schedule_parser.print_help()
+        elif args.command == 'throttle':
+            if args.throttle_command == 'set':
+                throttle.set_limits(args.target, args.rate, args.burst, args.max_in_flight)
+            elif args.throttle_command == 'list':
+                throttle.list_throttles()
+            elif args.throttle_command == 'remove':
+                throttle.remove(args.target)
+            else:
+                throttle_parser.print_help()
+        elif args.command == 'storage':
+            if args.storage_command == 'compact':
+                storage.compact_storage()
+            else:
+                storage_parser.print_help()
+        elif args.command == 'gc':
+            gc.run_gc(args.every)
+        elif args.command == 'daemon':
+            if args.daemon_command == 'start':
+                daemon.start_daemon()
+            elif args.daemon_command == 'stop':
+                daemon.stop_daemon()
+            elif args.daemon_command == 'status':
+                daemon.show_daemon_status()
+            else:
+                daemon_parser.print_help()
         else:
             parser.print_help()
     except Exception as e:
@@ -0,0 +1,181 @@
+import asyncio
+import os
+import signal
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from .callable_pool import CallablePool
+from .job_log import open_log_writer
+from .leases import LeaseKeeper
+from .limits import limit_argv, resolve_limits
+from .templates import job_argv
+from .wakeup import IdleBackoff, Wakeup
+
+class AsyncWorker:
+    """Run up to `concurrency` shell jobs at once inside one process
+
+    Jobs are claimed in batches sized to the free slots and executed with
+    asyncio subprocesses. Outcomes go through `WorkerManager.finish_job`, so
+    retries and the DLQ behave exactly as in the process engine. Storage
+    calls wait on locks and disk, so they run on a thread of their own
+    rather than on the event loop, one at a time since storage objects are
+    not thread-safe.
+    """
+
+    def __init__(self, manager, concurrency):
+        self.manager = manager
+        self.queue = manager.queue
+        self.concurrency = concurrency
+        self.callable_pool = CallablePool(self.concurrency)
+        self._storage_thread = ThreadPoolExecutor(max_workers=1)
+        self.keeper = None
+        self._woken = None
+        self.running = True
+
+    async def _in_storage_thread(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._storage_thread, func, *args)
+
+    def stop(self):
+        if self.running:
+            print("\nGracefully shutting down worker...")
+        self.running = False
+        if self._woken:
+            self._woken.set()
+
+    @staticmethod
+    async def _pump(proc, log):
+        """Copy the job's output to its log until EOF, then wait for exit"""
+        while True:
+            chunk = await proc.stdout.read(65536)
+            if not chunk:
+                break
+            log.write(chunk)
+        await proc.wait()
+
+    async def execute_job(self, job):
+        """Execute a job command without blocking the event loop"""
+        if job.callable:
+            return await self.callable_pool.run_async(job, self.manager.get_timeout(job))
+        log = open_log_writer(job)
+        started_at, start = datetime.now(), time.monotonic()
+        try:
+            options = dict(
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.STDOUT,
+                # Own process group: Ctrl+C stops the worker, not its jobs,
+                # and a kill reaches the job's children too
+                start_new_session=(sys.platform != 'win32'),
+            )
+            argv = job_argv(job)
+            argv = limit_argv(argv or ['/bin/sh', '-c', job.command], resolve_limits(job)) or argv
+            if argv:
+                proc = await asyncio.create_subprocess_exec(*argv, **options)
+            else:
+                proc = await asyncio.create_subprocess_shell(job.command, **options)
+        except Exception as e:
+            log.write(f"{e}\n".encode())
+            job.record_attempt(started_at, time.monotonic() - start, None)
+            job.log_path = str(log.close())
+            return False
+
+        timed_out = False
+        try:
+            await asyncio.wait_for(self._pump(proc, log), timeout=self.manager.get_timeout(job))
+        except asyncio.TimeoutError:
+            timed_out = True
+            self.manager.kill_process_group(proc)
+            await proc.wait()
+            log.write(b"\nJob timed out\n")
+        except asyncio.CancelledError:
+            self.manager.kill_process_group(proc)
+            await proc.wait()
+            log.close()
+            raise
+        # The event loop reaps the child, so CPU time and peak RSS per
+        # attempt are only recorded by the process engine
+        job.record_attempt(started_at, time.monotonic() - start, proc.returncode)
+        job.log_path = str(log.close())
+        return proc.returncode == 0 and not timed_out
+
+    async def process_job(self, job):
+        """Process a single job with retry logic"""
+        job.increment_attempt()
+        try:
+            success = await self.execute_job(job)
+        except asyncio.CancelledError:
+            # Interrupted by shutdown: hand the job back untouched, unless
+            # its lease was reaped and the job now belongs to another worker
+            await self._in_storage_thread(self.queue.release_jobs, [job], job.worker_id)
+            raise
+        except Exception as e:
+            # Left in the task, the error would never be seen and the job
+            # would sit in processing until its lease was reaped
+            print(f"✗ Job {job.id} raised {type(e).__name__}: {e}")
+            success = False
+        finally:
+            self.keeper.drop(job)
+        try:
+            await self._in_storage_thread(self.manager.finish_job, job, success)
+        except ConnectionError as e:
+            # The lease was dropped above, so the reaper runs the job again
+            print(f"⚠ Job {job.id} outcome not recorded ({e}); it runs again once its lease expires")
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        if sys.platform != 'win32':
+            loop.add_signal_handler(signal.SIGINT, self.stop)
+            loop.add_signal_handler(signal.SIGTERM, self.stop)
+        else:
+            signal.signal(signal.SIGINT, lambda sig, frame: self.stop())
+
+        print(f"Worker started (PID: {os.getpid()}, engine: asyncio, concurrency: {self.concurrency})")
+        tasks = set()
+        # Heartbeats run on their own thread, so a busy event loop never lets a lease lapse
+        self.keeper = LeaseKeeper(self.queue.queues)
+        self.keeper.start()
+        wakeup = Wakeup()
+        backoff = IdleBackoff()
+        self._woken = asyncio.Event()
+        if wakeup.sock:
+            loop.add_reader(wakeup.fileno(), lambda: (wakeup.drain(), self._woken.set()))
+        while self.running:
+            free = self.concurrency - len(tasks)
+            if free > 0:
+                try:
+                    claimed = await self._in_storage_thread(self.queue.claim_batch, free, self.keeper.worker_id)
+                except ConnectionError as e:
+                    # Retried after the idle backoff; jobs leased by a claim
+                    # whose reply was lost are requeued once their leases lapse
+                    print(f"Storage unavailable ({e}); retrying")
+                    claimed = []
+                self.keeper.hold(claimed)
+                for job in claimed:
+                    tasks.add(asyncio.ensure_future(self.process_job(job)))
+                if claimed:
+                    backoff.reset()
+            # Wake when a slot frees up or a job is enqueued; with free slots,
+            # also after the idle backoff to catch jobs that became due
+            woken = asyncio.ensure_future(self._woken.wait())
+            timeout = backoff.next() if len(tasks) < self.concurrency else None
+            await asyncio.wait(tasks | {woken}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            woken.cancel()
+            self._woken.clear()
+            tasks = {task for task in tasks if not task.done()}
+        if wakeup.sock:
+            loop.remove_reader(wakeup.fileno())
+        wakeup.close()
+
+        if tasks:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            print(f"Returned {len(tasks)} interrupted job(s) to the queue")
+        self.keeper.stop()
+        self._storage_thread.shutdown()
+        self.callable_pool.shutdown()
+        print("Worker stopped")
+
+    def run(self):
+        """Main worker loop"""
+        asyncio.run(self._run())
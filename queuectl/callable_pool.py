@@ -0,0 +1,262 @@
+import asyncio
+import importlib
+import multiprocessing
+import os
+import re
+import signal
+import sys
+import threading
+import time
+import traceback
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from datetime import datetime
+from .config import get_config
+from .job_log import JobLogWriter, job_log_path
+from .limits import CPULimitExceeded, resolve_limits, soft_limits
+
+try:
+    import resource
+except ImportError:  # Windows: no per-attempt CPU and RSS for callables
+    resource = None
+
+# "package.module:function" or "package.module:Class.method"
+_CALLABLE_PATH = re.compile(r'^[A-Za-z_][\w.]*:[A-Za-z_][\w.]*$')
+
+def validate_callable(job_data: dict):
+    """Reject malformed `callable` paths and non-object `kwargs`"""
+    if not isinstance(job_data['callable'], str) or not _CALLABLE_PATH.match(job_data['callable']):
+        raise ValueError("'callable' must look like 'package.module:function'")
+    if not isinstance(job_data.get('kwargs') or {}, dict):
+        raise ValueError("'kwargs' must be a JSON object")
+    if job_data.get('nice') is not None:
+        # Priority can only be lowered in a shared process, never restored
+        raise ValueError("'nice' does not apply to callable jobs; job_nice sets the pool's priority")
+
+def resolve_callable(path: str):
+    """Import `module:attr.attr` and return the object it names"""
+    module_name, _, attr_path = path.partition(':')
+    target = importlib.import_module(module_name)
+    for attr in attr_path.split('.'):
+        target = getattr(target, attr)
+    return target
+
+# Set while a job's callable runs, so a late SIGXCPU does not land in cleanup
+_in_job = False
+
+def _cpu_limit_exceeded(signum, frame):
+    if _in_job:
+        raise CPULimitExceeded("CPU time limit exceeded")
+
+def _init_child(preload, nice):
+    # Ctrl+C reaches the whole process group; let the worker decide when to
+    # stop instead of interrupting the job mid-call
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if hasattr(signal, 'SIGXCPU'):
+        signal.signal(signal.SIGXCPU, _cpu_limit_exceeded)
+    if nice:
+        try:
+            os.nice(nice)
+        except OSError as e:
+            print(f"Could not apply job_nice {nice}: {e}", file=sys.stderr)
+    # Import from the worker's directory, as `python -c` would
+    sys.path.insert(0, os.getcwd())
+    for module_name in preload:
+        try:
+            importlib.import_module(module_name)
+        except Exception:
+            # Preloading only saves time; jobs that need the module report the error
+            print(f"Could not preload {module_name}:", file=sys.stderr)
+            traceback.print_exc()
+    threading.Thread(target=_exit_with_parent, args=(os.getppid(),), daemon=True).start()
+
+def _exit_with_parent(parent_pid):
+    # A worker that is killed outright never shuts its pool down
+    while os.getppid() == parent_pid:
+        time.sleep(1)
+    os._exit(1)
+
+def _run_callable(path, kwargs, log_path, max_bytes, compress, cpu_seconds=0, memory_mb=0):
+    """Pool-side half of a callable job: run it with stdout/stderr in its log
+
+    Returns (exit_code, final log path, cpu_seconds, max_rss_kb).
+    """
+    log = JobLogWriter(log_path, max_bytes, compress)
+    usage_before = resource.getrusage(resource.RUSAGE_SELF) if resource else None
+    sys.stdout.flush()
+    sys.stderr.flush()
+    # Point fds 1 and 2 at a pipe so output from C extensions and
+    # subprocesses is captured too, streamed through the capped writer
+    read_fd, write_fd = os.pipe()
+    saved = os.dup(1), os.dup(2)
+    os.dup2(write_fd, 1)
+    os.dup2(write_fd, 2)
+    os.close(write_fd)
+    reader = threading.Thread(target=log.copy_from, args=(os.fdopen(read_fd, 'rb'),))
+    reader.start()
+    global _in_job
+    try:
+        with soft_limits(cpu_seconds, memory_mb):
+            _in_job = True
+            try:
+                resolve_callable(path)(**kwargs)
+            finally:
+                _in_job = False
+        exit_code = 0
+    except SystemExit as e:
+        exit_code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    except BaseException:
+        traceback.print_exc()
+        exit_code = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        # Restoring the fds closes the pipe's last write end, ending the reader
+        os.dup2(saved[0], 1)
+        os.dup2(saved[1], 2)
+        os.close(saved[0])
+        os.close(saved[1])
+        reader.join()
+
+    cpu_seconds = max_rss_kb = None
+    if usage_before:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        cpu_seconds = usage.ru_utime + usage.ru_stime - usage_before.ru_utime - usage_before.ru_stime
+        # Peak of the pool process so far, which may predate this job
+        max_rss_kb = usage.ru_maxrss // 1024 if sys.platform == 'darwin' else usage.ru_maxrss
+    return exit_code, str(log.close()), cpu_seconds, max_rss_kb
+
+class CallablePool:
+    """Warm pool of Python processes for `callable` jobs
+
+    The pool starts on the first callable job and imports the modules in
+    `callable_preload` once per process, so jobs skip interpreter startup
+    and heavy imports. Processes are replaced after
+    `callable_max_tasks_per_child` jobs. A job that times out cannot be
+    interrupted inside a shared process, so the pool is killed and started
+    again on the next job; other jobs it was running are resubmitted.
+    """
+
+    def __init__(self, size=1):
+        self.size = max(1, size)
+        self._executor = None
+        self._submitted = 0
+        # Pools killed on purpose: their other jobs did not fail
+        self._killed = weakref.WeakSet()
+
+    def _pool(self):
+        config = get_config()
+        max_tasks = config.get("callable_max_tasks_per_child", 0) or None
+        if self._executor is not None and max_tasks and sys.version_info < (3, 11):
+            # No per-process recycling before 3.11: retire the whole pool
+            # once every process could have reached its quota
+            if self._submitted >= max_tasks * self.size:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+        if self._executor is None:
+            preload = [name.strip() for name in str(config.get("callable_preload", "")).split(',') if name.strip()]
+            nice = config.get("job_nice", 0)
+            options = {}
+            if max_tasks and sys.version_info >= (3, 11):
+                options['max_tasks_per_child'] = max_tasks
+            self._executor = ProcessPoolExecutor(
+                self.size,
+                # Spawned rather than forked: workers run threads, and a fork
+                # would copy their locks mid-use
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_child,
+                initargs=(preload, nice),
+                **options,
+            )
+            self._submitted = 0
+        return self._executor
+
+    def _submit(self, job):
+        """Start a job in the pool; returns (executor, future)"""
+        config = get_config()
+        limits = resolve_limits(job)
+        executor = self._pool()
+        self._submitted += 1
+        future = executor.submit(
+            _run_callable, job.callable, job.kwargs or {}, str(job_log_path(job)),
+            config.get("log_max_bytes", 0), config.get("log_compress", False),
+            limits['cpu_seconds'], limits['memory_mb'],
+        )
+        return executor, future
+
+    def kill(self, executor):
+        """Kill a pool's processes, abandoning whatever they are running"""
+        if executor is not self._executor:
+            return  # Already replaced after an earlier kill
+        # The executor has no public way to reach its processes
+        for process in list((getattr(executor, '_processes', None) or {}).values()):
+            process.kill()
+        executor.shutdown(wait=False)
+        self._killed.add(executor)
+        self._executor = None
+
+    def shutdown(self):
+        """Wait for running jobs, then stop the pool"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _finish(self, job, started_at, start, outcome):
+        """Record an attempt from the pool's result, or a timeout or crash message"""
+        duration = time.monotonic() - start
+        if isinstance(outcome, tuple):
+            exit_code, log_path, cpu_seconds, max_rss_kb = outcome
+            job.record_attempt(started_at, duration, exit_code, cpu_seconds, max_rss_kb)
+            job.log_path = log_path
+            return exit_code == 0
+        # The job never reported back; say why at the end of its log
+        path = job_log_path(job)
+        with open(path, 'ab') as f:
+            f.write(f"\n{outcome}\n".encode())
+        job.record_attempt(started_at, duration, None)
+        job.log_path = str(path)
+        return False
+
+    def run(self, job, timeout=None) -> bool:
+        """Run a callable job to completion, killing the pool on timeout"""
+        started_at, start = datetime.now(), time.monotonic()
+        executor, future = self._submit(job)
+        try:
+            outcome = future.result(timeout)
+        except FutureTimeoutError:
+            self.kill(executor)
+            outcome = "Job timed out"
+        except Exception as e:
+            self.kill(executor)
+            outcome = f"Job process failed: {e}"
+        return self._finish(job, started_at, start, outcome)
+
+    async def run_async(self, job, timeout=None) -> bool:
+        """`run` for the asyncio engine, where several jobs share the pool
+
+        A job whose pool was killed for another job's timeout is run again
+        in the new pool, within what is left of its own timeout.
+        """
+        started_at, start = datetime.now(), time.monotonic()
+        while True:
+            executor, future = self._submit(job)
+            remaining = max(0.0, timeout - (time.monotonic() - start)) if timeout else None
+            try:
+                outcome = await asyncio.wait_for(asyncio.wrap_future(future), remaining)
+            except asyncio.TimeoutError:
+                self.kill(executor)
+                outcome = "Job timed out"
+            except asyncio.CancelledError:
+                self.kill(executor)
+                raise
+            except BrokenProcessPool as e:
+                if executor in self._killed:
+                    continue
+                self.kill(executor)
+                outcome = f"Job process failed: {e}"
+            except Exception as e:
+                self.kill(executor)
+                outcome = f"Job process failed: {e}"
+            return self._finish(job, started_at, start, outcome)
@@ -1,18 +1,46 @@
 from ..config import get_config
+from ..storage import BACKENDS
 import sys
 
+INT_KEYS = [
+    'max_retries', 'backoff_base', 'journal_compact_every', 'enqueue_chunk_size',
+    'autoscale_backlog_per_worker', 'autoscale_scale_down_after', 'max_hot_jobs', 'log_max_bytes',
+    'job_nice', 'callable_max_tasks_per_child',
+]
+FLOAT_KEYS = [
+    'retry_jitter', 'max_backoff', 'autoscale_interval', 'autoscale_max_latency',
+    'completed_ttl', 'dead_ttl', 'job_timeout', 'job_cpu_seconds', 'job_memory_mb', 'dedupe_window', 'lease_timeout',
+    'worker_idle_max',
+]
+BOOL_KEYS = ['log_compress']
+
 def set_config(key, value):
     """Set configuration value"""
     config = get_config()
     
     # Convert value to appropriate type
-    if key in ['max_retries', 'backoff_base']:
+    if key in INT_KEYS:
         try:
             value = int(value)
         except ValueError:
             print(f"Error: {key} must be an integer")
             return
+    elif key in FLOAT_KEYS:
+        try:
+            value = float(value)
+        except ValueError:
+            print(f"Error: {key} must be a number")
+            return
+    elif key in BOOL_KEYS:
+        if value.lower() not in ('true', 'false', '1', '0'):
+            print(f"Error: {key} must be true or false")
+            return
+        value = value.lower() in ('true', '1')
+    elif key == 'storage_backend':
+        if value not in BACKENDS:
+            print(f"Error: {key} must be one of: {', '.join(BACKENDS)}")
+            return
     
     config.set(key, value)
     checkmark = "OK" if sys.platform == 'win32' else "✓"
-    print(f"{checkmark} Configuration updated: {key} = {value}")
+    print(f"{checkmark} Configuration updated: {key} = {config.get(key)}")
@@ -0,0 +1,29 @@
+from ..daemon import QueueDaemon
+from ..storage import DaemonStorage
+import sys
+
+def start_daemon():
+    """Run the queue daemon in the foreground"""
+    QueueDaemon().serve()
+
+def stop_daemon():
+    """Ask a running daemon to shut down"""
+    daemon = DaemonStorage.try_connect()
+    if not daemon:
+        print("Daemon is not running")
+        return
+    daemon.call("shutdown")
+    checkmark = "OK" if sys.platform == 'win32' else "✓"
+    print(f"{checkmark} Daemon stopped")
+
+def show_daemon_status():
+    """Show whether the daemon is running"""
+    daemon = DaemonStorage.try_connect()
+    if not daemon:
+        print("Daemon is not running")
+        return
+    info = daemon.call("ping")
+    print(f"Daemon running (PID: {info['pid']})")
+    print(f"  Backend:  {info['backend']}")
+    print(f"  Uptime:   {info['uptime']:.0f}s")
+    print(f"  Requests: {info['requests']}")
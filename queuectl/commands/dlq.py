@@ -1,26 +1,34 @@
 from ..job_queue import JobQueue
 from ..job import JobState
+from .list_jobs import print_jsonl
 
 import sys
 
-def list_dlq():
+def list_dlq(queue_name=None, output_format='table', **filters):
     """List jobs in Dead Letter Queue"""
     queue = JobQueue()
-    jobs = queue.get_jobs_by_state(JobState.DEAD)
+    # Archived dead jobs can no longer be retried, so only hot ones are shown
+    jobs = queue.iter_jobs(JobState.DEAD, queue_name, include_archive=False, **filters)
     
-    print("\nDead Letter Queue:")
-    
-    if not jobs:
-        print("  No jobs in DLQ")
+    if output_format == 'jsonl':
+        print_jsonl(jobs)
         return
     
-    print(f"\n{'ID':<15} {'Command':<30} {'Attempts':<10} {'Created':<20}")
-    print("-" * 80)
+    print("\nDead Letter Queue:")
     
+    found = False
     for job in jobs:
-        command = job.command[:27] + "..." if len(job.command) > 30 else job.command
+        if not found:
+            found = True
+            print(f"\n{'ID':<15} {'Command':<30} {'Attempts':<10} {'Created':<20}")
+            print("-" * 80)
+        command = job.display_command
+        command = command[:27] + "..." if len(command) > 30 else command
         created = job.created_at.strftime("%Y-%m-%d %H:%M:%S")
         print(f"{job.id:<15} {command:<30} {job.attempts:<10} {created:<20}")
+    
+    if not found:
+        print("  No jobs in DLQ")
 
 def retry_job(job_id):
     """Retry a job from DLQ"""
@@ -37,7 +45,11 @@ def retry_job(job_id):
     
     job.state = JobState.PENDING
     job.attempts = 0
+    job.next_run_at = None
     queue.update_job(job)
     
     checkmark = "OK" if sys.platform == 'win32' else "✓"
-    print(f"{checkmark} Job {job_id} moved back to pending queue")
+    if job.state == JobState.BLOCKED:
+        print(f"{checkmark} Job {job_id} will run once its dependencies complete")
+    else:
+        print(f"{checkmark} Job {job_id} moved back to pending queue")
@@ -1,14 +1,71 @@
 from ..job_queue import JobQueue
+from ..job import DEFAULT_QUEUE, JobState
+import json
 import sys
+import time
 
-def handle_enqueue(job_data):
+def _with_queue(job_data, queue_name):
+    if queue_name and isinstance(job_data, dict):
+        job_data.setdefault('queue', queue_name)
+    return job_data
+
+def handle_enqueue(job_data, queue_name=None):
     """Handle enqueue command"""
     queue = JobQueue()
-    job = queue.enqueue(job_data)
+    job, created = queue.get_or_enqueue(_with_queue(job_data, queue_name))
     
     # Use ASCII checkmark for Windows compatibility
     checkmark = "OK" if sys.platform == 'win32' else "✓"
     
+    if not created and job.next_run_at and job.state == JobState.PENDING and queue.get_job(job.id) is None:
+        print(f"{checkmark} Job already scheduled: {job.id}")
+        return
+    if created and job.next_run_at:
+        print(f"{checkmark} Job scheduled: {job.id}")
+        if job_data.get('schedule'):
+            print(f"  Schedule: {job_data['schedule']}")
+        print(f"  Next run: {job.next_run_at.strftime('%Y-%m-%d %H:%M:%S')}")
+        return
+    if not created:
+        print(f"{checkmark} Job already enqueued: {job.id} (state: {job.state.value})")
+        return
     print(f"{checkmark} Job enqueued: {job.id}")
-    print(f"  Command: {job.command}")
+    print(f"  Command: {job.display_command}")
     print(f"  Max retries: {job.max_retries}")
+    if job.queue != DEFAULT_QUEUE:
+        print(f"  Queue: {job.queue}")
+    if job.priority:
+        print(f"  Priority: {job.priority}")
+    if job.depends_on:
+        print(f"  Depends on: {', '.join(job.depends_on)}")
+
+def _read_job_lines(stream):
+    """Yield job definitions from a JSON Lines stream"""
+    for line_number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Line {line_number}: invalid JSON ({e.msg})")
+
+def handle_bulk_enqueue(stream, chunk_size=None, queue_name=None):
+    """Handle enqueue --file / --stdin"""
+    queue = JobQueue()
+    start = time.time()
+    read = 0
+    
+    def jobs():
+        nonlocal read
+        for job_data in _read_job_lines(stream):
+            read += 1
+            yield _with_queue(job_data, queue_name)
+    
+    count = queue.enqueue_many(jobs(), chunk_size)
+    elapsed = time.time() - start
+    
+    checkmark = "OK" if sys.platform == 'win32' else "✓"
+    rate = read / elapsed if elapsed > 0 else float(read)
+    skipped = f", {read - count} duplicate(s) skipped" if read > count else ""
+    print(f"{checkmark} Enqueued {count} job(s) in {elapsed:.2f}s ({rate:.0f} jobs/s{skipped})")
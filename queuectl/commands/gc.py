@@ -0,0 +1,24 @@
+from ..job_queue import JobQueue
+import sys
+import time
+
+def _collect(queue):
+    archived = queue.collect_garbage()
+    checkmark = "OK" if sys.platform == 'win32' else "✓"
+    print(f"{checkmark} Archived {sum(archived.values())} finished job(s)")
+    for name, count in archived.items():
+        if count:
+            print(f"  {name}: {count}")
+
+def run_gc(every=None):
+    """Archive expired finished jobs once, or every `every` seconds"""
+    queue = JobQueue()
+    _collect(queue)
+    if not every:
+        return
+    try:
+        while True:
+            time.sleep(every)
+            _collect(queue)
+    except KeyboardInterrupt:
+        print("\nArchiver stopped")
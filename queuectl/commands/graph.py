@@ -0,0 +1,46 @@
+from ..job_queue import JobQueue
+
+def _print_tree(job, children_of, depth, shown):
+    """Print a job and, indented below it, the jobs `children_of` leads to"""
+    indent = "  " * depth
+    if job.id in shown:
+        # Reached again through another path (a diamond in the DAG)
+        print(f"{indent}{job.id} [{job.state.value}] (see above)")
+        return
+    shown.add(job.id)
+    print(f"{indent}{job.id} [{job.state.value}]")
+    for child in children_of(job):
+        _print_tree(child, children_of, depth + 1, shown)
+
+def show_graph(job_id):
+    """Show the jobs a job waits on and the jobs waiting on it"""
+    queue = JobQueue()
+    job = queue.get_job(job_id)
+    if not job:
+        raise ValueError(f"Job not found: {job_id}")
+    storage = queue.storage_for(job.queue)
+    
+    def dependencies(node):
+        found = [storage.get_job(dep) for dep in node.depends_on]
+        return [dep for dep in found if dep]
+    
+    print(f"\nJob {job.id} [{job.state.value}]")
+    print(f"  Command: {job.display_command}")
+    
+    print("\nDepends on:")
+    if not job.depends_on:
+        print("  (nothing)")
+    shown = set()
+    for dep in dependencies(job):
+        _print_tree(dep, dependencies, 1, shown)
+    archived = [dep for dep in job.depends_on if not storage.get_job(dep)]
+    if archived:
+        print(f"  (archived: {', '.join(archived)})")
+    
+    print("\nRequired by:")
+    dependents = queue.get_dependents(job)
+    if not dependents:
+        print("  (nothing)")
+    shown = set()
+    for child in dependents:
+        _print_tree(child, queue.get_dependents, 1, shown)
@@ -1,31 +1,47 @@
 from ..job_queue import JobQueue
 from ..job import JobState
+import json
 
-def show_list(state_filter=None):
-    """List jobs, optionally filtered by state"""
+def print_jsonl(jobs):
+    """Print one JSON object per job, for piping into other tools"""
+    for job in jobs:
+        print(json.dumps(job.to_dict()))
+
+def show_list(state_filter=None, queue_name=None, output_format='table', **filters):
+    """List jobs, optionally filtered by state, queue, time and command
+
+    `filters` are passed to JobQueue.iter_jobs (since, until,
+    command_contains, sort, offset, limit); rows are printed as they stream.
+    """
     queue = JobQueue()
     
+    state = None
     if state_filter:
         try:
             state = JobState(state_filter)
-            jobs = queue.get_jobs_by_state(state)
-            print(f"\nJobs with state: {state_filter}")
         except ValueError:
             print(f"Invalid state: {state_filter}")
             print(f"Valid states: {', '.join([s.value for s in JobState])}")
             return
-    else:
-        jobs = queue.get_all_jobs()
-        print("\nAll jobs:")
+    jobs = queue.iter_jobs(state, queue_name, **filters)
     
-    if not jobs:
-        print("  No jobs found")
+    if output_format == 'jsonl':
+        print_jsonl(jobs)
         return
     
-    print(f"\n{'ID':<15} {'Command':<30} {'State':<12} {'Attempts':<10} {'Created':<20}")
-    print("-" * 90)
+    print(f"\nJobs with state: {state_filter}" if state_filter else "\nAll jobs:")
     
+    # Jobs are streamed, so print the header on the first row
+    found = False
     for job in jobs:
-        command = job.command[:27] + "..." if len(job.command) > 30 else job.command
+        if not found:
+            found = True
+            print(f"\n{'ID':<15} {'Command':<30} {'State':<12} {'Attempts':<10} {'Created':<20}")
+            print("-" * 90)
+        command = job.display_command
+        command = command[:27] + "..." if len(command) > 30 else command
         created = job.created_at.strftime("%Y-%m-%d %H:%M:%S")
         print(f"{job.id:<15} {command:<30} {job.state.value:<12} {job.attempts}/{job.max_retries:<7} {created:<20}")
+    
+    if not found:
+        print("  No jobs found")
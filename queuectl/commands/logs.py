@@ -0,0 +1,52 @@
+from ..job_queue import JobQueue
+from ..job import JobState
+from ..job_log import job_log_path, read_log
+from pathlib import Path
+import os
+import sys
+import time
+
+def _follow(queue, job, path):
+    """Print a running job's output as it is written, until the job finishes"""
+    # Output moves from the log file to `.tail` once the head budget is used;
+    # an open handle keeps working across the writer's renames
+    tail_path = path.with_name(path.name + ".tail")
+    f = open(path, 'rb')
+    try:
+        while True:
+            data = f.read(65536)
+            if data:
+                sys.stdout.buffer.write(data)
+                sys.stdout.buffer.flush()
+                continue
+            if tail_path.exists() and os.stat(tail_path).st_ino != os.fstat(f.fileno()).st_ino:
+                f.close()
+                f = open(tail_path, 'rb')
+                continue
+            job = queue.get_job(job.id)
+            if not job or job.state != JobState.PROCESSING:
+                return
+            time.sleep(0.5)
+    finally:
+        f.close()
+
+def show_logs(job_id, follow=False, tail=None):
+    """Print a job's output log"""
+    queue = JobQueue()
+    job = queue.get_job(job_id)
+    if not job:
+        print(f"Job not found: {job_id}")
+        return
+    
+    running_path = job_log_path(job)
+    if follow and job.state == JobState.PROCESSING and running_path.exists():
+        _follow(queue, job, running_path)
+        return
+    
+    path = Path(job.log_path) if job.log_path else running_path
+    if not path.exists():
+        print(f"No output logged for job {job_id}")
+        return
+    for chunk in read_log(path, tail):
+        sys.stdout.buffer.write(chunk)
+    sys.stdout.buffer.flush()
@@ -0,0 +1,24 @@
+from datetime import datetime
+from ..job import describe_command
+from ..schedule import ScheduleStore
+import sys
+
+def list_schedule():
+    """List jobs waiting for their run_at or next scheduled run"""
+    entries = ScheduleStore().entries()
+    if not entries:
+        print("No scheduled jobs")
+        return
+    print(f"\n{'ID':<24} {'Next Run':<20} {'Schedule':<16} {'Command':<30}")
+    print("-" * 92)
+    for entry in entries:
+        next_run = datetime.fromtimestamp(entry['fire_at']).strftime('%Y-%m-%d %H:%M:%S')
+        command = describe_command(entry['job'])[:30]
+        print(f"{entry['id']:<24} {next_run:<20} {entry['cron'] or 'once':<16} {command:<30}")
+
+def remove(job_id):
+    """Cancel a scheduled job before it is enqueued"""
+    if not ScheduleStore().remove(job_id):
+        raise ValueError(f"Scheduled job '{job_id}' not found")
+    checkmark = "OK" if sys.platform == 'win32' else "✓"
+    print(f"{checkmark} Schedule removed: {job_id}")
@@ -1,26 +1,55 @@
 from ..job_queue import JobQueue
 from ..worker_manager import WorkerManager
+from ..storage import DaemonStorage
+from ..job import JobState
+import sys
 
-def show_status():
-    """Show queue status"""
+def show_status(verify=False, repair=False):
+    """Show queue status; with `verify`, recount every job and report drifted counters
+
+    With `repair` as well, drifted counters are reset to the recount.
+    """
     queue = JobQueue()
     manager = WorkerManager()
     
-    stats = queue.get_stats()
+    drift = queue.verify_stats(repair) if verify else None
+    queue_stats = queue.get_queue_stats()
+    stats = {state.value: sum(counts.get(state.value, 0) for counts in queue_stats.values())
+             for state in JobState}
     active_workers = manager.get_active_workers()
     
     print("=" * 50)
     print("QUEUECTL STATUS")
     print("=" * 50)
+    if isinstance(queue.storage, DaemonStorage):
+        print("\nDaemon: running")
     print(f"\nActive Workers: {len(active_workers)}")
     if active_workers:
         print(f"  PIDs: {', '.join(map(str, active_workers))}")
     
     print(f"\nJob Statistics:")
     print(f"  Pending:    {stats.get('pending', 0)}")
+    print(f"  Blocked:    {stats.get('blocked', 0)}")
     print(f"  Processing: {stats.get('processing', 0)}")
     print(f"  Completed:  {stats.get('completed', 0)}")
     print(f"  Failed:     {stats.get('failed', 0)}")
     print(f"  Dead (DLQ): {stats.get('dead', 0)}")
     print(f"  Total:      {sum(stats.values())}")
+    
+    if len(queue_stats) > 1:
+        print(f"\nQueues:")
+        for name, counts in queue_stats.items():
+            print(f"  {name:<15} pending {counts.get('pending', 0):<6} "
+                  f"processing {counts.get('processing', 0):<6} dead {counts.get('dead', 0)}")
+    
+    if verify:
+        print(f"\nCounter Verification:")
+        if not drift:
+            checkmark = "OK" if sys.platform == 'win32' else "✓"
+            print(f"  {checkmark} Counters match a full recount")
+        for name, states in drift.items():
+            for state, (counter, actual) in states.items():
+                print(f"  Drift in {name}/{state}: counter {counter}, actual {actual}{' (repaired)' if repair else ''}")
+        if drift and not repair:
+            print("  Run 'queuectl status --verify --repair' to reset the counters")
     print("=" * 50)
@@ -0,0 +1,11 @@
+from ..config import get_config
+from ..storage import get_storage, queue_names
+import sys
+
+def compact_storage():
+    """Compact the configured storage backend for every queue"""
+    backend = get_config().get('storage_backend', 'json')
+    folded = sum(get_storage(queue=name).compact() for name in queue_names())
+    
+    checkmark = "OK" if sys.platform == 'win32' else "✓"
+    print(f"{checkmark} Storage compacted ({backend}): {folded} log entries folded")
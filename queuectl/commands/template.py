@@ -0,0 +1,27 @@
+from ..templates import add_template, load_templates, remove_template
+import sys
+
+def add(name, command):
+    """Register a command template"""
+    add_template(name, command)
+    checkmark = "OK" if sys.platform == 'win32' else "✓"
+    print(f"{checkmark} Template saved: {name}")
+    print(f"  Command: {command}")
+
+def list_templates():
+    """List registered command templates"""
+    templates = load_templates()
+    if not templates:
+        print("No templates registered")
+        return
+    print(f"\n{'Name':<20} {'Command':<60}")
+    print("-" * 80)
+    for name, command in sorted(templates.items()):
+        print(f"{name:<20} {command:<60}")
+
+def remove(name):
+    """Unregister a command template"""
+    if not remove_template(name):
+        raise ValueError(f"Template '{name}' not found")
+    checkmark = "OK" if sys.platform == 'win32' else "✓"
+    print(f"{checkmark} Template removed: {name}")
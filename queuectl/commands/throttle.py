@@ -0,0 +1,35 @@
+from ..storage.throttle import load_throttles, remove_throttle, set_throttle, throttle_status
+import sys
+
+def _describe(limits):
+    parts = []
+    if 'rate' in limits:
+        parts.append(f"{limits['rate']:g}/s (burst {limits['burst']})")
+    if 'max_in_flight' in limits:
+        parts.append(f"max {limits['max_in_flight']} in flight")
+    return ", ".join(parts)
+
+def set_limits(target, rate=None, burst=None, max_in_flight=None):
+    """Limit how fast and how many jobs of a queue or tag are claimed"""
+    limits = set_throttle(target, rate, burst, max_in_flight)
+    checkmark = "OK" if sys.platform == 'win32' else "✓"
+    print(f"{checkmark} Throttle saved: {target}")
+    print(f"  Limits: {_describe(limits)}")
+
+def list_throttles():
+    """List throttles with their current tokens and in-flight jobs"""
+    if not load_throttles():
+        print("No throttles set")
+        return
+    print(f"\n{'Target':<30} {'Limits':<36} {'Tokens':<8} {'In flight':<10}")
+    print("-" * 86)
+    for target, status in sorted(throttle_status().items()):
+        tokens = f"{status['tokens']:.1f}" if status['tokens'] is not None else "-"
+        print(f"{target:<30} {_describe(status):<36} {tokens:<8} {status['in_flight']:<10}")
+
+def remove(target):
+    """Remove the limits on a queue or tag"""
+    if not remove_throttle(target):
+        raise ValueError(f"Throttle '{target}' not found")
+    checkmark = "OK" if sys.platform == 'win32' else "✓"
+    print(f"{checkmark} Throttle removed: {target}")
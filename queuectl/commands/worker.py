@@ -1,11 +1,17 @@
 from ..worker_manager import WorkerManager
+from ..job_queue import parse_queue_spec
 
-def start_workers(count):
+def start_workers(count, prefetch=1, engine='process', concurrency=1, queues='default'):
     """Start worker processes"""
-    manager = WorkerManager()
-    manager.start_workers(count)
+    manager = WorkerManager(parse_queue_spec(queues))
+    manager.start_workers(count, prefetch, engine, concurrency)
 
 def stop_workers():
     """Stop worker processes"""
     manager = WorkerManager()
     manager.stop_workers()
+
+def start_autoscaled(min_workers, max_workers, prefetch=1, engine='process', concurrency=1, queues='default'):
+    """Start an autoscaling worker pool"""
+    manager = WorkerManager(parse_queue_spec(queues))
+    manager.start_autoscaled(min_workers, max_workers, prefetch, engine, concurrency)
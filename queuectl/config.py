@@ -6,7 +6,35 @@ class Config:
     DEFAULT_CONFIG = {
         "max_retries": 3,
         "backoff_base": 2,
-        "data_dir": ".queuectl"
+        "retry_jitter": 0,
+        "max_backoff": 0,
+        "data_dir": ".queuectl",
+        "storage_backend": "json",
+        "journal_compact_every": 10000,
+        "enqueue_chunk_size": 1000,
+        "autoscale_interval": 5,
+        "autoscale_backlog_per_worker": 5,
+        "autoscale_max_latency": 10,
+        "autoscale_scale_down_after": 3,
+        "completed_ttl": 86400,
+        "dead_ttl": 604800,
+        "max_hot_jobs": 0,
+        "log_max_bytes": 10485760,
+        "log_compress": False,
+        "job_timeout": 300,
+        "job_cpu_seconds": 0,
+        "job_memory_mb": 0,
+        "job_nice": 0,
+        "callable_preload": "",
+        "callable_max_tasks_per_child": 0,
+        "dedupe_window": 3600,
+        "lease_timeout": 60,
+        "worker_idle_max": 5,
+        "daemon_timeout": 30
+    }
+    # Keys clamped into a (low, high) range when set or loaded
+    BOUNDS = {
+        "retry_jitter": (0.0, 1.0),
     }
     
     def __init__(self):
@@ -16,9 +44,16 @@ class Config:
     def _load_config(self):
         if self.config_file.exists():
             with open(self.config_file, 'r') as f:
-                return {**self.DEFAULT_CONFIG, **json.load(f)}
+                config = {**self.DEFAULT_CONFIG, **json.load(f)}
+            return {key: self._clamp(key, value) for key, value in config.items()}
         return self.DEFAULT_CONFIG.copy()
     
+    def _clamp(self, key, value):
+        if key not in self.BOUNDS or not isinstance(value, (int, float)):
+            return value
+        low, high = self.BOUNDS[key]
+        return min(max(value, low), high)
+    
     def _save_config(self):
         self.config_file.parent.mkdir(parents=True, exist_ok=True)
         with open(self.config_file, 'w') as f:
@@ -28,7 +63,7 @@ class Config:
         return self.config.get(key, default)
     
     def set(self, key, value):
-        self.config[key] = value
+        self.config[key] = self._clamp(key, value)
         self._save_config()
     
     def get_data_dir(self):
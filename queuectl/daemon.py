@@ -0,0 +1,158 @@
+import os
+import selectors
+import signal
+import socket
+import time
+import types
+from .config import get_config
+from .job import DEFAULT_QUEUE
+from .storage import get_storage
+from .storage.daemon_storage import (
+    FRAME_HEADER, DaemonStorage, daemon_socket_path, decode_body, encode_frame,
+)
+
+class QueueDaemon:
+    """Serve storage operations for the CLI and workers over a Unix socket
+
+    The daemon owns one storage instance per queue and runs every request on
+    one thread, so clients skip interpreter-side storage setup and file parsing.
+    Pair it with the `journal` backend to keep the queue state in memory.
+    """
+
+    def __init__(self):
+        self.config = get_config()
+        self.storages = {}
+        self.socket_path = daemon_socket_path()
+        self.running = True
+        self.started_at = time.time()
+        self.requests = 0
+
+    def _dispatch(self, request: dict) -> dict:
+        method = request.get("m", "")
+        args = request.get("a", [])
+        self.requests += 1
+
+        if method == "ping":
+            return {"r": {
+                "pid": os.getpid(),
+                "backend": self.config.get('storage_backend', 'json'),
+                "uptime": time.time() - self.started_at,
+                "requests": self.requests,
+            }}
+        if method == "shutdown":
+            self.running = False
+            return {"r": True}
+
+        try:
+            queue = request.get("q", DEFAULT_QUEUE)
+            if queue not in self.storages:
+                self.storages[queue] = get_storage(use_daemon=False, queue=queue)
+            handler = getattr(self.storages[queue], method, None)
+            if method.startswith('_') or not callable(handler):
+                return {"e": f"Unknown storage method: {method}", "t": "ValueError"}
+            result = handler(*args)
+            if isinstance(result, types.GeneratorType):
+                result = list(result)
+            return {"r": result}
+        except Exception as e:
+            return {"e": str(e), "t": type(e).__name__}
+
+    @staticmethod
+    def _close(selector, conn):
+        selector.unregister(conn)
+        conn.close()
+
+    def _flush(self, selector, conn, state):
+        """Send as much of the pending replies as the socket takes without blocking"""
+        try:
+            sent = conn.send(state.outbox)
+        except BlockingIOError:
+            sent = 0
+        except OSError:
+            self._close(selector, conn)
+            return
+        del state.outbox[:sent]
+        # While replies are pending, wait for the socket to drain and read no
+        # more requests, so a client that stops reading cannot grow the buffer
+        writing = bool(state.outbox)
+        if writing != state.writing:
+            state.writing = writing
+            selector.modify(conn, selectors.EVENT_WRITE if writing else selectors.EVENT_READ, state)
+
+    def _handle_readable(self, selector, key):
+        conn, state = key.fileobj, key.data
+        try:
+            chunk = conn.recv(65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            chunk = b""
+        if not chunk:
+            self._close(selector, conn)
+            return
+
+        buffer = state.inbox
+        buffer.extend(chunk)
+        while len(buffer) >= FRAME_HEADER.size:
+            (size,) = FRAME_HEADER.unpack_from(buffer)
+            if len(buffer) < FRAME_HEADER.size + size:
+                break
+            body = bytes(buffer[FRAME_HEADER.size:FRAME_HEADER.size + size])
+            del buffer[:FRAME_HEADER.size + size]
+            state.outbox.extend(encode_frame(self._dispatch(decode_body(body))))
+        if state.outbox:
+            self._flush(selector, conn, state)
+
+    def serve(self):
+        """Run the daemon in the foreground until stopped"""
+        if not hasattr(socket, 'AF_UNIX'):
+            raise RuntimeError("The daemon requires Unix domain socket support")
+        if self.socket_path.exists():
+            if DaemonStorage.try_connect():
+                raise RuntimeError(f"Daemon already running on {self.socket_path}")
+            self.socket_path.unlink()  # Stale socket from a crashed daemon
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # Created owner-only: a chmod after bind() would leave a window in
+        # which other users could connect
+        umask = os.umask(0o177)
+        try:
+            server.bind(str(self.socket_path))
+        finally:
+            os.umask(umask)
+        server.listen(128)
+        server.setblocking(False)
+
+        selector = selectors.DefaultSelector()
+        selector.register(server, selectors.EVENT_READ)
+
+        def signal_handler(sig, frame):
+            print("\nGracefully shutting down daemon...")
+            self.running = False
+
+        signal.signal(signal.SIGINT, signal_handler)
+        signal.signal(signal.SIGTERM, signal_handler)
+
+        print(f"Daemon started (PID: {os.getpid()}) on {self.socket_path}")
+        try:
+            while self.running:
+                for key, events in selector.select(timeout=1):
+                    if key.fileobj is server:
+                        try:
+                            conn, _ = server.accept()
+                        except BlockingIOError:
+                            continue
+                        conn.setblocking(False)
+                        state = types.SimpleNamespace(inbox=bytearray(), outbox=bytearray(), writing=False)
+                        selector.register(conn, selectors.EVENT_READ, state)
+                    elif events & selectors.EVENT_WRITE:
+                        self._flush(selector, key.fileobj, key.data)
+                    else:
+                        self._handle_readable(selector, key)
+        finally:
+            for key in list(selector.get_map().values()):
+                key.fileobj.close()
+            selector.close()
+            if self.socket_path.exists():
+                self.socket_path.unlink()
+        print("Daemon stopped")
@@ -1,63 +1,238 @@
 from datetime import datetime
 from enum import Enum
+import shlex
+import time
 import uuid
 
+# Queue used for jobs that do not name one
+DEFAULT_QUEUE = "default"
+
+# Attempts kept in a job's attempt_history
+HISTORY_LIMIT = 20
+
+def describe_command(data):
+    """Readable form of a job's command from its fields, whichever way it was given"""
+    if data.get("args"):
+        return shlex.join(data["args"])
+    if data.get("template"):
+        params = data.get("params") or {}
+        return " ".join([data["template"]] + [f"{key}={value}" for key, value in params.items()])
+    if data.get("callable"):
+        kwargs = data.get("kwargs") or {}
+        return f"{data['callable']}({', '.join(f'{key}={value!r}' for key, value in kwargs.items())})"
+    return data.get("command", "")
+
+def to_epoch(value):
+    """Epoch seconds from a datetime, an ISO string (older data files) or a number"""
+    if value is None or isinstance(value, float):
+        return value
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, str):
+        return datetime.fromisoformat(value).timestamp()
+    return float(value)
+
+def to_local(value):
+    """Naive local datetime, the form jobs keep timestamps in, from a possibly offset-aware one"""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone().replace(tzinfo=None)
+    return value
+
+def _timestamp(slot):
+    """datetime view of an epoch-seconds slot, built only when read"""
+    def get(self):
+        value = getattr(self, slot)
+        return datetime.fromtimestamp(value) if value is not None else None
+    def set(self, value):
+        setattr(self, slot, to_epoch(value))
+    return property(get, set)
+
+# Fields copied as-is into a storage record when set
+_RECORD_FIELDS = (
+    'command', 'args', 'template', 'params', 'callable', 'kwargs', 'depends_on', 'dedupe_key',
+    'attempts', 'max_retries', 'priority', 'queue', 'log_path', 'exit_code', 'timeout',
+    'cpu_seconds', 'memory_mb', 'nice', 'attempt_history', 'worker_id', 'tag',
+)
+_TIMESTAMP_FIELDS = ('created_at', 'updated_at', 'next_run_at', 'lease_expires_at')
+
 class JobState(str, Enum):
     PENDING = "pending"
+    BLOCKED = "blocked"
     PROCESSING = "processing"
     COMPLETED = "completed"
     FAILED = "failed"
     DEAD = "dead"
 
 class Job:
+    # Timestamps are kept as epoch floats and exposed as datetimes, so
+    # loading a job never parses dates nobody looks at
+    __slots__ = _RECORD_FIELDS + ('id', 'state') + tuple(f'_{name}' for name in _TIMESTAMP_FIELDS)
+
+    created_at = _timestamp('_created_at')
+    updated_at = _timestamp('_updated_at')
+    next_run_at = _timestamp('_next_run_at')
+    lease_expires_at = _timestamp('_lease_expires_at')
+
     def __init__(self, id=None, command="", state=JobState.PENDING, attempts=0, 
-                 max_retries=3, created_at=None, updated_at=None, **kwargs):
+                 max_retries=3, created_at=None, updated_at=None, next_run_at=None,
+                 priority=0, queue=DEFAULT_QUEUE, log_path=None, exit_code=None,
+                 timeout=None, cpu_seconds=None, memory_mb=None, nice=None,
+                 attempt_history=None, args=None, template=None, params=None,
+                 callable=None, kwargs=None, depends_on=None, dedupe_key=None,
+                 worker_id=None, lease_expires_at=None, tag=None, **extra):
         self.id = id or f"job_{uuid.uuid4().hex[:8]}"
         self.command = command
+        # Exec fast path: an argv list, or a registered template plus its parameters
+        self.args = args
+        self.template = template
+        self.params = params
+        # In-process Python job: "module:function" called with kwargs in a warm pool
+        self.callable = callable
+        self.kwargs = kwargs
+        # IDs of jobs in the same queue that must complete before this one runs
+        self.depends_on = depends_on or []
+        # Enqueueing another job with this key within `dedupe_window` returns this one
+        self.dedupe_key = dedupe_key
+        # Groups jobs across queues for `queuectl throttle` limits
+        self.tag = tag
         self.state = state if isinstance(state, JobState) else JobState(state)
         self.attempts = attempts
         self.max_retries = max_retries
-        self.created_at = created_at or datetime.now()
-        self.updated_at = updated_at or datetime.now()
+        now = time.time()
+        self._created_at = to_epoch(created_at) if created_at is not None else now
+        self._updated_at = to_epoch(updated_at) if updated_at is not None else now
+        self._next_run_at = to_epoch(next_run_at)
+        self.priority = priority
+        self.queue = queue
+        self.log_path = log_path
+        self.exit_code = exit_code
+        # Resource limits; None falls back to the job_* config defaults
+        self.timeout = timeout
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self.nice = nice
+        self.attempt_history = attempt_history or []
+        # Set while processing: the claiming worker renews the lease until it finishes
+        self.worker_id = worker_id
+        self._lease_expires_at = to_epoch(lease_expires_at)
     
     def to_dict(self):
         return {
             "id": self.id,
             "command": self.command,
+            "args": self.args,
+            "template": self.template,
+            "params": self.params,
+            "callable": self.callable,
+            "kwargs": self.kwargs,
+            "depends_on": self.depends_on,
+            "dedupe_key": self.dedupe_key,
+            "tag": self.tag,
             "state": self.state.value,
             "attempts": self.attempts,
             "max_retries": self.max_retries,
             "created_at": self.created_at.isoformat(),
-            "updated_at": self.updated_at.isoformat()
+            "updated_at": self.updated_at.isoformat(),
+            "next_run_at": self.next_run_at.isoformat() if self.next_run_at else None,
+            "priority": self.priority,
+            "queue": self.queue,
+            "log_path": self.log_path,
+            "exit_code": self.exit_code,
+            "timeout": self.timeout,
+            "cpu_seconds": self.cpu_seconds,
+            "memory_mb": self.memory_mb,
+            "nice": self.nice,
+            "attempt_history": self.attempt_history,
+            "worker_id": self.worker_id,
+            "lease_expires_at": self.lease_expires_at.isoformat() if self.lease_expires_at else None
         }
     
+    def to_record(self):
+        """Compact storage form: epoch-second timestamps, unset fields left out"""
+        record = {"id": self.id, "state": self.state.value}
+        for name in _RECORD_FIELDS:
+            value = getattr(self, name)
+            if value is not None and value != "" and value != [] and value != {}:
+                record[name] = value
+        for name in _TIMESTAMP_FIELDS:
+            value = getattr(self, f'_{name}')
+            if value is not None:
+                record[name] = value
+        return record
+    
     @classmethod
     def from_dict(cls, data):
-        if 'created_at' in data and isinstance(data['created_at'], str):
-            data['created_at'] = datetime.fromisoformat(data['created_at'])
-        if 'updated_at' in data and isinstance(data['updated_at'], str):
-            data['updated_at'] = datetime.fromisoformat(data['updated_at'])
+        """Job from `to_dict` output or a `to_record` record"""
         return cls(**data)
     
+    @property
+    def display_command(self):
+        return describe_command({
+            "args": self.args, "template": self.template, "params": self.params,
+            "callable": self.callable, "kwargs": self.kwargs, "command": self.command,
+        })
+    
+    @property
+    def due_at(self):
+        """Earliest time the job may be claimed"""
+        return self.next_run_at or self.created_at
+    
+    @property
+    def due_ts(self):
+        """`due_at` as epoch seconds"""
+        return self._next_run_at or self._created_at
+    
+    def is_due(self, now=None):
+        return self.due_ts <= (now.timestamp() if now else time.time())
+    
+    def record_attempt(self, started_at, duration, exit_code, cpu_seconds=None, max_rss_kb=None):
+        """Keep timing and resource usage of the attempt that just ran"""
+        self.exit_code = exit_code
+        self.attempt_history.append({
+            "attempt": self.attempts,
+            "started_at": started_at.isoformat(),
+            "duration": round(duration, 3),
+            "cpu_seconds": round(cpu_seconds, 3) if cpu_seconds is not None else None,
+            "max_rss_kb": max_rss_kb,
+            "exit_code": exit_code,
+        })
+        del self.attempt_history[:-HISTORY_LIMIT]
+    
     def increment_attempt(self):
         self.attempts += 1
-        self.updated_at = datetime.now()
+        self._updated_at = time.time()
+    
+    def mark_pending(self):
+        self.state = JobState.PENDING
+        self._updated_at = time.time()
     
-    def mark_processing(self):
+    def mark_processing(self, worker_id=None, lease_expires_at=None):
         self.state = JobState.PROCESSING
-        self.updated_at = datetime.now()
+        self._updated_at = time.time()
+        self.worker_id = worker_id
+        self.lease_expires_at = lease_expires_at
+    
+    def clear_lease(self):
+        self.worker_id = None
+        self._lease_expires_at = None
     
     def mark_completed(self):
         self.state = JobState.COMPLETED
-        self.updated_at = datetime.now()
+        self._updated_at = time.time()
     
     def mark_failed(self):
         self.state = JobState.FAILED
-        self.updated_at = datetime.now()
+        self._updated_at = time.time()
+    
+    def schedule_retry(self, delay):
+        """Put the job back in the queue, claimable after `delay` seconds"""
+        self.state = JobState.PENDING
+        self._updated_at = time.time()
+        self._next_run_at = self._updated_at + delay
     
     def mark_dead(self):
         self.state = JobState.DEAD
-        self.updated_at = datetime.now()
+        self._updated_at = time.time()
     
     def should_retry(self):
         return self.attempts < self.max_retries
@@ -0,0 +1,124 @@
+import gzip
+import os
+import shutil
+from collections import deque
+from pathlib import Path
+from urllib.parse import quote
+from .config import get_config
+
+def job_log_path(job) -> Path:
+    """Where the current attempt of a job writes its output"""
+    from .storage import queue_data_dir  # Imported lazily: storage imports job models
+    log_dir = queue_data_dir(job.queue) / "logs"
+    log_dir.mkdir(exist_ok=True)
+    # Percent-encoding keeps plain ids as they are and gives every id its own
+    # name: '/' cannot escape the log dir, and 'a/b', 'a:b' and 'a_b' differ
+    return log_dir / f"{quote(job.id, safe='')}.log"
+
+class JobLogWriter:
+    """Stream a job's output to disk, keeping at most `max_bytes` of it
+
+    The first half of the budget goes straight into the log file. After
+    that, output goes to a `.tail` file which is rotated to `.tail.1` each
+    time it fills the other half, so the newest output is always on disk
+    and memory use is one chunk. `close()` appends a truncation marker and
+    the last half-budget of output to the head, then optionally gzips it.
+    """
+
+    def __init__(self, path: Path, max_bytes=0, compress=False):
+        self.path = Path(path)
+        self.tail_path = self.path.with_name(self.path.name + ".tail")
+        self.rotated_path = self.path.with_name(self.path.name + ".tail.1")
+        self.compress = compress
+        self.head_limit = max_bytes // 2 if max_bytes else None
+        self.tail_limit = max_bytes - max_bytes // 2 if max_bytes else None
+        self.written = 0
+        self.tail_written = 0
+        self.rotated_size = 0
+
+        # Each attempt starts a fresh log
+        for stale in (self.path.with_name(self.path.name + ".gz"), self.tail_path, self.rotated_path):
+            if stale.exists():
+                stale.unlink()
+        self._file = open(self.path, 'wb')
+        self._tail = None
+
+    def write(self, data: bytes):
+        if not data:
+            return
+        self.written += len(data)
+        if self.head_limit is None:
+            self._file.write(data)
+            self._file.flush()
+            return
+
+        head_room = self.head_limit - self._file.tell()
+        if head_room > 0:
+            self._file.write(data[:head_room])
+            self._file.flush()
+            data = data[head_room:]
+        while data:
+            if self._tail is None or self.tail_written >= self.tail_limit:
+                self._rotate_tail()
+            chunk = data[:self.tail_limit - self.tail_written]
+            self._tail.write(chunk)
+            self._tail.flush()
+            self.tail_written += len(chunk)
+            data = data[len(chunk):]
+
+    def _rotate_tail(self):
+        if self._tail is not None:
+            self._tail.close()
+            os.replace(self.tail_path, self.rotated_path)
+            self.rotated_size = self.tail_written
+        self._tail = open(self.tail_path, 'wb')
+        self.tail_written = 0
+
+    def copy_from(self, stream, chunk_size=65536):
+        """Write everything readable from a binary stream until EOF"""
+        for chunk in iter(lambda: stream.read(chunk_size), b''):
+            self.write(chunk)
+
+    def close(self) -> Path:
+        """Finish the log and return its final path"""
+        if self._tail is not None:
+            self._tail.close()
+            kept = self.tail_limit
+            dropped = self.written - self._file.tell() - kept
+            if dropped > 0:
+                self._file.write(f"\n[... {dropped} bytes truncated ...]\n".encode())
+            # The newest `kept` bytes span the end of .tail.1 and all of .tail
+            from_rotated = max(0, kept - self.tail_written)
+            if from_rotated and self.rotated_path.exists():
+                with open(self.rotated_path, 'rb') as f:
+                    f.seek(max(0, self.rotated_size - from_rotated))
+                    shutil.copyfileobj(f, self._file)
+            with open(self.tail_path, 'rb') as f:
+                shutil.copyfileobj(f, self._file)
+            for path in (self.tail_path, self.rotated_path):
+                if path.exists():
+                    path.unlink()
+        self._file.close()
+
+        if not self.compress:
+            return self.path
+        gz_path = self.path.with_name(self.path.name + ".gz")
+        with open(self.path, 'rb') as src, gzip.open(gz_path, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        self.path.unlink()
+        return gz_path
+
+def open_log_writer(job) -> JobLogWriter:
+    """Log writer for a job's next attempt, using the configured cap"""
+    config = get_config()
+    return JobLogWriter(job_log_path(job), config.get("log_max_bytes", 0), config.get("log_compress", False))
+
+def read_log(path, tail_lines=None):
+    """Yield a finished or running log in chunks, or only its last lines"""
+    path = Path(path)
+    opener = gzip.open if path.suffix == ".gz" else open
+    with opener(path, 'rb') as f:
+        if tail_lines is None:
+            yield from iter(lambda: f.read(65536), b'')
+        else:
+            yield b''.join(deque(f, maxlen=tail_lines))
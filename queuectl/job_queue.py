@@ -1,43 +1,407 @@
-from typing import List, Optional
-from .storage.job_storage import JobStorage
-from .job import Job, JobState
+import heapq
+import random
+from collections import defaultdict
+from datetime import datetime
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional, Tuple
+from .storage import get_storage, queue_data_dir, queue_names, validate_queue_name
+from .storage.archive import JobArchive
+from .storage.id_index import JobIdIndex
+from .storage.base import FINISHED_STATES, job_matches, lease_expiry, sort_key
+from .job import DEFAULT_QUEUE, Job, JobState, to_epoch, to_local
 from .config import get_config
+from .callable_pool import validate_callable
+from .limits import validate_limits
+from .schedule import ScheduleStore, first_fire_at
+from .templates import render_template
+from .storage.throttle import release_in_flight, renew_in_flight, validate_tag
+from .wakeup import notify_workers
+
+# `list --sort` names and the job fields they order by
+SORT_OPTIONS = {'created': 'created_at', 'updated': 'updated_at'}
+
+def parse_queue_spec(spec: str) -> List[tuple]:
+    """Parse `name[:weight],...` into (queue, weight) pairs"""
+    queues = []
+    for part in spec.split(','):
+        name, _, weight = part.strip().partition(':')
+        try:
+            weight = int(weight) if weight else 1
+        except ValueError:
+            raise ValueError(f"Invalid weight for queue {name}: {weight}")
+        if weight < 1:
+            raise ValueError(f"Queue weight must be at least 1: {part.strip()}")
+        queues.append((validate_queue_name(name), weight))
+    return queues
 
 class JobQueue:
-    def __init__(self):
-        self.storage = JobStorage()
+    """Jobs partitioned into named queues, each with its own storage
+
+    `queues` lists the (name, weight) pairs that claims and backlog samples
+    draw from; every other operation routes by the job's queue or spans
+    all queues.
+    """
+
+    def __init__(self, queues=None):
+        self.queues = queues or [(DEFAULT_QUEUE, 1)]
+        self._storages = {}
+        self.storage = self.storage_for(DEFAULT_QUEUE)
+        self.id_index = JobIdIndex()
     
-    def enqueue(self, job_data: dict) -> Job:
-        """Add a job to the queue"""
+    def storage_for(self, queue: str):
+        """Storage holding one queue's jobs"""
+        if queue not in self._storages:
+            self._storages[queue] = get_storage(queue=queue)
+        return self._storages[queue]
+    
+    def _storages_for(self, queue=None):
+        names = [queue] if queue else queue_names()
+        return [self.storage_for(name) for name in names]
+    
+    def _claim_order(self) -> List[str]:
+        """Queues to claim from: one picked by weight, then the rest by weight"""
+        if len(self.queues) == 1:
+            return [self.queues[0][0]]
+        names = [name for name, _ in self.queues]
+        first = random.choices(names, weights=[weight for _, weight in self.queues])[0]
+        rest = sorted((q for q in self.queues if q[0] != first), key=lambda q: -q[1])
+        return [first] + [name for name, _ in rest]
+    
+    def _build_job(self, job_data: dict) -> Job:
+        """Validate a job definition and apply configured defaults"""
+        if not isinstance(job_data, dict):
+            raise ValueError("Job definition must be a JSON object")
+        given = [key for key in ('command', 'args', 'template', 'callable') if job_data.get(key)]
+        if not given:
+            raise ValueError("Job definition requires a 'command', 'args', 'template' or 'callable'")
+        if len(given) > 1:
+            raise ValueError(f"Job definition takes only one of {', '.join(repr(key) for key in given)}")
+        args = job_data.get('args')
+        if args is not None and (not isinstance(args, list) or not all(isinstance(arg, str) for arg in args)):
+            raise ValueError("'args' must be a list of strings")
+        if job_data.get('template'):
+            params = job_data.get('params') or {}
+            if not isinstance(params, dict):
+                raise ValueError("'params' must be a JSON object")
+            render_template(job_data['template'], params)  # Unknown template or missing parameter
+        if job_data.get('callable'):
+            validate_callable(job_data)
+        priority = job_data.get('priority', 0)
+        if not isinstance(priority, int) or isinstance(priority, bool):
+            raise ValueError("'priority' must be an integer")
+        validate_queue_name(job_data.get('queue', DEFAULT_QUEUE))
+        validate_limits(job_data)
+        depends_on = job_data.get('depends_on')
+        if depends_on is not None:
+            if not isinstance(depends_on, list) or not all(isinstance(dep, str) and dep for dep in depends_on):
+                raise ValueError("'depends_on' must be a list of job IDs")
+            job_data['depends_on'] = list(dict.fromkeys(depends_on))
+        dedupe_key = job_data.get('dedupe_key')
+        if dedupe_key is not None and (not isinstance(dedupe_key, str) or not dedupe_key):
+            raise ValueError("'dedupe_key' must be a non-empty string")
+        if job_data.get('tag') is not None:
+            validate_tag(job_data['tag'])
+        if job_data.get('schedule') is not None and dedupe_key is not None:
+            raise ValueError("'dedupe_key' cannot be combined with 'schedule'; each run gets its own ID")
+        
         config = get_config()
         if 'max_retries' not in job_data:
             job_data['max_retries'] = config.get('max_retries', 3)
         
         job = Job(**job_data)
         job.state = JobState.PENDING
-        self.storage.add_job(job)
         return job
     
+    def _owned_job(self, job_id: str, queue: str) -> Optional[Job]:
+        """The job holding an ID in `queue`, stored or archived"""
+        return self.storage_for(queue).get_job(job_id) or JobArchive(queue_data_dir(queue)).find([job_id]).get(job_id)
+    
+    def _add_jobs(self, queue: str, jobs: List[Job]) -> List[Optional[Job]]:
+        """Store jobs in one queue; returns, per job, None if it was stored or the job it duplicates
+
+        IDs are unique across queues so that id-based commands (get_job,
+        logs, dlq retry, graph) always find the one job meant. The ID index
+        answers for other queues and archives, and stays locked until the
+        new IDs are recorded; the queue's own storage checks the rest.
+        """
+        results = [None] * len(jobs)
+        with self.id_index.transaction():
+            owners = self.id_index.owners(job.id for job in jobs)
+            own = [index for index, job in enumerate(jobs) if owners.get(job.id, queue) == queue]
+            if own:
+                for index, existing in zip(own, self.storage_for(queue).add_jobs([jobs[index] for index in own])):
+                    results[index] = existing
+            self.id_index.record([jobs[index].id for index in own if results[index] is None], queue)
+        for index, job in enumerate(jobs):
+            if owners.get(job.id, queue) != queue:
+                results[index] = self._owned_job(job.id, owners[job.id]) or job
+        return results
+    
+    def enqueue(self, job_data: dict) -> Job:
+        """Add a job to the queue; a duplicate returns the job already there"""
+        return self.get_or_enqueue(job_data)[0]
+    
+    def _schedule(self, entries: List[tuple]) -> List[Optional[Job]]:
+        """Park (job, job_data, fire_at) entries in the schedule store until they are due
+
+        Returns, for each entry, None if it was scheduled or the job it
+        duplicates: a job with its id in any queue or with its dedupe_key in
+        its own, or the entry's own job if its id is already scheduled.
+        """
+        results = [None] * len(entries)
+        owners = self.id_index.owners(job.id for job, _, _ in entries)
+        by_queue = defaultdict(list)
+        for index, (job, _, _) in enumerate(entries):
+            if owners.get(job.id, job.queue) != job.queue:
+                results[index] = self._owned_job(job.id, owners[job.id]) or job
+            else:
+                by_queue[job.queue].append(index)
+        for queue, indexes in by_queue.items():
+            found = self.storage_for(queue).find_duplicates([entries[index][0] for index in indexes])
+            for index, existing in zip(indexes, found):
+                results[index] = existing
+        fresh = [index for index, existing in enumerate(results) if existing is None]
+        added = ScheduleStore().add([
+            (job.id, fire_at, job_data.get('schedule'),
+             {**{key: value for key, value in job_data.items() if key not in ('run_at', 'schedule')}, 'id': job.id})
+            for job, job_data, fire_at in (entries[index] for index in fresh)
+        ])
+        for index, ok in zip(fresh, added):
+            if not ok:
+                results[index] = entries[index][0]
+        return results
+    
+    def get_or_enqueue(self, job_data: dict) -> Tuple[Job, bool]:
+        """Add a job unless its id or dedupe_key is taken; returns (job, created)
+
+        A job with a future `run_at` or a `schedule` goes to the schedule
+        store instead; the returned job then has `next_run_at` set to when
+        it first runs.
+        """
+        job = self._build_job(job_data)
+        fire_at = first_fire_at(job_data)
+        if fire_at is not None:
+            job.next_run_at = fire_at
+            existing = self._schedule([(job, job_data, fire_at)])[0]
+            return existing or job, existing is None
+        existing = self._add_jobs(job.queue, [job])[0]
+        if existing:
+            return existing, False
+        notify_workers()
+        return job, True
+    
+    def enqueue_many(self, job_definitions: Iterable[dict], chunk_size: Optional[int] = None) -> int:
+        """Add jobs from any iterable, writing to storage once per chunk
+
+        Returns how many were added; duplicates are skipped.
+        """
+        chunk_size = chunk_size or get_config().get('enqueue_chunk_size', 1000)
+        count = 0
+        pending = 0
+        chunks = defaultdict(list)  # queue name -> jobs waiting to be written
+        scheduled = []
+        
+        def flush():
+            added = self._schedule(scheduled).count(None) if scheduled else 0
+            for queue, jobs in chunks.items():
+                added += self._add_jobs(queue, jobs).count(None)
+            chunks.clear()
+            scheduled.clear()
+            return added
+        
+        for index, job_data in enumerate(job_definitions, 1):
+            try:
+                job = self._build_job(job_data)
+                fire_at = first_fire_at(job_data)
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"Job #{index}: {e}")
+            if fire_at is not None:
+                scheduled.append((job, job_data, fire_at))
+            else:
+                chunks[job.queue].append(job)
+            pending += 1
+            if pending >= chunk_size:
+                count += flush()
+                pending = 0
+        if pending:
+            count += flush()
+        if count:
+            notify_workers()
+        return count
+    
     def get_next_job(self) -> Optional[Job]:
         """Get the next available job to process"""
-        return self.storage.get_next_pending_job()
+        jobs = self.claim_batch(1)
+        return jobs[0] if jobs else None
+    
+    def claim_batch(self, limit: int, worker_id: Optional[str] = None) -> List[Job]:
+        """Lease up to `limit` jobs to `worker_id`, one storage operation per queue tried"""
+        if limit < 1:
+            return []
+        claimed = []
+        for queue in self._claim_order():
+            claimed.extend(self.storage_for(queue).claim_batch(limit - len(claimed), worker_id))
+            if len(claimed) >= limit:
+                break
+        return claimed
+    
+    def release_jobs(self, jobs: List[Job], worker_id: Optional[str] = None) -> int:
+        """Return leased jobs that were never started to the queue; returns how many were
+
+        With `worker_id`, only jobs whose lease that worker still holds go back.
+        """
+        by_queue = defaultdict(list)
+        for job in jobs:
+            by_queue[job.queue].append(job)
+        released = [job_id for queue, queue_jobs in by_queue.items()
+                    for job_id in self.storage_for(queue).release_jobs(queue_jobs, worker_id)]
+        if released:
+            release_in_flight(released)
+            notify_workers()
+        return len(released)
     
-    def update_job(self, job: Job):
-        """Update job status"""
-        self.storage.update_job(job)
+    def renew_leases(self, jobs: List[Job], worker_id: Optional[str]) -> int:
+        """Extend the leases `worker_id` holds; returns how many it still held"""
+        by_queue = defaultdict(list)
+        for job in jobs:
+            by_queue[job.queue].append(job.id)
+        renew_in_flight([job.id for job in jobs], to_epoch(lease_expiry()))
+        return sum(self.storage_for(queue).renew_leases(job_ids, worker_id)
+                   for queue, job_ids in by_queue.items())
+    
+    def reap_expired_leases(self) -> List[Job]:
+        """Requeue (or fail) jobs whose worker stopped renewing their lease, in every queue"""
+        reaped = [job for name in queue_names() for job in self.storage_for(name).reap_expired_leases()]
+        release_in_flight([job.id for job in reaped])
+        if any(job.state == JobState.PENDING for job in reaped):
+            notify_workers()
+        return reaped
+    
+    def update_job(self, job: Job, worker_id: Optional[str] = None) -> bool:
+        """Update job status; with `worker_id`, only while that worker still holds the job's lease"""
+        if not self.storage_for(job.queue).update_job(job, worker_id):
+            return False  # The slot now belongs to whoever holds the job
+        # A finished job frees its in-flight slot, which may admit a waiting job
+        freed = job.state != JobState.PROCESSING and release_in_flight([job.id])
+        if freed or (job.state == JobState.PENDING and job.is_due()):
+            notify_workers()
+        return True
     
     def get_job(self, job_id: str) -> Optional[Job]:
-        """Get a job by ID"""
-        return self.storage.get_job(job_id)
+        """Get a job by ID from whichever queue holds it"""
+        for storage in self._storages_for():
+            job = storage.get_job(job_id)
+            if job:
+                return job
+        return None
+    
+    def get_dependents(self, job: Job) -> List[Job]:
+        """Jobs waiting on `job`, found through the storage's reverse-dependency index"""
+        storage = self.storage_for(job.queue)
+        return [child for child in map(storage.get_job, storage.get_dependents(job.id)) if child]
+    
+    def get_jobs_by_state(self, state: JobState, queue: Optional[str] = None) -> List[Job]:
+        """Get jobs by state, from one queue or all of them"""
+        return [job for storage in self._storages_for(queue) for job in storage.get_jobs_by_state(state)]
+    
+    def get_all_jobs(self, queue: Optional[str] = None) -> List[Job]:
+        """Get all jobs, from one queue or all of them"""
+        return [job for storage in self._storages_for(queue) for job in storage.get_all_jobs()]
     
-    def get_jobs_by_state(self, state: JobState) -> List[Job]:
-        """Get jobs by state"""
-        return self.storage.get_jobs_by_state(state)
+    def iter_jobs(self, state: Optional[JobState] = None, queue: Optional[str] = None,
+                  since=None, until=None, command_contains=None, sort='created',
+                  descending=False, offset=0, limit=None, include_archive=True) -> Iterator[Job]:
+        """Stream one page of matching jobs from one queue or all of them
+
+        Filters and the page size go down to each queue's storage, and the
+        per-queue streams, plus each queue's archive in the same order, are
+        merged by the sort key.
+        """
+        field = SORT_OPTIONS.get(sort)
+        if not field:
+            raise ValueError(f"Invalid sort: {sort} (valid: {', '.join(SORT_OPTIONS)})")
+        wanted = None if limit is None else offset + limit
+        names = [queue] if queue else queue_names()
+        since, until = to_local(since), to_local(until)
+        
+        # Positional arguments so the call also works through the daemon proxy
+        streams = [self.storage_for(name).iter_jobs(state, since, until, command_contains, field, descending, wanted)
+                   for name in names]
+        if include_archive and (state is None or state in FINISHED_STATES):
+            keep = lambda job: job_matches(job, since, until, command_contains)
+            streams += [JobArchive(queue_data_dir(name)).iter_sorted(field, state, descending, keep)
+                        for name in names]
+        return islice(heapq.merge(*streams, key=sort_key(field), reverse=descending), offset, wanted)
+    
+    def collect_garbage(self, now=None) -> dict:
+        """Move expired finished jobs into each queue's archive; returns counts by queue"""
+        now = now or datetime.now()
+        return {name: self._archive_expired(name, now) for name in queue_names()}
+    
+    def _archive_expired(self, queue: str, now) -> int:
+        config = get_config()
+        storage = self.storage_for(queue)
+        ttls = {
+            JobState.COMPLETED: config.get('completed_ttl', 86400),
+            JobState.DEAD: config.get('dead_ttl', 604800),
+        }
+        finished = [job for state in FINISHED_STATES for job in storage.get_jobs_by_state(state)]
+        expired = [job for job in finished
+                   if ttls[job.state] >= 0 and (now - job.updated_at).total_seconds() >= ttls[job.state]]
+        
+        # Past the TTLs, keep the hot set under max_hot_jobs by archiving
+        # the oldest finished jobs; pending and running jobs are never moved
+        max_hot = config.get('max_hot_jobs', 0)
+        if max_hot:
+            excess = sum(storage.get_job_stats().values()) - len(expired) - max_hot
+            if excess > 0:
+                expired_ids = {job.id for job in expired}
+                remaining = sorted((job for job in finished if job.id not in expired_ids),
+                                   key=lambda job: job.updated_at)
+                expired.extend(remaining[:excess])
+        if not expired:
+            return 0
+        
+        # Archive first: a crash in between leaves a duplicate, never a lost job
+        JobArchive(queue_data_dir(queue)).append(expired)
+        return storage.remove_jobs([job.id for job in expired])
+    
+    def get_queue_stats(self) -> dict:
+        """Get job statistics for each queue"""
+        return {name: self.storage_for(name).get_job_stats() for name in queue_names()}
+    
+    def verify_stats(self, repair=False) -> dict:
+        """Recount every queue from scratch; returns {queue: {state: (counter, actual)}} for drifted counters
+
+        The counters are only reset to the recount with `repair`.
+        """
+        drift = {}
+        for name in queue_names():
+            storage = self.storage_for(name)
+            counters = storage.get_job_stats()
+            actual = storage.count_job_states()
+            wrong = {state: (counters.get(state, 0), count)
+                     for state, count in actual.items() if counters.get(state, 0) != count}
+            if wrong:
+                drift[name] = wrong
+                if repair:
+                    storage.recount_job_stats()
+        return drift
     
-    def get_all_jobs(self) -> List[Job]:
-        """Get all jobs"""
-        return self.storage.get_all_jobs()
+    def get_stats(self, queue: Optional[str] = None) -> dict:
+        """Get job statistics, for one queue or summed over all of them"""
+        stats = {state.value: 0 for state in JobState}
+        for storage in self._storages_for(queue):
+            for state, count in storage.get_job_stats().items():
+                stats[state] += count
+        return stats
     
-    def get_stats(self) -> dict:
-        """Get queue statistics"""
-        return self.storage.get_job_stats()
+    def get_backlog(self) -> dict:
+        """Get the number of due pending jobs and the oldest due time across claimed queues"""
+        pending, oldest = 0, None
+        for queue, _ in self.queues:
+            backlog = self.storage_for(queue).get_backlog()
+            pending += backlog["pending"]
+            if backlog["oldest_due_at"] and (oldest is None or backlog["oldest_due_at"] < oldest):
+                oldest = backlog["oldest_due_at"]
+        return {"pending": pending, "oldest_due_at": oldest}
@@ -0,0 +1,65 @@
+import os
+import socket
+import threading
+from .config import get_config
+from .job import JobState
+from .job_queue import JobQueue
+
+class LeaseKeeper:
+    """Heartbeat thread for the jobs a worker has claimed
+
+    Claims lease a job to the worker for `lease_timeout` seconds. Three
+    times per lease period the keeper renews the leases of every job the
+    worker holds, then reaps expired leases left behind by workers that
+    died mid-job, so their jobs run again without anyone intervening.
+    """
+
+    def __init__(self, queues=None):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.queues = queues
+        self.interval = get_config().get("lease_timeout", 60) / 3
+        self._held = {}  # job id -> Job
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def hold(self, jobs):
+        with self._lock:
+            for job in jobs:
+                self._held[job.id] = job
+
+    def drop(self, job):
+        with self._lock:
+            self._held.pop(job.id, None)
+
+    def start(self):
+        if self.interval > 0:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        # Storage objects are not thread-safe, so the keeper has its own
+        queue = JobQueue(self.queues)
+        while not self._stopped.is_set():
+            try:
+                self.beat(queue)
+            except Exception as e:
+                print(f"Lease heartbeat failed: {e}")
+            self._stopped.wait(self.interval)
+
+    def beat(self, queue):
+        """Renew held leases, then reap expired ones"""
+        with self._lock:
+            held = list(self._held.values())
+        if held:
+            queue.renew_leases(held, self.worker_id)
+        for job in queue.reap_expired_leases():
+            if job.state == JobState.DEAD:
+                print(f"☠ Job {job.id} lease expired, moved to DLQ after {job.attempts} attempts")
+            else:
+                print(f"⟳ Job {job.id} lease expired (attempt {job.attempts}/{job.max_retries}), requeued")
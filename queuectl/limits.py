@@ -0,0 +1,93 @@
+import math
+from contextlib import contextmanager
+from typing import Optional
+from .config import get_config
+
+try:
+    import resource
+except ImportError:  # Windows: only the timeout is enforced
+    resource = None
+
+# Job field -> config key holding its default; 0 means no limit
+LIMIT_DEFAULTS = {
+    'timeout': 'job_timeout',
+    'cpu_seconds': 'job_cpu_seconds',
+    'memory_mb': 'job_memory_mb',
+    'nice': 'job_nice',
+}
+
+def resolve_limits(job) -> dict:
+    """The job's own limits, falling back to the configured defaults"""
+    config = get_config()
+    limits = {}
+    for field, key in LIMIT_DEFAULTS.items():
+        value = getattr(job, field, None)
+        limits[field] = value if value is not None else config.get(key, 0)
+    return limits
+
+def validate_limits(job_data: dict):
+    """Reject limit fields that are not positive numbers (nice: -20..19)"""
+    for field in ('timeout', 'cpu_seconds', 'memory_mb'):
+        value = job_data.get(field)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0):
+            raise ValueError(f"'{field}' must be a positive number")
+    nice = job_data.get('nice')
+    if nice is not None and (isinstance(nice, bool) or not isinstance(nice, int) or not -20 <= nice <= 19):
+        raise ValueError("'nice' must be an integer from -20 to 19")
+
+def limit_argv(argv: list, limits: dict) -> Optional[list]:
+    """`argv` behind a /bin/sh prologue applying CPU, memory and priority limits, or None without limits
+
+    The wrapper shell sets the limits and execs the job. A preexec_fn would
+    run Python in the child of a threaded worker (lease keeper, log readers),
+    where a lock held by another thread at fork time can deadlock it. rlimits
+    survive exec and are inherited, so every process the job starts gets the
+    same CPU and address-space budget.
+    """
+    cpu, memory, nice = limits['cpu_seconds'], limits['memory_mb'], limits['nice']
+    if resource is None or not (cpu or memory or nice):
+        return None
+    steps = []
+    if cpu:
+        seconds = max(1, math.ceil(cpu))
+        # SIGXCPU at the soft limit, SIGKILL a second later
+        steps += [f"ulimit -S -t {seconds}", f"ulimit -H -t {seconds + 1}"]
+    if memory:
+        steps.append(f"ulimit -v {int(memory * 1024)}")
+    run = f'exec nice -n {nice} "$@"' if nice else 'exec "$@"'
+    script = f"{' && '.join(steps)} || exit 126\n{run}" if steps else run
+    return ['/bin/sh', '-c', script, 'sh', *argv]
+
+class CPULimitExceeded(BaseException):
+    """Raised in a callable job that used up its `cpu_seconds`"""
+
+@contextmanager
+def soft_limits(cpu, memory):
+    """Apply CPU and memory limits to the current process for one job, then lift them
+
+    For callable jobs, which share long-lived pool processes. Only soft
+    limits are lowered, so they can be raised again for the next job: the
+    CPU budget counts from the process's usage so far and signals SIGXCPU
+    (see CPULimitExceeded), and the address-space limit makes allocations
+    fail with MemoryError. Memory covers the whole pool process, interpreter
+    and preloaded modules included.
+    """
+    if resource is None or not (cpu or memory):
+        yield
+        return
+    wanted = []
+    if cpu:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        wanted.append((resource.RLIMIT_CPU, math.ceil(usage.ru_utime + usage.ru_stime + cpu)))
+    if memory:
+        wanted.append((resource.RLIMIT_AS, int(memory * 1024 * 1024)))
+    saved = []
+    try:
+        for limit, soft in wanted:
+            old_soft, hard = resource.getrlimit(limit)
+            saved.append((limit, old_soft, hard))
+            resource.setrlimit(limit, (soft if hard == resource.RLIM_INFINITY else min(soft, hard), hard))
+        yield
+    finally:
+        for limit, old_soft, hard in saved:
+            resource.setrlimit(limit, (old_soft, hard))
@@ -0,0 +1,222 @@
+import json
+import math
+import os
+import sqlite3
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional
+from .config import get_config
+from .job import to_epoch
+
+# Shorthands accepted in place of a five-field expression
+_MACROS = {
+    '@hourly': '0 * * * *',
+    '@daily': '0 0 * * *',
+    '@midnight': '0 0 * * *',
+    '@weekly': '0 0 * * 0',
+    '@monthly': '0 0 1 * *',
+    '@yearly': '0 0 1 1 *',
+    '@annually': '0 0 1 1 *',
+}
+
+# (name, lowest, highest) of each cron field, in expression order
+_FIELDS = (('minute', 0, 59), ('hour', 0, 23), ('day', 1, 31), ('month', 1, 12), ('weekday', 0, 7))
+
+# How far ahead to look before deciding an expression never fires (e.g. "0 0 30 2 *")
+_HORIZON_YEARS = 5
+
+def _parse_field(text, name, low, high) -> set:
+    values = set()
+    for part in text.split(','):
+        span, _, step = part.partition('/')
+        try:
+            step = int(step) if step else 1
+            if span == '*':
+                start, end = low, high
+            else:
+                start, _, end = span.partition('-')
+                start = int(start)
+                end = int(end) if end else (high if step > 1 else start)
+        except ValueError:
+            raise ValueError(f"Invalid {name} field '{text}'")
+        if step < 1 or not low <= start <= end <= high:
+            raise ValueError(f"Invalid {name} field '{text}' (allowed {low}-{high})")
+        values.update(range(start, end + 1, step))
+    return values
+
+class CronSchedule:
+    """A standard five-field cron expression, matched against local time
+
+    Fields are minute, hour, day of month, month and day of week (0 or 7 is
+    Sunday), each taking `*`, numbers, `a-b` ranges, `/step` and lists. As in
+    cron, a job fires when the day of month or the day of week matches if
+    both are restricted.
+    """
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        fields = _MACROS.get(expression.strip(), expression).split()
+        if len(fields) != 5:
+            raise ValueError(f"Invalid schedule '{expression}': expected 5 fields or @hourly/@daily/...")
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            _parse_field(text, *field) for text, field in zip(fields, _FIELDS)
+        )
+        self.weekdays = {day % 7 for day in weekdays}
+        self.any_day, self.any_weekday = fields[2] == '*', fields[4] == '*'
+
+    def _day_matches(self, t: datetime) -> bool:
+        in_month = t.day in self.days
+        in_week = (t.weekday() + 1) % 7 in self.weekdays  # Python counts from Monday
+        if self.any_day or self.any_weekday:
+            return in_month and in_week
+        return in_month or in_week
+
+    def next_after(self, ts: float) -> float:
+        """Epoch seconds of the first matching minute after `ts`"""
+        t = datetime.fromtimestamp(ts).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        last_year = t.year + _HORIZON_YEARS
+        # Skip whole months, days and hours that cannot match before stepping minutes
+        while t.year <= last_year:
+            if t.month not in self.months:
+                t = (t.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(t):
+                t = t.replace(hour=0, minute=0) + timedelta(days=1)
+            elif t.hour not in self.hours:
+                t = t.replace(minute=0) + timedelta(hours=1)
+            elif t.minute not in self.minutes:
+                t += timedelta(minutes=1)
+            else:
+                return t.timestamp()
+        raise ValueError(f"Schedule '{self.expression}' never fires")
+
+def first_fire_at(job_data: dict, now: Optional[float] = None) -> Optional[float]:
+    """When a job definition with `run_at` / `schedule` first fires; None to run it now
+
+    With both, the schedule starts at `run_at`.
+    """
+    run_at, schedule = job_data.get('run_at'), job_data.get('schedule')
+    if run_at is None and schedule is None:
+        return None
+    now = now or time.time()
+    if run_at is not None:
+        # to_epoch takes any number, and True would read as 1970-01-01
+        if isinstance(run_at, bool) or not isinstance(run_at, (int, float, str)):
+            run_at = None
+        else:
+            try:
+                run_at = to_epoch(run_at)
+            except (OverflowError, ValueError):
+                run_at = None
+        if run_at is None or not math.isfinite(run_at):
+            raise ValueError("'run_at' must be an ISO 8601 time or epoch seconds")
+    if schedule is None:
+        return run_at if run_at > now else None
+    if not isinstance(schedule, str):
+        raise ValueError("'schedule' must be a cron expression string")
+    # A millisecond back, so a run_at exactly on a matching minute fires then
+    start = max(run_at, now) - 0.001 if run_at is not None else now
+    return CronSchedule(schedule).next_after(start)
+
+class ScheduleStore:
+    """Future and recurring jobs, kept out of the queues until they are due
+
+    Entries live in `schedule.db` in the data dir, whatever the storage
+    backend. The index on `fire_at` acts as a persistent min-heap: finding
+    what is due costs the same however many jobs are scheduled, and the
+    queues' claim paths never see them.
+    """
+
+    def __init__(self, data_dir=None):
+        self.db_file = (data_dir or get_config().get_data_dir()) / "schedule.db"
+        self._conn = None
+        self._conn_pid = None
+
+    def exists(self) -> bool:
+        return self.db_file.exists()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None or self._conn_pid != os.getpid():
+            conn = sqlite3.connect(str(self.db_file), timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS schedule (
+                    id TEXT PRIMARY KEY,
+                    fire_at REAL NOT NULL,
+                    cron TEXT,
+                    job TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_schedule_fire ON schedule (fire_at);
+            """)
+            self._conn, self._conn_pid = conn, os.getpid()
+        return self._conn
+
+    def add(self, entries: List[tuple]) -> List[bool]:
+        """Store (id, fire_at, cron, job_data) entries; False for ids already scheduled"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            added = [
+                conn.execute(
+                    "INSERT OR IGNORE INTO schedule (id, fire_at, cron, job) VALUES (?, ?, ?, ?)",
+                    (job_id, fire_at, cron, json.dumps(job_data, separators=(',', ':'))),
+                ).rowcount == 1
+                for job_id, fire_at, cron, job_data in entries
+            ]
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return added
+
+    def remove(self, job_id: str) -> bool:
+        if not self.exists():
+            return False
+        return self._connect().execute("DELETE FROM schedule WHERE id = ?", (job_id,)).rowcount == 1
+
+    def entries(self) -> List[dict]:
+        """Every scheduled entry, soonest first"""
+        if not self.exists():
+            return []
+        rows = self._connect().execute("SELECT id, fire_at, cron, job FROM schedule ORDER BY fire_at")
+        return [{"id": job_id, "fire_at": fire_at, "cron": cron, "job": json.loads(job)}
+                for job_id, fire_at, cron, job in rows]
+
+    def next_fire_at(self) -> Optional[float]:
+        if not self.exists():
+            return None
+        return self._connect().execute("SELECT MIN(fire_at) FROM schedule").fetchone()[0]
+
+    def pop_due(self, now: float, limit: int, enqueue):
+        """Hand up to `limit` due entries to `enqueue`, then advance or delete them
+
+        `enqueue(job_definitions)` runs inside the store's write transaction,
+        so concurrent schedulers never fire an occurrence twice; a crash
+        before the commit fires it again with the same job id, which enqueue
+        deduplicates. Recurring entries advance past `now`, so runs missed
+        while no scheduler was running collapse into one.
+        """
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT id, fire_at, cron, job FROM schedule WHERE fire_at <= ? ORDER BY fire_at LIMIT ?",
+                (now, limit),
+            ).fetchall()
+            definitions = []
+            for job_id, fire_at, cron, job in rows:
+                job_data = json.loads(job)
+                if cron:
+                    job_data['id'] = f"{job_id}-{datetime.fromtimestamp(fire_at):%Y%m%d%H%M}"
+                    conn.execute("UPDATE schedule SET fire_at = ? WHERE id = ?",
+                                 (CronSchedule(cron).next_after(max(fire_at, now)), job_id))
+                else:
+                    conn.execute("DELETE FROM schedule WHERE id = ?", (job_id,))
+                definitions.append(job_data)
+            if definitions:
+                enqueue(definitions)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return definitions
@@ -0,0 +1,51 @@
+import time
+from typing import Optional
+from .job_queue import JobQueue
+from .schedule import ScheduleStore
+
+# Occurrences moved into the queues per store transaction
+_BATCH = 1000
+
+class Scheduler:
+    """Moves scheduled jobs into their queues as they fall due
+
+    Runs inside the process that owns a worker pool (the autoscaling
+    supervisor, or the parent of `worker start`). Several schedulers may
+    share a data dir: each batch is taken under the store's write lock.
+    """
+
+    def __init__(self):
+        self.queue = JobQueue()
+        self.store = ScheduleStore()
+
+    def _enqueue(self, definitions):
+        try:
+            self.queue.enqueue_many(definitions)
+        except ValueError:
+            # One bad definition (e.g. its template was removed) must not
+            # hold back the rest of the batch
+            for job_data in definitions:
+                try:
+                    self.queue.enqueue(job_data)
+                except ValueError as e:
+                    print(f"Scheduled job {job_data.get('id')} skipped: {e}")
+
+    def tick(self, now: Optional[float] = None) -> Optional[float]:
+        """Enqueue every due occurrence; returns seconds until the next one, None if none is scheduled"""
+        if not self.store.exists():
+            return None
+        now = now or time.time()
+        while len(self.store.pop_due(now, _BATCH, self._enqueue)) == _BATCH:
+            pass
+        next_fire_at = self.store.next_fire_at()
+        return max(0.0, next_fire_at - time.time()) if next_fire_at is not None else None
+
+    def run_while(self, alive, poll=0.5):
+        """Tick until `alive()` turns false, sleeping at most `poll` seconds at a time"""
+        while alive():
+            try:
+                wait = self.tick()
+            except Exception as e:
+                print(f"Scheduler tick failed: {e}")
+                wait = None
+            time.sleep(min(poll, wait) if wait is not None else poll)
@@ -1,3 +1,61 @@
+import re
+from ..config import get_config
+from ..job import DEFAULT_QUEUE
+from .base import BaseJobStorage
 from .job_storage import JobStorage
+from .sqlite_storage import SQLiteJobStorage
+from .journal_storage import JournalJobStorage
+from .daemon_storage import DaemonStorage
 
-__all__ = ['JobStorage']
+# Backends selectable through the `storage_backend` config key
+BACKENDS = {
+    'json': JobStorage,
+    'sqlite': SQLiteJobStorage,
+    'journal': JournalJobStorage,
+}
+
+_QUEUE_NAME = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+def validate_queue_name(name) -> str:
+    """Return the queue name, or raise ValueError if it is not a safe directory name"""
+    if not isinstance(name, str) or not _QUEUE_NAME.match(name):
+        raise ValueError(f"Invalid queue name: {name!r} (use letters, digits, '-' and '_')")
+    return name
+
+def queue_data_dir(queue=DEFAULT_QUEUE):
+    """Directory holding a queue's storage files and lock"""
+    data_dir = get_config().get_data_dir()
+    if queue == DEFAULT_QUEUE:
+        return data_dir  # Keeps the pre-queue layout readable
+    path = data_dir / "queues" / validate_queue_name(queue)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+def queue_names() -> list:
+    """Names of every queue with storage on disk, default first"""
+    queues_dir = get_config().get_data_dir() / "queues"
+    names = sorted(p.name for p in queues_dir.iterdir() if p.is_dir()) if queues_dir.exists() else []
+    return [DEFAULT_QUEUE] + [name for name in names if name != DEFAULT_QUEUE]
+
+def get_storage(use_daemon=True, queue=DEFAULT_QUEUE) -> BaseJobStorage:
+    """Create the storage backend selected in the configuration for one queue
+
+    Each queue has its own files and lock, so traffic on one queue never
+    waits on another. When a `queuectl daemon` is running, a proxy that
+    talks to it is returned instead so commands skip loading storage
+    themselves.
+    """
+    validate_queue_name(queue)
+    if use_daemon:
+        daemon = DaemonStorage.try_connect(queue)
+        if daemon:
+            return daemon
+    backend = get_config().get('storage_backend', 'json')
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown storage backend: {backend} (valid: {', '.join(BACKENDS)})")
+    return BACKENDS[backend](queue_data_dir(queue), queue)
+
+__all__ = [
+    'BaseJobStorage', 'JobStorage', 'SQLiteJobStorage', 'JournalJobStorage', 'DaemonStorage',
+    'BACKENDS', 'get_storage', 'queue_data_dir', 'queue_names', 'validate_queue_name',
+]
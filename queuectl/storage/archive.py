@@ -0,0 +1,235 @@
+import gzip
+import hashlib
+import heapq
+import json
+import os
+from collections import defaultdict
+from itertools import chain, count
+from typing import Dict, Iterable, Iterator, List, Optional
+from ..job import Job, JobState, to_epoch
+from .base import SORT_FIELDS, sort_key
+from .locking import exclusive_lock
+
+class _Descending:
+    """Heap entry wrapper that reverses the order of the value it holds"""
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __le__(self, other):
+        return other.value <= self.value
+
+class JobArchive:
+    """Cold storage for finished jobs: compressed, append-only daily segments
+
+    Jobs are grouped by the day they finished into `archive/YYYY-MM-DD.jsonl.gz`.
+    Each append adds a new gzip member to the end of the segment, which
+    gzip readers treat as one continuous stream, so segments are never
+    rewritten. `archive/index.json` keeps the range of each sort field per
+    segment, so sorted reads only open the segments a page can reach, and
+    `archive/ids/` maps job IDs, hashed into buckets, to their segment.
+    """
+
+    def __init__(self, data_dir):
+        self.archive_dir = data_dir / "archive"
+        self.lock_file = data_dir / "archive.lock"
+        self.index_file = self.archive_dir / "index.json"
+        self.ids_dir = self.archive_dir / "ids"
+
+    def segments(self) -> List:
+        """Segment files, oldest day first"""
+        if not self.archive_dir.exists():
+            return []
+        return sorted(self.archive_dir.glob("*.jsonl.gz"))
+
+    def append(self, jobs: Iterable[Job]) -> int:
+        """Append jobs to the segment of the day they last changed"""
+        by_day = defaultdict(list)
+        for job in jobs:
+            by_day[job.updated_at.strftime("%Y-%m-%d")].append(job)
+        if not by_day:
+            return 0
+
+        self.archive_dir.mkdir(parents=True, exist_ok=True)
+        with exclusive_lock(self.lock_file):
+            # Widen the bounds before the data lands: a crash in between
+            # leaves a range too wide, which costs a read but loses no order
+            index = self._load_index()
+            for day, day_jobs in by_day.items():
+                bounds = index.setdefault(f"{day}.jsonl.gz", {})
+                for field in SORT_FIELDS:
+                    values = [getattr(job, f"_{field}") for job in day_jobs]
+                    low, high = bounds.get(field, (min(values), max(values)))
+                    bounds[field] = [min(low, *values), max(high, *values)]
+            self._write_index(index)
+            self._index_ids((job.id, f"{day}.jsonl.gz") for day, day_jobs in by_day.items() for job in day_jobs)
+            for day, day_jobs in by_day.items():
+                data = "".join(
+                    json.dumps(job.to_record(), separators=(',', ':')) + "\n" for job in day_jobs
+                ).encode()
+                with open(self.archive_dir / f"{day}.jsonl.gz", 'ab') as f:
+                    f.write(gzip.compress(data))
+                    f.flush()
+                    os.fsync(f.fileno())
+        return sum(len(day_jobs) for day_jobs in by_day.values())
+
+    def find(self, job_ids: Iterable[str]) -> Dict[str, Job]:
+        """Archived jobs among the given IDs, by ID
+
+        Each ID costs a read of its bucket in the id index; only segments
+        that hold one of the jobs are opened.
+        """
+        if not self.segments():
+            return {}
+        if not self.ids_dir.exists():
+            with exclusive_lock(self.lock_file):
+                self._index_ids(())
+        by_bucket = defaultdict(set)
+        for job_id in job_ids:
+            by_bucket[self._bucket(job_id)].add(job_id)
+        wanted = defaultdict(set)  # segment name -> ids archived in it
+        for bucket, ids in by_bucket.items():
+            try:
+                with open(self.ids_dir / bucket, 'r') as f:
+                    for line in f:
+                        job_id, _, segment = line.rstrip('\n').partition('\t')
+                        if job_id in ids and segment:
+                            wanted[segment].add(job_id)
+            except FileNotFoundError:
+                pass
+        found = {}
+        for segment, ids in wanted.items():
+            for job_data in self._read_segment(self.archive_dir / segment):
+                if job_data["id"] in ids:
+                    found[job_data["id"]] = Job.from_dict(job_data)
+        return found
+
+    @staticmethod
+    def _bucket(job_id: str) -> str:
+        return hashlib.md5(job_id.encode()).hexdigest()[:2] + ".txt"
+
+    def _index_ids(self, entries: Iterable[tuple]):
+        """Record (job id, segment name) pairs in the id index; caller must hold the lock
+
+        An archive written before the index existed is indexed in full first.
+        """
+        if not self.ids_dir.exists():
+            segments = self.segments()
+            entries = chain(((job_data["id"], segment.name) for segment in segments
+                             for job_data in self._read_segment(segment)), entries)
+            # Built aside and renamed into place, so a crash never leaves it half done
+            tmp_dir = self.archive_dir / "ids.tmp"
+            tmp_dir.mkdir(parents=True, exist_ok=True)
+            for path in tmp_dir.iterdir():
+                path.unlink()
+            self._write_ids(tmp_dir, entries)
+            os.replace(tmp_dir, self.ids_dir)
+            return
+        self._write_ids(self.ids_dir, entries)
+
+    def _write_ids(self, ids_dir, entries: Iterable[tuple]):
+        by_bucket = defaultdict(list)
+        for job_id, segment in entries:
+            by_bucket[self._bucket(job_id)].append(f"{job_id}\t{segment}\n")
+        for bucket, lines in by_bucket.items():
+            with open(ids_dir / bucket, 'a') as f:
+                f.write("".join(lines))
+
+    def iter_jobs(self, state: Optional[JobState] = None, reverse=False) -> Iterator[Job]:
+        """Stream archived jobs, oldest segment first (or newest first with `reverse`)"""
+        for segment in (reversed(self.segments()) if reverse else self.segments()):
+            records = self._read_segment(segment)
+            if reverse:
+                records = reversed(list(records))  # One day's segment at a time
+            for job_data in records:
+                if state is None or job_data["state"] == state.value:
+                    yield Job.from_dict(job_data)
+
+    def iter_sorted(self, field: str, state: Optional[JobState] = None, descending=False,
+                    keep=None) -> Iterator[Job]:
+        """Stream archived jobs ordered by a sort field, for merging with hot storage
+
+        Segments are opened in the order of their lowest (or, with
+        `descending`, highest) value of the field, and only once the merge
+        reaches that value, so a page costs the segments it overlaps rather
+        than the whole archive. `keep` filters jobs before they are sorted.
+        """
+        key = sort_key(field)
+        # Heap entries compare by key; descending merges flip the comparison
+        wrap = _Descending if descending else lambda value: value
+        edge = 1 if descending else 0
+
+        def load(segment):
+            jobs = [Job.from_dict(job_data) for job_data in self._read_segment(segment)
+                    if state is None or job_data["state"] == state.value]
+            return iter(sorted(filter(keep, jobs), key=key, reverse=descending))
+
+        def push(jobs):
+            job = next(jobs, None)
+            if job is not None:
+                heapq.heappush(heap, (wrap(key(job)), next(seq), job, jobs))
+
+        bounds = self._bounds(field)
+        segments = sorted(bounds, key=lambda segment: wrap(bounds[segment][edge]))
+        heap, seq, opened = [], count(), 0
+        while True:
+            # Open every segment that could hold a job ordered before the head
+            while opened < len(segments) and (not heap or wrap(bounds[segments[opened]][edge])
+                                              <= wrap(getattr(heap[0][2], f"_{field}"))):
+                push(load(segments[opened]))
+                opened += 1
+            if not heap:
+                return
+            _, _, job, jobs = heapq.heappop(heap)
+            yield job
+            push(jobs)
+
+    def _bounds(self, field: str) -> dict:
+        """Segment path -> [lowest, highest] epoch value of `field` in it
+
+        Segments written before the index existed are scanned once and
+        added to it.
+        """
+        segments = self.segments()
+        index = self._load_index()
+        missing = [segment for segment in segments if field not in index.get(segment.name, {})]
+        if missing:
+            with exclusive_lock(self.lock_file):
+                index = self._load_index()
+                for segment in missing:
+                    values = [to_epoch(job_data[field]) for job_data in self._read_segment(segment)]
+                    if values:
+                        index.setdefault(segment.name, {})[field] = [min(values), max(values)]
+                self._write_index(index)
+        return {segment: index[segment.name][field] for segment in segments
+                if field in index.get(segment.name, {})}
+
+    def _load_index(self) -> dict:
+        try:
+            with open(self.index_file, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _write_index(self, index: dict):
+        """Atomically replace the segment index; caller must hold the lock"""
+        tmp_file = self.index_file.with_suffix('.tmp')
+        with open(tmp_file, 'w') as f:
+            json.dump(index, f, separators=(',', ':'))
+        os.replace(tmp_file, self.index_file)
+
+    @staticmethod
+    def _read_segment(segment) -> Iterator[dict]:
+        with gzip.open(segment, 'rt') as f:
+            try:
+                for line in f:
+                    yield json.loads(line)
+            except EOFError:
+                pass  # Append cut short by a crash; earlier members are intact
@@ -0,0 +1,218 @@
+import heapq
+from datetime import datetime, timedelta
+from typing import Iterator, List, Optional
+from ..job import Job, JobState
+from ..config import get_config
+
+# States a job never leaves on its own; only these may be archived
+FINISHED_STATES = (JobState.COMPLETED, JobState.DEAD)
+
+# Job timestamps `iter_jobs` can order by
+SORT_FIELDS = ('created_at', 'updated_at')
+
+def job_matches(job: Job, since=None, until=None, command_contains=None) -> bool:
+    """Apply the list filters: created in [since, until) and command substring"""
+    if since and job.created_at < since:
+        return False
+    if until and job.created_at >= until:
+        return False
+    return not command_contains or command_contains in job.display_command
+
+def dedupe_cutoff() -> Optional[datetime]:
+    """Jobs created before this no longer match a dedupe_key (None: no limit)"""
+    window = get_config().get('dedupe_window', 3600)
+    return datetime.now() - timedelta(seconds=window) if window > 0 else None
+
+def find_duplicate(job: Job, get_by_id, get_by_key, cutoff) -> Optional[Job]:
+    """The stored job a new job duplicates: same id, or same dedupe_key within the window
+
+    `get_by_id` and `get_by_key` are the backend's indexed lookups,
+    returning a Job or None; `get_by_key` gives the newest job with the key.
+    """
+    existing = get_by_id(job.id)
+    if existing is None and job.dedupe_key:
+        existing = get_by_key(job.dedupe_key)
+        if existing is not None and cutoff and existing.created_at < cutoff:
+            existing = None
+    return existing
+
+def lease_expiry(now=None) -> Optional[datetime]:
+    """When a lease taken or renewed now runs out (None: leases disabled)"""
+    timeout = get_config().get('lease_timeout', 60)
+    return (now or datetime.now()) + timedelta(seconds=timeout) if timeout > 0 else None
+
+def expire_lease(job: Job):
+    """Settle a job whose worker stopped renewing its lease
+
+    The lost run counts as a failed attempt: the job is due again at once,
+    or dead if it has no retries left.
+    """
+    job.increment_attempt()
+    job.clear_lease()
+    if job.should_retry():
+        job.schedule_retry(0)
+    else:
+        job.mark_dead()
+
+def dependency_state(job: Job, state_of) -> JobState:
+    """State a new job with dependencies starts in: pending, blocked or dead
+
+    `state_of` maps a job id (stored, or earlier in the same write) to its
+    state value, or None if there is no such job.
+    """
+    states = []
+    for dep in job.depends_on:
+        state = state_of(dep)
+        if state is None:
+            raise ValueError(f"Job {job.id} depends on unknown job {dep} (dependencies must be in the same queue)")
+        states.append(state)
+    if JobState.DEAD.value in states:
+        return JobState.DEAD
+    if all(state == JobState.COMPLETED.value for state in states):
+        return JobState.PENDING
+    return JobState.BLOCKED
+
+def dependency_transitions(job_id: str, state: JobState, dependents_of, depends_on_of, state_of) -> list:
+    """Blocked jobs that change state now that `job_id` reached `state`
+
+    Uses the reverse-dependency index (`dependents_of`), so the cost is the
+    number of dependents, not the size of the queue. A completed job frees
+    the dependents whose other dependencies are all complete (archived ones
+    count as complete); a dead job sends every blocked descendant to the
+    DLQ. Returns [(job id, new state)].
+    """
+    if state == JobState.COMPLETED:
+        return [
+            (child, JobState.PENDING) for child in dependents_of(job_id)
+            if state_of(child) == JobState.BLOCKED.value
+            and all(state_of(dep) in (JobState.COMPLETED.value, None) for dep in depends_on_of(child))
+        ]
+    if state != JobState.DEAD:
+        return []
+    doomed, frontier = [], [job_id]
+    seen = {job_id}
+    while frontier:
+        for child in dependents_of(frontier.pop()):
+            if child not in seen and state_of(child) == JobState.BLOCKED.value:
+                seen.add(child)
+                doomed.append((child, JobState.DEAD))
+                frontier.append(child)
+    return doomed
+
+def sort_key(sort: str):
+    """Key ordering jobs by a sort field, ties broken by id"""
+    if sort not in SORT_FIELDS:
+        raise ValueError(f"Cannot sort by {sort} (valid: {', '.join(SORT_FIELDS)})")
+    return lambda job: (getattr(job, sort), job.id)
+
+class BaseJobStorage:
+    """Interface shared by all storage backends"""
+
+    def add_job(self, job: Job) -> Optional[Job]:
+        """Add a new job; returns the existing job instead if it is a duplicate"""
+        raise NotImplementedError
+
+    def add_jobs(self, jobs: List[Job]) -> List[Optional[Job]]:
+        """Add several new jobs in one storage write
+
+        Returns, for each job, None if it was added or the existing job it
+        duplicates (see `find_duplicate`).
+        """
+        return [self.add_job(job) for job in jobs]
+
+    def find_duplicates(self, jobs: List[Job]) -> List[Optional[Job]]:
+        """For each job, the stored job it duplicates or None, adding nothing"""
+        raise NotImplementedError
+
+    def update_job(self, updated_job: Job, worker_id: Optional[str] = None) -> bool:
+        """Update an existing job; with `worker_id`, only while that worker holds its lease"""
+        raise NotImplementedError
+
+    def get_job(self, job_id: str) -> Optional[Job]:
+        """Get a job by ID"""
+        raise NotImplementedError
+
+    def get_dependents(self, job_id: str) -> List[str]:
+        """IDs of the jobs that list `job_id` in their depends_on"""
+        return sorted(job.id for job in self.get_all_jobs() if job_id in job.depends_on)
+
+    def get_next_pending_job(self) -> Optional[Job]:
+        """Get the next pending job and mark it as processing"""
+        jobs = self.claim_batch(1)
+        return jobs[0] if jobs else None
+
+    def claim_batch(self, limit: int, worker_id: Optional[str] = None) -> List[Job]:
+        """Mark up to `limit` pending jobs as processing in one operation
+
+        Each claimed job is leased to `worker_id` until `lease_expiry()`.
+        """
+        raise NotImplementedError
+
+    def renew_leases(self, job_ids: List[str], worker_id: Optional[str]) -> int:
+        """Extend the leases `worker_id` holds on the given jobs; returns how many it still held"""
+        raise NotImplementedError
+
+    def reap_expired_leases(self) -> List[Job]:
+        """Settle processing jobs whose lease ran out (see `expire_lease`); returns them"""
+        raise NotImplementedError
+
+    def release_jobs(self, jobs: List[Job], worker_id: Optional[str] = None) -> List[str]:
+        """Return claimed but unstarted jobs to the pending state; returns the IDs released
+
+        With `worker_id`, only jobs whose lease that worker still holds are
+        released, so a job reaped and claimed again is left alone.
+        """
+        raise NotImplementedError
+
+    def get_jobs_by_state(self, state: JobState) -> List[Job]:
+        """Get all jobs with a specific state"""
+        raise NotImplementedError
+
+    def get_all_jobs(self) -> List[Job]:
+        """Get all jobs"""
+        raise NotImplementedError
+
+    def iter_jobs(self, state=None, since=None, until=None, command_contains=None,
+                  sort='created_at', descending=False, limit=None) -> Iterator[Job]:
+        """Yield matching jobs in `sort` order, at most `limit` of them
+
+        Backends override this to push the filters and the limit down so a
+        page of results costs no more than the page itself.
+        """
+        key = sort_key(sort)
+        jobs = self.get_jobs_by_state(state) if state else self.get_all_jobs()
+        matching = (job for job in jobs if job_matches(job, since, until, command_contains))
+        if limit is None:
+            yield from sorted(matching, key=key, reverse=descending)
+        else:
+            yield from (heapq.nlargest if descending else heapq.nsmallest)(limit, matching, key=key)
+
+    def get_job_stats(self) -> dict:
+        """Get the number of jobs in each state from the maintained counters"""
+        raise NotImplementedError
+
+    def count_job_states(self) -> dict:
+        """Count jobs per state with a full scan, leaving the counters untouched"""
+        counts = {state.value: 0 for state in JobState}
+        for job in self.get_all_jobs():
+            counts[job.state.value] += 1
+        return counts
+
+    def recount_job_stats(self) -> dict:
+        """Recount jobs per state from scratch and reset the counters to match"""
+        raise NotImplementedError
+
+    def remove_jobs(self, job_ids: List[str]) -> int:
+        """Delete the given jobs if they are still completed or dead; returns how many"""
+        raise NotImplementedError
+
+    def get_backlog(self) -> dict:
+        """Count due pending jobs and find the oldest due time
+
+        Returns {"pending": int, "oldest_due_at": datetime or None}.
+        """
+        raise NotImplementedError
+
+    def compact(self) -> int:
+        """Fold logged changes into the main data file; returns entries folded"""
+        return 0
@@ -0,0 +1,172 @@
+import builtins
+import json
+import os
+import socket
+import struct
+import time
+from datetime import datetime
+from ..job import DEFAULT_QUEUE, Job, JobState
+from ..config import get_config
+
+# Frames are a 4-byte big-endian length followed by a compact JSON body
+FRAME_HEADER = struct.Struct('>I')
+
+# Methods that only read, or whose repeat changes nothing, so a call
+# whose reply was lost can be sent again on a fresh connection
+_RETRYABLE = frozenset({
+    'get_job', 'find_duplicates', 'get_dependents', 'get_jobs_by_state', 'get_all_jobs',
+    'iter_jobs', 'get_job_stats', 'recount_job_stats', 'get_backlog', 'renew_leases',
+})
+
+# Seconds to use direct storage after a failed connect before trying the daemon again
+_RECONNECT_INTERVAL = 1.0
+
+def daemon_socket_path():
+    """Path of the daemon's Unix domain socket"""
+    return get_config().get_data_dir() / "daemon.sock"
+
+def encode_value(value):
+    """Convert jobs, states and timestamps into JSON-safe tagged values"""
+    if isinstance(value, Job):
+        return {"__job__": value.to_record()}
+    if isinstance(value, JobState):
+        return {"__state__": value.value}
+    if isinstance(value, datetime):
+        return {"__dt__": value.isoformat()}
+    if isinstance(value, (list, tuple)):
+        return [encode_value(item) for item in value]
+    if isinstance(value, dict):
+        return {key: encode_value(item) for key, item in value.items()}
+    return value
+
+def _decode_hook(obj):
+    if "__job__" in obj:
+        return Job.from_dict(obj["__job__"])
+    if "__state__" in obj:
+        return JobState(obj["__state__"])
+    if "__dt__" in obj:
+        return datetime.fromisoformat(obj["__dt__"])
+    return obj
+
+def encode_frame(message) -> bytes:
+    body = json.dumps(encode_value(message), separators=(',', ':')).encode()
+    return FRAME_HEADER.pack(len(body)) + body
+
+def decode_body(body: bytes):
+    return json.loads(body, object_hook=_decode_hook)
+
+def _recv_exact(sock, size: int) -> bytes:
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("Daemon closed the connection")
+        data.extend(chunk)
+    return bytes(data)
+
+def recv_frame(sock):
+    (size,) = FRAME_HEADER.unpack(_recv_exact(sock, FRAME_HEADER.size))
+    return decode_body(_recv_exact(sock, size))
+
+class DaemonStorage:
+    """Storage proxy that forwards every call to a running `queuectl daemon`
+
+    Any public storage method is sent over the socket by name, so this
+    class supports the same API as the backend the daemon wraps. While the
+    daemon cannot be reached from a (possibly forked) process, calls fall
+    back to direct storage access, and the proxy reconnects once it is
+    back. A reply that does not arrive within `daemon_timeout` seconds
+    counts as a lost connection.
+    """
+
+    def __init__(self, sock=None, queue=DEFAULT_QUEUE):
+        self.queue = queue
+        self.socket_path = daemon_socket_path()
+        self._sock = sock
+        self._sock_pid = os.getpid() if sock else None
+        self._reconnect_at = 0.0
+        self._fallback = None
+
+    @staticmethod
+    def _open_socket(path, timeout=None):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        try:
+            sock.connect(str(path))
+        except OSError:
+            sock.close()
+            raise
+        sock.settimeout(get_config().get("daemon_timeout", 30) or None)
+        return sock
+
+    @classmethod
+    def try_connect(cls, queue=DEFAULT_QUEUE):
+        """Return a connected proxy if a daemon is running, otherwise None"""
+        path = daemon_socket_path()
+        if not hasattr(socket, 'AF_UNIX') or not path.exists():
+            return None
+        try:
+            return cls(cls._open_socket(path, timeout=0.5), queue)
+        except OSError:
+            return None
+
+    def _direct_storage(self):
+        if self._fallback is None:
+            from . import get_storage  # Imported lazily: the package imports this module
+            self._fallback = get_storage(use_daemon=False, queue=self.queue)
+        return self._fallback
+
+    def _connection(self):
+        """This process's socket to the daemon, or None while it cannot be reached"""
+        if self._sock is not None and self._sock_pid != os.getpid():
+            # Sockets must not be shared across fork(), so each process
+            # opens its own connection
+            self._sock = None
+        if self._sock is None and time.monotonic() >= self._reconnect_at:
+            try:
+                self._sock = self._open_socket(self.socket_path, timeout=0.5)
+                self._sock_pid = os.getpid()
+            except OSError:
+                self._reconnect_at = time.monotonic() + _RECONNECT_INTERVAL
+        return self._sock
+
+    def _disconnect(self):
+        self._sock.close()
+        self._sock = None
+
+    def call(self, method: str, *args, retry=True):
+        """Invoke a storage method inside the daemon"""
+        sock = self._connection()
+        if sock is None:
+            return getattr(self._direct_storage(), method)(*args)
+
+        try:
+            sock.sendall(encode_frame({"m": method, "a": list(args), "q": self.queue}))
+        except OSError:
+            # Nothing was delivered, so retrying on a fresh connection (or
+            # on direct storage if the daemon is gone) is safe
+            self._disconnect()
+            if retry:
+                return self.call(method, *args, retry=False)
+            raise ConnectionError("Lost connection to queuectl daemon")
+        try:
+            response = recv_frame(sock)
+        except OSError:
+            # Includes the reply timeout; a late reply must not be read as
+            # the answer to the next request, so the connection is dropped
+            self._disconnect()
+            if retry and method in _RETRYABLE:
+                return self.call(method, *args, retry=False)
+            raise ConnectionError("Lost connection to queuectl daemon")
+
+        if "e" in response:
+            exc_type = getattr(builtins, response.get("t", ""), None)
+            if not (isinstance(exc_type, type) and issubclass(exc_type, Exception)):
+                exc_type = RuntimeError
+            raise exc_type(response["e"])
+        return response.get("r")
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return lambda *args: self.call(name, *args)
@@ -0,0 +1,88 @@
+import os
+import sqlite3
+from contextlib import contextmanager
+from typing import Dict, Iterable
+from ..config import get_config
+
+# SQLite's default cap on host parameters is 999 in older builds
+_CHUNK = 500
+
+class JobIdIndex:
+    """The queue that owns each job ID, across every queue and archive
+
+    Entries live in `ids.db` in the data dir, whatever the storage backend.
+    Enqueue looks a batch up, stores it and records the new IDs inside one
+    write transaction, so the same ID sent to two queues at once is stored
+    only once, and the check costs an index lookup per job rather than a
+    search of every queue. Entries outlive archiving, so an archived job's
+    ID stays taken. The first open fills the index from the queues and
+    archives already on disk.
+    """
+
+    def __init__(self, data_dir=None):
+        self.db_file = (data_dir or get_config().get_data_dir()) / "ids.db"
+        self._conn = None
+        self._conn_pid = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None or self._conn_pid != os.getpid():
+            conn = sqlite3.connect(str(self.db_file), timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS job_ids (
+                    id TEXT PRIMARY KEY,
+                    queue TEXT NOT NULL
+                ) WITHOUT ROWID
+            """)
+            self._conn, self._conn_pid = conn, os.getpid()
+            if conn.execute("PRAGMA user_version").fetchone()[0] == 0:
+                self._fill(conn)
+        return self._conn
+
+    @staticmethod
+    def _fill(conn: sqlite3.Connection):
+        """Record the IDs of jobs stored before the index existed; runs once per data dir"""
+        from . import get_storage, queue_data_dir, queue_names  # Imported lazily: the package imports this module
+        from .archive import JobArchive
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("PRAGMA user_version").fetchone()[0] == 0:
+                for name in queue_names():
+                    jobs = get_storage(queue=name).get_all_jobs()
+                    archived = JobArchive(queue_data_dir(name)).iter_jobs()
+                    conn.executemany("INSERT OR IGNORE INTO job_ids (id, queue) VALUES (?, ?)",
+                                     ((job.id, name) for source in (jobs, archived) for job in source))
+                conn.execute("PRAGMA user_version = 1")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    @contextmanager
+    def transaction(self):
+        """Hold the index's write lock; lookups and records inside it are atomic"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def owners(self, job_ids: Iterable[str]) -> Dict[str, str]:
+        """Owning queue of each of the given IDs that is taken, by ID"""
+        conn = self._connect()
+        job_ids = list(dict.fromkeys(job_ids))
+        owners = {}
+        for start in range(0, len(job_ids), _CHUNK):
+            chunk = job_ids[start:start + _CHUNK]
+            placeholders = ','.join('?' * len(chunk))
+            owners.update(conn.execute(f"SELECT id, queue FROM job_ids WHERE id IN ({placeholders})", chunk))
+        return owners
+
+    def record(self, job_ids: Iterable[str], queue: str):
+        """Mark IDs as owned by `queue`; IDs already taken keep their owner"""
+        self._connect().executemany("INSERT OR IGNORE INTO job_ids (id, queue) VALUES (?, ?)",
+                                    ((job_id, queue) for job_id in job_ids))
@@ -1,119 +1,370 @@
+import heapq
 import json
 import os
-import sys
+import time
+from datetime import datetime
 from pathlib import Path
 from typing import List, Optional
-from ..job import Job, JobState
+from ..job import DEFAULT_QUEUE, Job, JobState, to_epoch
 from ..config import get_config
+from .base import (FINISHED_STATES, BaseJobStorage, dedupe_cutoff, dependency_state,
+                   dependency_transitions, expire_lease, find_duplicate, lease_expiry)
+from .locking import exclusive_lock
+from .throttle import claim_gate
 
-# Platform-specific locking
-if sys.platform == 'win32':
-    import msvcrt
-    
-    def _lock_file(file_handle):
-        msvcrt.locking(file_handle.fileno(), msvcrt.LK_LOCK, 1)
-    
-    def _unlock_file(file_handle):
-        msvcrt.locking(file_handle.fileno(), msvcrt.LK_UNLCK, 1)
-else:
-    import fcntl
-    
-    def _lock_file(file_handle):
-        fcntl.flock(file_handle.fileno(), fcntl.LOCK_EX)
-    
-    def _unlock_file(file_handle):
-        fcntl.flock(file_handle.fileno(), fcntl.LOCK_UN)
-
-class JobStorage:
-    def __init__(self):
-        self.data_dir = get_config().get_data_dir()
+class JobStorage(BaseJobStorage):
+    """Job storage backed by a single JSON file"""
+
+    def __init__(self, data_dir=None, queue=DEFAULT_QUEUE):
+        self.data_dir = data_dir or get_config().get_data_dir()
+        self.queue = queue
         self.jobs_file = self.data_dir / "jobs.json"
         self.lock_file = self.data_dir / "jobs.lock"
+        self.stats_file = self.data_dir / "stats.json"
         self._ensure_files()
-    
+
     def _ensure_files(self):
-        if not self.jobs_file.exists():
-            self._write_jobs([])
-    
-    def _acquire_lock(self, file_handle):
-        """Acquire exclusive lock on file"""
-        try:
-            _lock_file(file_handle)
-        except:
-            pass  # Best effort locking
-    
-    def _release_lock(self, file_handle):
-        """Release lock on file"""
-        try:
-            _unlock_file(file_handle)
-        except:
-            pass  # Best effort locking
-    
-    def _read_jobs(self) -> List[Job]:
-        """Read all jobs from storage with locking"""
+        with self._lock():
+            if not self.jobs_file.exists():
+                self._write_records([])
+
+    def _lock(self):
+        """Exclusive lock on jobs.lock, held across read-modify-write"""
+        return exclusive_lock(self.lock_file)
+
+    def _read_records(self) -> List[dict]:
+        """Read every job record from storage; caller must hold the lock
+
+        Records stay plain dicts: filters look at their fields directly and
+        only the jobs an operation returns or changes become `Job` objects.
+        """
         with open(self.jobs_file, 'r') as f:
-            self._acquire_lock(f)
-            try:
-                data = json.load(f)
-                return [Job.from_dict(job_data) for job_data in data]
-            finally:
-                self._release_lock(f)
-    
-    def _write_jobs(self, jobs: List[Job]):
-        """Write all jobs to storage with locking"""
-        with open(self.jobs_file, 'w') as f:
-            self._acquire_lock(f)
-            try:
-                json.dump([job.to_dict() for job in jobs], f, indent=2)
-            finally:
-                self._release_lock(f)
-    
-    def add_job(self, job: Job):
-        """Add a new job"""
-        jobs = self._read_jobs()
-        jobs.append(job)
-        self._write_jobs(jobs)
-    
-    def update_job(self, updated_job: Job):
-        """Update an existing job"""
-        jobs = self._read_jobs()
-        for i, job in enumerate(jobs):
-            if job.id == updated_job.id:
-                jobs[i] = updated_job
-                break
-        self._write_jobs(jobs)
-    
+            return json.load(f)
+
+    def _write_records(self, records: List[dict], changes: Optional[List[tuple]] = None):
+        """Atomically replace the jobs file, then its counts; caller must hold the lock
+
+        `changes` holds an (old state, new state) pair for each record the
+        write touched, with None for a record added or removed. The stored
+        counts are adjusted by them; without them, or if the stored counts
+        are stale, the records are counted again.
+        """
+        # Read before the replace below: the counts are stamped with the old file
+        counts = self._stored_stats() if changes is not None else None
+        # Write a temp file and rename it over jobs.json so readers never
+        # see a truncated or half-written file
+        tmp_file = self.jobs_file.with_suffix('.tmp')
+        with open(tmp_file, 'w') as f:
+            json.dump(records, f, separators=(',', ':'))
+        os.replace(tmp_file, self.jobs_file)
+        if counts is None:
+            self._write_stats(self._count(records))
+            return
+        for old, new in changes:
+            if old is not None:
+                counts[old] -= 1
+            if new is not None:
+                counts[new] += 1
+        self._write_stats(counts)
+
+    def _jobs_file_version(self) -> list:
+        """Identifies one write of jobs.json: every replace gives it a new inode"""
+        st = os.stat(self.jobs_file)
+        return [st.st_ino, st.st_size, st.st_mtime_ns]
+
+    @staticmethod
+    def _count(records: List[dict]) -> dict:
+        counts = {state.value: 0 for state in JobState}
+        for record in records:
+            counts[record["state"]] += 1
+        return counts
+
+    def _write_stats(self, stats: dict) -> dict:
+        """Store per-state counts next to the jobs so status need not parse them
+
+        The counts are stamped with the jobs.json version they belong to, so
+        a crash between the two writes is noticed on the next read.
+        """
+        tmp_file = self.stats_file.with_suffix('.tmp')
+        with open(tmp_file, 'w') as f:
+            json.dump({"counts": stats, "jobs_file": self._jobs_file_version()}, f)
+        os.replace(tmp_file, self.stats_file)
+        return stats
+
+    @staticmethod
+    def _due(record: dict) -> float:
+        # Files written before records were compact hold ISO strings
+        return to_epoch(record.get("next_run_at") or record["created_at"])
+
+    @staticmethod
+    def _replace(records: List[dict], job: Job) -> Optional[str]:
+        """Swap in a changed job's record; returns the state it replaced, None if absent"""
+        for i, record in enumerate(records):
+            if record["id"] == job.id:
+                records[i] = job.to_record()
+                return record["state"]
+        return None
+
+    def _settle(self, records: List[dict], changed: Job) -> List[tuple]:
+        """Swap in a changed job and apply its new state to its dependents; caller holds the lock
+
+        Returns the (old state, new state) of every record that changed.
+        """
+        old = self._replace(records, changed)
+        changes = self._settle_dependencies(records, changed)
+        if old is not None:
+            changes.append((old, changed.state.value))
+        return changes
+
+    @staticmethod
+    def _settle_dependencies(records: List[dict], changed: Job) -> List[tuple]:
+        """Apply what a job's new state means for its dependents; caller holds the lock
+
+        jobs.json has no room for a persistent index, so the reverse index
+        is built from the records already in memory for this operation.
+        Returns the (old state, new state) of each dependent that changed.
+        """
+        by_id = {record["id"]: record for record in records}
+        state_of = lambda job_id: by_id[job_id]["state"] if job_id in by_id else None
+        if changed.state == JobState.PENDING and changed.depends_on:
+            # Retried from the DLQ: wait again for unfinished dependencies
+            if any(state_of(dep) not in (JobState.COMPLETED.value, None) for dep in changed.depends_on):
+                changed.state = JobState.BLOCKED
+                if changed.id in by_id:
+                    by_id[changed.id]["state"] = changed.state.value
+            return []
+        dependents = {}
+        for record in records:
+            for dep in record.get("depends_on") or ():
+                dependents.setdefault(dep, []).append(record["id"])
+        changes = []
+        for child, state in dependency_transitions(
+                changed.id, changed.state, lambda job_id: dependents.get(job_id, ()),
+                lambda job_id: by_id[job_id].get("depends_on") or (), state_of):
+            changes.append((by_id[child]["state"], state.value))
+            by_id[child]["state"] = state.value
+            by_id[child]["updated_at"] = time.time()
+        return changes
+
+    def add_job(self, job: Job) -> Optional[Job]:
+        """Add a new job; returns the existing job instead if it is a duplicate"""
+        return self.add_jobs([job])[0]
+
+    @staticmethod
+    def _duplicate_finder(by_id: dict, by_key: dict):
+        """`find_duplicate` over records indexed by id and dedupe_key"""
+        materialize = lambda record: Job.from_dict(record) if record else None
+        cutoff = dedupe_cutoff()
+        return lambda job: find_duplicate(job, lambda job_id: materialize(by_id.get(job_id)),
+                                          lambda key: materialize(by_key.get(key)), cutoff)
+
+    def find_duplicates(self, jobs: List[Job]) -> List[Optional[Job]]:
+        """For each job, the stored job it duplicates or None, adding nothing"""
+        with self._lock():
+            records = self._read_records()
+        by_id = {record["id"]: record for record in records}
+        by_key = {record["dedupe_key"]: record for record in records if record.get("dedupe_key")}
+        return list(map(self._duplicate_finder(by_id, by_key), jobs))
+
+    def add_jobs(self, new_jobs: List[Job]) -> List[Optional[Job]]:
+        """Add several new jobs in one storage write, skipping duplicates"""
+        with self._lock():
+            records = self._read_records()
+            # Built from the records parsed anyway for the rewrite
+            by_id = {record["id"]: record for record in records}
+            by_key = {record["dedupe_key"]: record for record in records if record.get("dedupe_key")}
+            duplicate_of = self._duplicate_finder(by_id, by_key)
+            results, added = [], []
+            for job in new_jobs:
+                existing = duplicate_of(job)
+                results.append(existing)
+                if existing:
+                    continue
+                if job.depends_on:
+                    job.state = dependency_state(job, lambda dep: by_id[dep]["state"] if dep in by_id else None)
+                record = job.to_record()
+                by_id[job.id] = record
+                if job.dedupe_key:
+                    by_key[job.dedupe_key] = record
+                added.append(record)
+            if added:
+                records.extend(added)
+                self._write_records(records, [(None, record["state"]) for record in added])
+        return results
+
+    def update_job(self, updated_job: Job, worker_id: Optional[str] = None) -> bool:
+        """Update an existing job and unblock or fail its dependents
+
+        With `worker_id`, the write only applies while that worker still
+        holds the job's lease; returns False if it was dropped.
+        """
+        with self._lock():
+            records = self._read_records()
+            if worker_id is not None and not any(
+                    record["id"] == updated_job.id and record["state"] == JobState.PROCESSING.value
+                    and record.get("worker_id") == worker_id for record in records):
+                return False
+            self._write_records(records, self._settle(records, updated_job))
+        return True
+
     def get_job(self, job_id: str) -> Optional[Job]:
         """Get a job by ID"""
-        jobs = self._read_jobs()
-        for job in jobs:
-            if job.id == job_id:
-                return job
+        with self._lock():
+            records = self._read_records()
+        for record in records:
+            if record["id"] == job_id:
+                return Job.from_dict(record)
         return None
-    
-    def get_next_pending_job(self) -> Optional[Job]:
-        """Get the next pending job and mark it as processing"""
-        jobs = self._read_jobs()
-        for job in jobs:
-            if job.state == JobState.PENDING:
-                job.mark_processing()
-                self._write_jobs(jobs)
-                return job
-        return None
-    
+
+    def get_dependents(self, job_id: str) -> List[str]:
+        """IDs of the jobs that list `job_id` in their depends_on"""
+        with self._lock():
+            records = self._read_records()
+        return sorted(record["id"] for record in records if job_id in (record.get("depends_on") or ()))
+
+    def claim_batch(self, limit: int, worker_id: Optional[str] = None) -> List[Job]:
+        """Mark up to `limit` pending jobs as processing in one operation"""
+        # Read, claim and write happen in one critical section so two
+        # workers can never claim the same job
+        now = datetime.now()
+        now_ts = now.timestamp()
+        expires = lease_expiry(now)
+        with self._lock(), claim_gate() as gate:
+            if gate and not gate.queue_open(self.queue):
+                return []
+            records = self._read_records()
+            due = ((i, record) for i, record in enumerate(records)
+                   if record["state"] == JobState.PENDING.value and self._due(record) <= now_ts)
+            order = lambda item: (-item[1].get("priority", 0), self._due(item[1]))
+            # Throttled jobs are skipped, so a gated claim may look past `limit` candidates
+            picked = heapq.nsmallest(limit, due, key=order) if gate is None else sorted(due, key=order)
+            claimed = []
+            for i, record in picked:
+                if len(claimed) == limit:
+                    break
+                if gate and not gate.admit(record["id"], record.get("queue", DEFAULT_QUEUE),
+                                           record.get("tag"), to_epoch(expires)):
+                    continue
+                job = Job.from_dict(record)
+                job.mark_processing(worker_id, expires)
+                records[i] = job.to_record()
+                claimed.append(job)
+            if claimed:
+                self._write_records(records, [(JobState.PENDING.value, JobState.PROCESSING.value)] * len(claimed))
+        return claimed
+
+    def renew_leases(self, job_ids: List[str], worker_id: Optional[str]) -> int:
+        """Extend the leases `worker_id` holds on the given jobs"""
+        job_ids = set(job_ids)
+        with self._lock():
+            records = self._read_records()
+            held = [record for record in records if record["id"] in job_ids
+                    and record["state"] == JobState.PROCESSING.value and record.get("worker_id") == worker_id]
+            if held:
+                expires = to_epoch(lease_expiry())
+                for record in held:
+                    record["lease_expires_at"] = expires
+                self._write_records(records, [])
+        return len(held)
+
+    def reap_expired_leases(self) -> List[Job]:
+        """Settle processing jobs whose lease ran out"""
+        now = time.time()
+        with self._lock():
+            # The reaper runs on a timer; with nothing processing there is
+            # no lease to expire, so skip parsing jobs.json
+            stats = self._stored_stats()
+            if stats is not None and not stats.get(JobState.PROCESSING.value):
+                return []
+            records = self._read_records()
+            # No index to consult: jobs.json is parsed whole on every operation anyway
+            expired = [Job.from_dict(record) for record in records
+                       if record["state"] == JobState.PROCESSING.value
+                       and record.get("lease_expires_at") and to_epoch(record["lease_expires_at"]) < now]
+            changes = []
+            for job in expired:
+                expire_lease(job)
+                changes.extend(self._settle(records, job))
+            if expired:
+                self._write_records(records, changes)
+        return expired
+
+    def release_jobs(self, released: List[Job], worker_id: Optional[str] = None) -> List[str]:
+        """Return claimed but unstarted jobs to the pending state; returns the IDs released"""
+        released_ids = {job.id for job in released}
+        done = []
+        with self._lock():
+            records = self._read_records()
+            for i, record in enumerate(records):
+                if (record["id"] in released_ids and record["state"] == JobState.PROCESSING.value
+                        and (worker_id is None or record.get("worker_id") == worker_id)):
+                    job = Job.from_dict(record)
+                    job.mark_pending()
+                    job.clear_lease()
+                    records[i] = job.to_record()
+                    done.append(job.id)
+            if done:
+                self._write_records(records, [(JobState.PROCESSING.value, JobState.PENDING.value)] * len(done))
+        return done
+
+    def remove_jobs(self, job_ids: List[str]) -> int:
+        """Delete the given jobs if they are still completed or dead"""
+        job_ids = set(job_ids)
+        finished = {state.value for state in FINISHED_STATES}
+        with self._lock():
+            records = self._read_records()
+            kept = [record for record in records if record["id"] not in job_ids or record["state"] not in finished]
+            if len(kept) < len(records):
+                removed = [record for record in records if record["id"] in job_ids and record["state"] in finished]
+                self._write_records(kept, [(record["state"], None) for record in removed])
+        return len(records) - len(kept)
+
     def get_jobs_by_state(self, state: JobState) -> List[Job]:
         """Get all jobs with a specific state"""
-        jobs = self._read_jobs()
-        return [job for job in jobs if job.state == state]
-    
+        with self._lock():
+            records = self._read_records()
+        return [Job.from_dict(record) for record in records if record["state"] == state.value]
+
     def get_all_jobs(self) -> List[Job]:
         """Get all jobs"""
-        return self._read_jobs()
-    
+        with self._lock():
+            records = self._read_records()
+        return [Job.from_dict(record) for record in records]
+
+    def _stored_stats(self) -> Optional[dict]:
+        """Counts from stats.json if they match jobs.json as it is now; caller must hold the lock"""
+        try:
+            with open(self.stats_file, 'r') as f:
+                stats = json.load(f)
+        except FileNotFoundError:
+            return None
+        # Unstamped (older version), or jobs.json was replaced after them
+        # by a write that crashed before updating stats.json
+        if stats.get("jobs_file") != self._jobs_file_version():
+            return None
+        return stats["counts"]
+
     def get_job_stats(self) -> dict:
-        """Get statistics about jobs"""
-        jobs = self._read_jobs()
-        stats = {state.value: 0 for state in JobState}
-        for job in jobs:
-            stats[job.state.value] += 1
-        return stats
+        """Get the number of jobs in each state from stats.json"""
+        with self._lock():
+            stats = self._stored_stats()
+            return stats if stats is not None else self._write_stats(self._count(self._read_records()))
+
+    def count_job_states(self) -> dict:
+        """Count jobs per state from jobs.json, leaving stats.json as it is"""
+        with self._lock():
+            return self._count(self._read_records())
+
+    def recount_job_stats(self) -> dict:
+        """Recount jobs per state from jobs.json and rewrite stats.json"""
+        with self._lock():
+            return self._write_stats(self._count(self._read_records()))
+
+    def get_backlog(self) -> dict:
+        """Count due pending jobs and find the oldest due time"""
+        now = time.time()
+        with self._lock():
+            records = self._read_records()
+        due = [self._due(record) for record in records if record["state"] == JobState.PENDING.value]
+        due = [due_at for due_at in due if due_at <= now]
+        return {"pending": len(due), "oldest_due_at": datetime.fromtimestamp(min(due)) if due else None}
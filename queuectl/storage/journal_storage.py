@@ -0,0 +1,548 @@
+import heapq
+import json
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import count
+from typing import Iterator, List, Optional
+from ..job import DEFAULT_QUEUE, Job, JobState, describe_command, to_epoch
+from ..config import get_config
+from .base import (FINISHED_STATES, BaseJobStorage, dedupe_cutoff, dependency_state,
+                   dependency_transitions, expire_lease, find_duplicate, lease_expiry, sort_key)
+from .locking import exclusive_lock
+from .throttle import claim_gate
+
+# Journal record type written for each state a job can move into
+_TRANSITIONS = {
+    JobState.PENDING: "retry",
+    JobState.BLOCKED: "block",
+    JobState.PROCESSING: "claim",
+    JobState.COMPLETED: "complete",
+    JobState.FAILED: "fail",
+    JobState.DEAD: "dead",
+}
+
+class JournalJobStorage(BaseJobStorage):
+    """Log-structured job storage: a snapshot plus an append-only journal
+
+    Every state transition appends the job's compact record (`Job.to_record`)
+    as one JSON line to `journal.log`.
+    Each process keeps the replayed state in memory and, under the lock,
+    only reads the journal bytes written since its last operation.
+    Compaction folds the journal into a fresh `snapshot.json`. Each journal
+    starts with a header naming a random epoch, which the snapshot it
+    follows also records, so a process notices a compaction by the epoch
+    changing even if the new file reuses the old inode. Per-state
+    counts are saved to `journal_stats.json` after every append, stamped
+    with the journal position they match, so `status` needs no replay.
+    """
+
+    def __init__(self, data_dir=None, queue=DEFAULT_QUEUE):
+        config = get_config()
+        self.data_dir = data_dir or config.get_data_dir()
+        self.queue = queue
+        self.snapshot_file = self.data_dir / "snapshot.json"
+        self.journal_file = self.data_dir / "journal.log"
+        self.lock_file = self.data_dir / "journal.lock"
+        self.stats_file = self.data_dir / "journal_stats.json"
+        self.compact_every = config.get("journal_compact_every", 10000)
+
+        self._jobs = {}        # job id -> job dict, in enqueue order
+        self._counts = {state.value: 0 for state in JobState}
+        self._pending = {}     # pending job id -> its live (-priority, due time, seq) key
+        self._waiting = []     # heap of (due time, seq, -priority, job id) not yet promoted
+        self._ready = []       # heap of (-priority, due time, seq, job id) that are due
+        self._dependents = {}  # job id -> set of ids of jobs that depend on it
+        self._dedupe = {}      # dedupe_key -> id of the newest job with it
+        self._leases = []      # heap of (lease expiry, job id), stale once renewed or finished
+        self._seq = count()
+        self._journal_id = None
+        self._epoch = None
+        self._offset = 0
+        self._records = 0
+
+        # State is replayed on first use; reading the counts never needs it
+        with exclusive_lock(self.lock_file):
+            if not self.journal_file.exists():
+                self._new_journal(os.urandom(8).hex())
+
+    @contextmanager
+    def _transaction(self):
+        """Lock the journal and bring the in-memory state up to date"""
+        with exclusive_lock(self.lock_file):
+            self._refresh()
+            yield
+
+    def _new_journal(self, epoch: str) -> int:
+        """Replace the journal with one holding only its epoch header; returns its size"""
+        header = json.dumps({"op": "epoch", "epoch": epoch}, separators=(',', ':')).encode() + b"\n"
+        tmp_journal = self.journal_file.with_suffix('.tmp')
+        with open(tmp_journal, 'wb') as f:
+            f.write(header)
+        os.replace(tmp_journal, self.journal_file)
+        return len(header)
+
+    @staticmethod
+    def _read_epoch(f) -> Optional[str]:
+        """Epoch in the header of an open journal; None for journals written before headers"""
+        first = f.readline()
+        if first.startswith(b'{"op":"epoch"') and first.endswith(b"\n"):
+            return json.loads(first)["epoch"]
+        return None
+
+    def _refresh(self):
+        if not self.journal_file.exists():
+            self._new_journal(os.urandom(8).hex())
+        with open(self.journal_file, 'rb') as f:
+            st = os.fstat(f.fileno())
+            journal_id = (st.st_dev, st.st_ino)
+            epoch = self._read_epoch(f)
+            if journal_id != self._journal_id or epoch != self._epoch or st.st_size < self._offset:
+                # First load, or another process compacted the journal
+                self._load_snapshot()
+                self._journal_id, self._epoch = journal_id, epoch
+            f.seek(self._offset)
+            data = f.read()
+        self._read_tail(data)
+
+    def _load_snapshot(self):
+        self._jobs = {}
+        self._counts = {state.value: 0 for state in JobState}
+        self._pending = {}
+        self._waiting = []
+        self._ready = []
+        self._dependents = {}
+        self._dedupe = {}
+        self._leases = []
+        self._offset = 0
+        self._records = 0
+        if self.snapshot_file.exists():
+            with open(self.snapshot_file, 'r') as f:
+                snapshot = json.load(f)
+            # Written before epochs: a bare list of jobs
+            for job_data in snapshot["jobs"] if isinstance(snapshot, dict) else snapshot:
+                self._apply(job_data)
+
+    def _read_tail(self, data: bytes):
+        """Replay journal bytes read from the current offset; caller must hold the lock"""
+        if not data:
+            return
+
+        end = data.rfind(b'\n') + 1
+        if end < len(data):
+            # A writer crashed mid-record; we hold the lock, so drop the torn tail
+            with open(self.journal_file, 'r+b') as f:
+                f.truncate(self._offset + end)
+
+        for line in data[:end].splitlines():
+            if line:
+                record = json.loads(line)
+                if record["op"] == "epoch":
+                    continue
+                if record["op"] == "archive":
+                    self._forget(record["job"]["id"])
+                elif record["op"] == "lease":
+                    self._renew(record["ids"], record["worker_id"], to_epoch(record["lease_expires_at"]))
+                else:
+                    self._apply(record["job"])
+                self._records += 1
+        self._offset += end
+
+    def _apply(self, job_data: dict):
+        if isinstance(job_data["created_at"], str):
+            # Written before records were compact: full dicts with ISO timestamps
+            job_data = Job.from_dict(job_data).to_record()
+        job_id = job_data["id"]
+        previous = self._jobs.get(job_id)
+        if previous:
+            self._counts[previous["state"]] -= 1
+        else:
+            for dep in job_data.get("depends_on") or ():
+                self._dependents.setdefault(dep, set()).add(job_id)
+            if job_data.get("dedupe_key"):
+                self._dedupe[job_data["dedupe_key"]] = job_id
+        self._counts[job_data["state"]] += 1
+        self._jobs[job_id] = job_data
+        if job_data["state"] == JobState.PENDING.value:
+            due = job_data.get("next_run_at") or job_data["created_at"]
+            priority = -job_data.get("priority", 0)
+            key = self._pending.get(job_id)
+            if key is None or key[:2] != (priority, due):
+                seq = next(self._seq)
+                self._pending[job_id] = (priority, due, seq)
+                heapq.heappush(self._waiting, (due, seq, priority, job_id))
+        else:
+            self._pending.pop(job_id, None)
+            if job_data["state"] == JobState.PROCESSING.value and job_data.get("lease_expires_at"):
+                heapq.heappush(self._leases, (job_data["lease_expires_at"], job_id))
+
+    def _renew(self, job_ids: List[str], worker_id: Optional[str], expires: float) -> int:
+        renewed = 0
+        for job_id in job_ids:
+            job_data = self._jobs.get(job_id)
+            if (job_data and job_data["state"] == JobState.PROCESSING.value
+                    and job_data.get("worker_id") == worker_id):
+                job_data["lease_expires_at"] = expires
+                heapq.heappush(self._leases, (expires, job_id))
+                renewed += 1
+        return renewed
+
+    def _forget(self, job_id: str):
+        job_data = self._jobs.pop(job_id, None)
+        if job_data:
+            self._counts[job_data["state"]] -= 1
+            for dep in job_data.get("depends_on") or ():
+                self._dependents.get(dep, set()).discard(job_id)
+            if self._dedupe.get(job_data.get("dedupe_key")) == job_id:
+                del self._dedupe[job_data["dedupe_key"]]
+        self._dependents.pop(job_id, None)
+        self._pending.pop(job_id, None)
+
+    def _append(self, op: str, job: Job):
+        self._append_many(op, [job])
+
+    def _append_many(self, op: str, jobs: List[Job]):
+        records = [job.to_record() for job in jobs]
+        self._write([{"op": op, "job": job_data} for job_data in records])
+        for job_data in records:
+            self._apply(job_data)
+        self._committed()
+
+    def _write(self, records: List[dict]):
+        """Append journal records in a single write; caller must hold the lock"""
+        data = "".join(json.dumps(record, separators=(',', ':')) + "\n" for record in records).encode()
+        with open(self.journal_file, 'ab') as f:
+            f.write(data)
+        self._offset += len(data)
+        self._records += len(records)
+
+    def _committed(self):
+        """Save the counts for the journal just appended to and compact if due; caller must hold the lock"""
+        if self.compact_every and self._records >= self.compact_every:
+            self._compact()
+        else:
+            self._save_counts()
+
+    def _journal_position(self) -> list:
+        """Identifies the journal contents the in-memory state reflects"""
+        return [self._epoch, *self._journal_id, self._offset]
+
+    def _save_counts(self) -> dict:
+        """Write the counts stamped with the journal position; caller must hold the lock"""
+        tmp_file = self.stats_file.with_suffix('.tmp')
+        with open(tmp_file, 'w') as f:
+            json.dump({"counts": self._counts, "journal": self._journal_position()}, f)
+        os.replace(tmp_file, self.stats_file)
+        return dict(self._counts)
+
+    def _stored_counts(self) -> Optional[dict]:
+        """Saved counts if they match the journal on disk; caller must hold the lock"""
+        try:
+            with open(self.stats_file, 'r') as f:
+                stats = json.load(f)
+            with open(self.journal_file, 'rb') as f:
+                st = os.fstat(f.fileno())
+                epoch = self._read_epoch(f)
+        except FileNotFoundError:
+            return None
+        # Missing the stamp (older version), or an append or compaction
+        # landed without the counts that go with it
+        if stats.get("journal") != [epoch, st.st_dev, st.st_ino, st.st_size]:
+            return None
+        return stats["counts"]
+
+    def _compact(self) -> int:
+        """Fold the journal into a new snapshot; caller must hold the lock"""
+        folded = self._records
+        epoch = os.urandom(8).hex()
+        tmp_snapshot = self.snapshot_file.with_suffix('.tmp')
+        with open(tmp_snapshot, 'w') as f:
+            json.dump({"epoch": epoch, "jobs": list(self._jobs.values())}, f, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_snapshot, self.snapshot_file)
+
+        # Replaying full job records is idempotent, so a crash between the
+        # two renames only means the old journal is replayed once more
+        size = self._new_journal(epoch)
+
+        st = os.stat(self.journal_file)
+        self._journal_id = (st.st_dev, st.st_ino)
+        self._epoch = epoch
+        self._offset = size
+        self._records = 0
+        self._save_counts()
+        return folded
+
+    @staticmethod
+    def _to_job(job_data: dict) -> Job:
+        return Job.from_dict(dict(job_data))
+
+    def compact(self) -> int:
+        """Fold the journal into a new snapshot"""
+        with self._transaction():
+            return self._compact()
+
+    def add_job(self, job: Job) -> Optional[Job]:
+        """Add a new job; returns the existing job instead if it is a duplicate"""
+        return self.add_jobs([job])[0]
+
+    def find_duplicates(self, jobs: List[Job]) -> List[Optional[Job]]:
+        """For each job, the stored job it duplicates or None, adding nothing"""
+        with self._transaction():
+            cutoff = dedupe_cutoff()
+            return [find_duplicate(job, self._stored, lambda key: self._stored(self._dedupe.get(key)), cutoff)
+                    for job in jobs]
+
+    def add_jobs(self, jobs: List[Job]) -> List[Optional[Job]]:
+        """Add several new jobs with a single journal write, skipping duplicates"""
+        with self._transaction():
+            batch, batch_keys = {}, {}  # Jobs accepted earlier in this call
+            cutoff = dedupe_cutoff()
+            results, added = [], []
+            for job in jobs:
+                existing = find_duplicate(
+                    job, lambda job_id: batch.get(job_id) or self._stored(job_id),
+                    lambda key: batch_keys.get(key) or self._stored(self._dedupe.get(key)), cutoff)
+                results.append(existing)
+                if existing:
+                    continue
+                if job.depends_on:
+                    job.state = dependency_state(
+                        job, lambda dep: batch[dep].state.value if dep in batch else self._state_of(dep))
+                batch[job.id] = job
+                if job.dedupe_key:
+                    batch_keys[job.dedupe_key] = job
+                added.append(job)
+            if added:
+                self._append_many("enqueue", added)
+        return results
+
+    def _stored(self, job_id: Optional[str]) -> Optional[Job]:
+        job_data = self._jobs.get(job_id)
+        return self._to_job(job_data) if job_data else None
+
+    def _state_of(self, job_id: str) -> Optional[str]:
+        job_data = self._jobs.get(job_id)
+        return job_data["state"] if job_data else None
+
+    def update_job(self, updated_job: Job, worker_id: Optional[str] = None) -> bool:
+        """Update an existing job and unblock or fail its dependents
+
+        With `worker_id`, the write only applies while that worker still
+        holds the job's lease; returns False if it was dropped.
+        """
+        with self._transaction():
+            job_data = self._jobs.get(updated_job.id)
+            if job_data is None:
+                return False
+            if worker_id is not None and (job_data["state"] != JobState.PROCESSING.value
+                                          or job_data.get("worker_id") != worker_id):
+                return False
+            self._update(updated_job)
+        return True
+
+    def _update(self, updated_job: Job):
+        """Write a job's new state and its dependents'; caller must hold the lock"""
+        if updated_job.state == JobState.PENDING and any(
+                self._state_of(dep) not in (JobState.COMPLETED.value, None) for dep in updated_job.depends_on):
+            updated_job.state = JobState.BLOCKED  # Retried from the DLQ before its dependencies
+        self._append(_TRANSITIONS[updated_job.state], updated_job)
+
+        transitions = dependency_transitions(
+            updated_job.id, updated_job.state, lambda job_id: self._dependents.get(job_id, ()),
+            lambda job_id: self._jobs[job_id].get("depends_on") or (), self._state_of)
+        if transitions:
+            changed = []
+            for job_id, state in transitions:
+                job = self._to_job(self._jobs[job_id])
+                job.state, job.updated_at = state, datetime.now()
+                changed.append(job)
+            # All dependents move the same way: freed, or sent to the DLQ
+            self._append_many("unblock" if state == JobState.PENDING else "dead", changed)
+
+    def get_job(self, job_id: str) -> Optional[Job]:
+        """Get a job by ID"""
+        with self._transaction():
+            job_data = self._jobs.get(job_id)
+            return self._to_job(job_data) if job_data else None
+
+    def claim_batch(self, limit: int, worker_id: Optional[str] = None) -> List[Job]:
+        """Mark up to `limit` due pending jobs as processing in one operation"""
+        claimed = []
+        with self._transaction(), claim_gate() as gate:
+            if gate and not gate.queue_open(self.queue):
+                return []
+            expires = lease_expiry()
+            now = time.time()
+            # Promote jobs that became due so a high-priority job scheduled
+            # for later never blocks lower-priority work that is due now
+            while self._waiting and self._waiting[0][0] <= now:
+                due, seq, priority, job_id = heapq.heappop(self._waiting)
+                if self._pending.get(job_id) == (priority, due, seq):
+                    heapq.heappush(self._ready, (priority, due, seq, job_id))
+
+            throttled = []
+            while self._ready and len(claimed) < limit:
+                entry = heapq.heappop(self._ready)
+                priority, due, seq, job_id = entry
+                if self._pending.get(job_id) != (priority, due, seq):
+                    continue  # Job was claimed or rescheduled
+                job_data = self._jobs[job_id]
+                if gate and not gate.admit(job_id, job_data.get("queue", DEFAULT_QUEUE), job_data.get("tag"),
+                                           expires.timestamp() if expires else None):
+                    throttled.append(entry)  # Stays ready for a later claim
+                    continue
+                job = self._to_job(job_data)
+                job.mark_processing(worker_id, expires)
+                self._append("claim", job)
+                claimed.append(job)
+            for entry in throttled:
+                heapq.heappush(self._ready, entry)
+
+            if len(self._waiting) + len(self._ready) > 2 * len(self._pending) + 1024:
+                self._waiting = [(due, seq, priority, job_id)
+                                 for job_id, (priority, due, seq) in self._pending.items()]
+                self._ready = []
+                heapq.heapify(self._waiting)
+        return claimed
+
+    def release_jobs(self, released: List[Job], worker_id: Optional[str] = None) -> List[str]:
+        """Return claimed but unstarted jobs to the pending state; returns the IDs released"""
+        done = []
+        with self._transaction():
+            for released_job in released:
+                job_data = self._jobs.get(released_job.id)
+                if (job_data and job_data["state"] == JobState.PROCESSING.value
+                        and (worker_id is None or job_data.get("worker_id") == worker_id)):
+                    job = self._to_job(job_data)
+                    job.mark_pending()
+                    job.clear_lease()
+                    self._append("release", job)
+                    done.append(job.id)
+        return done
+
+    def renew_leases(self, job_ids: List[str], worker_id: Optional[str]) -> int:
+        """Extend the leases `worker_id` holds on the given jobs"""
+        expires = lease_expiry()
+        if not job_ids or expires is None:
+            return 0
+        record = {"op": "lease", "ids": list(job_ids), "worker_id": worker_id,
+                  "lease_expires_at": expires.timestamp()}
+        with self._transaction():
+            # One short record per heartbeat instead of a full job record per job
+            self._write([record])
+            renewed = self._renew(record["ids"], worker_id, record["lease_expires_at"])
+            self._committed()
+        return renewed
+
+    def reap_expired_leases(self) -> List[Job]:
+        """Settle processing jobs whose lease ran out"""
+        reaped = []
+        with self._transaction():
+            now = time.time()
+            while self._leases and self._leases[0][0] < now:
+                expires, job_id = heapq.heappop(self._leases)
+                job_data = self._jobs.get(job_id)
+                if (not job_data or job_data["state"] != JobState.PROCESSING.value
+                        or job_data.get("lease_expires_at") != expires):
+                    continue  # Finished, or renewed since this entry was pushed
+                job = self._to_job(job_data)
+                expire_lease(job)
+                self._update(job)
+                reaped.append(job)
+        return reaped
+
+    def remove_jobs(self, job_ids: List[str]) -> int:
+        """Delete the given jobs if they are still completed or dead"""
+        finished = {state.value for state in FINISHED_STATES}
+        with self._transaction():
+            removed = [job_id for job_id in job_ids
+                       if job_id in self._jobs and self._jobs[job_id]["state"] in finished]
+            if removed:
+                # Removals only need the id; compaction drops the jobs for good
+                self._write([{"op": "archive", "job": {"id": job_id}} for job_id in removed])
+                for job_id in removed:
+                    self._forget(job_id)
+                self._committed()
+        return len(removed)
+
+    def get_dependents(self, job_id: str) -> List[str]:
+        """IDs of the jobs that list `job_id` in their depends_on"""
+        with self._transaction():
+            return sorted(self._dependents.get(job_id, ()))
+
+    def get_jobs_by_state(self, state: JobState) -> List[Job]:
+        """Get all jobs with a specific state"""
+        with self._transaction():
+            return [self._to_job(d) for d in self._jobs.values() if d["state"] == state.value]
+
+    def get_all_jobs(self) -> List[Job]:
+        """Get all jobs"""
+        with self._transaction():
+            return [self._to_job(d) for d in self._jobs.values()]
+
+    def iter_jobs(self, state=None, since=None, until=None, command_contains=None,
+                  sort='created_at', descending=False, limit=None) -> Iterator[Job]:
+        """Yield matching jobs in `sort` order, at most `limit` of them"""
+        sort_key(sort)
+        # Compared as epoch seconds, so an offset in the bounds cannot change the result
+        since = since.timestamp() if since else None
+        until = until.timestamp() if until else None
+        with self._transaction():
+            # Filter and order the raw records under the lock; only the
+            # selected page is turned into Job objects, after releasing it
+            matching = [
+                d for d in self._jobs.values()
+                if (not state or d["state"] == state.value)
+                and (not since or d["created_at"] >= since)
+                and (not until or d["created_at"] < until)
+                and (not command_contains or command_contains in describe_command(d))
+            ]
+        key = lambda d: (d[sort], d["id"])
+        if limit is None:
+            selected = sorted(matching, key=key, reverse=descending)
+        else:
+            selected = (heapq.nlargest if descending else heapq.nsmallest)(limit, matching, key=key)
+        for job_data in selected:
+            yield self._to_job(job_data)
+
+    def get_job_stats(self) -> dict:
+        """Get the number of jobs in each state from journal_stats.json
+
+        Only if the saved counts do not match the journal (a crash between
+        the two writes, or an older version) is the journal replayed.
+        """
+        with exclusive_lock(self.lock_file):
+            counts = self._stored_counts()
+            if counts is None:
+                self._refresh()
+                counts = self._save_counts()
+            return counts
+
+    def count_job_states(self) -> dict:
+        """Count jobs per state from the replayed records, leaving the counters untouched"""
+        counts = {state.value: 0 for state in JobState}
+        with self._transaction():
+            for job_data in self._jobs.values():
+                counts[job_data["state"]] += 1
+        return counts
+
+    def recount_job_stats(self) -> dict:
+        """Recount jobs per state from the replayed records and rewrite journal_stats.json"""
+        with self._transaction():
+            self._counts = {state.value: 0 for state in JobState}
+            for job_data in self._jobs.values():
+                self._counts[job_data["state"]] += 1
+            return self._save_counts()
+
+    def get_backlog(self) -> dict:
+        """Count due pending jobs and find the oldest due time"""
+        with self._transaction():
+            now = time.time()
+            due = [key[1] for key in self._pending.values() if key[1] <= now]
+        return {
+            "pending": len(due),
+            "oldest_due_at": datetime.fromtimestamp(min(due)) if due else None,
+        }
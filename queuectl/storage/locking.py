@@ -0,0 +1,31 @@
+import sys
+from contextlib import contextmanager
+
+# Platform-specific locking
+if sys.platform == 'win32':
+    import msvcrt
+
+    def lock_file(file_handle):
+        msvcrt.locking(file_handle.fileno(), msvcrt.LK_LOCK, 1)
+
+    def unlock_file(file_handle):
+        msvcrt.locking(file_handle.fileno(), msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def lock_file(file_handle):
+        fcntl.flock(file_handle.fileno(), fcntl.LOCK_EX)
+
+    def unlock_file(file_handle):
+        fcntl.flock(file_handle.fileno(), fcntl.LOCK_UN)
+
+@contextmanager
+def exclusive_lock(path):
+    """Hold an exclusive lock on a lock file for the duration of the block"""
+    with open(path, 'a+') as f:
+        f.seek(0)
+        lock_file(f)
+        try:
+            yield
+        finally:
+            unlock_file(f)
@@ -0,0 +1,542 @@
+import json
+import os
+import sqlite3
+from datetime import datetime
+from typing import Iterator, List, Optional
+from ..job import DEFAULT_QUEUE, Job, JobState
+from ..config import get_config
+from .base import (FINISHED_STATES, BaseJobStorage, dedupe_cutoff, dependency_state,
+                   expire_lease, find_duplicate, job_matches, lease_expiry, sort_key)
+from .throttle import claim_gate, load_throttles
+
+# UPDATE ... RETURNING lets the claim run as a single statement
+_HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+# Fields kept in their own columns so they can be indexed; everything
+# else lives in the JSON `data` payload
+_COLUMNS = ('id', 'state', 'created_at', 'updated_at', 'worker_id', 'lease_expires_at')
+
+# Columns written on every insert/update; `due_at`, `priority`,
+# `dedupe_key` and `tag` are query keys derived from the job (all but the
+# first also stay in the payload)
+_WRITE_COLUMNS = (
+    'id', 'state', 'created_at', 'updated_at', 'due_at', 'priority', 'dedupe_key', 'tag',
+    'worker_id', 'lease_expires_at', 'data',
+)
+_INSERT = (
+    f"INSERT INTO jobs ({', '.join(_WRITE_COLUMNS)}) "
+    f"VALUES ({', '.join('?' for _ in _WRITE_COLUMNS)})"
+)
+_UPDATE = f"UPDATE jobs SET {', '.join(f'{c} = ?' for c in _WRITE_COLUMNS[1:])} WHERE id = ?"
+# Lease fence: the update only applies while the worker still holds the job
+_FENCE = " AND worker_id = ? AND state = ?"
+_ROW = "id, state, created_at, updated_at, worker_id, lease_expires_at, data"
+_SELECT = f"SELECT {_ROW} FROM jobs"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS job_deps (
+    parent_id TEXT NOT NULL,
+    child_id TEXT NOT NULL,
+    PRIMARY KEY (parent_id, child_id)
+) WITHOUT ROWID;
+"""
+
+# Columns added after the table was first released: (column, DDL, backfill or None)
+_MIGRATIONS = [
+    ("due_at", "ALTER TABLE jobs ADD COLUMN due_at REAL", "UPDATE jobs SET due_at = created_at"),
+    ("priority", "ALTER TABLE jobs ADD COLUMN priority INTEGER NOT NULL DEFAULT 0", None),
+    ("dedupe_key", "ALTER TABLE jobs ADD COLUMN dedupe_key TEXT", None),
+    ("worker_id", "ALTER TABLE jobs ADD COLUMN worker_id TEXT", None),
+    ("lease_expires_at", "ALTER TABLE jobs ADD COLUMN lease_expires_at REAL", None),
+    ("tag", "ALTER TABLE jobs ADD COLUMN tag TEXT", None),
+]
+
+_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_jobs_state_created ON jobs (state, created_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_created ON jobs (created_at, id);
+CREATE INDEX IF NOT EXISTS idx_jobs_state_due ON jobs (state, due_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_state_priority ON jobs (state, priority DESC, due_at);
+CREATE INDEX IF NOT EXISTS idx_job_deps_child ON job_deps (child_id);
+CREATE INDEX IF NOT EXISTS idx_jobs_dedupe ON jobs (dedupe_key, created_at) WHERE dedupe_key IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_jobs_state_lease ON jobs (state, lease_expires_at);
+"""
+
+# Free the blocked dependents of a completed job whose other dependencies
+# are complete too; dependencies already archived count as complete
+_UNBLOCK = """
+UPDATE jobs SET state = :pending, updated_at = :now
+WHERE state = :blocked
+  AND id IN (SELECT child_id FROM job_deps WHERE parent_id = :id)
+  AND NOT EXISTS (
+      SELECT 1 FROM job_deps d JOIN jobs p ON p.id = d.parent_id
+      WHERE d.child_id = jobs.id AND p.state != :completed
+  )
+"""
+
+# Send every blocked descendant of a dead job to the DLQ
+_FAIL_DEPENDENTS = """
+WITH RECURSIVE doomed(id) AS (
+    SELECT child_id FROM job_deps WHERE parent_id = :id
+    UNION
+    SELECT d.child_id FROM job_deps d JOIN doomed ON d.parent_id = doomed.id
+)
+UPDATE jobs SET state = :dead, updated_at = :now
+WHERE state = :blocked AND id IN (SELECT id FROM doomed)
+"""
+
+# Per-state job counts kept in step with `jobs` by triggers, so every
+# transition updates them in its own transaction
+_COUNTERS = [
+    "CREATE TABLE job_counts (state TEXT PRIMARY KEY, count INTEGER NOT NULL)",
+    """CREATE TRIGGER jobs_count_insert AFTER INSERT ON jobs BEGIN
+        INSERT OR IGNORE INTO job_counts (state, count) VALUES (NEW.state, 0);
+        UPDATE job_counts SET count = count + 1 WHERE state = NEW.state;
+    END""",
+    """CREATE TRIGGER jobs_count_delete AFTER DELETE ON jobs BEGIN
+        UPDATE job_counts SET count = count - 1 WHERE state = OLD.state;
+    END""",
+    """CREATE TRIGGER jobs_count_update AFTER UPDATE OF state ON jobs
+    WHEN OLD.state != NEW.state BEGIN
+        UPDATE job_counts SET count = count - 1 WHERE state = OLD.state;
+        INSERT OR IGNORE INTO job_counts (state, count) VALUES (NEW.state, 0);
+        UPDATE job_counts SET count = count + 1 WHERE state = NEW.state;
+    END""",
+]
+_RECOUNT = "INSERT INTO job_counts (state, count) SELECT state, COUNT(*) FROM jobs GROUP BY state"
+
+class SQLiteJobStorage(BaseJobStorage):
+    """Job storage backed by a SQLite database in WAL mode"""
+
+    def __init__(self, data_dir=None, queue=DEFAULT_QUEUE):
+        self.data_dir = data_dir or get_config().get_data_dir()
+        self.queue = queue
+        self.db_file = self.data_dir / "jobs.db"
+        self._conn = None
+        self._conn_pid = None
+        self._migrate()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Return a connection owned by the current process"""
+        # Connections must not be shared across fork(), so worker
+        # processes open their own on first use
+        if self._conn is None or self._conn_pid != os.getpid():
+            # The asyncio engine makes its calls from a storage thread, one
+            # at a time, so the connection may be used off the creating thread
+            conn = sqlite3.connect(str(self.db_file), timeout=30, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn = conn
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def _migrate(self):
+        """Create the schema and add any columns missing from older databases"""
+        conn = self._connect()
+        conn.executescript(_SCHEMA)
+        existing = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+        for column, ddl, backfill in _MIGRATIONS:
+            if column not in existing:
+                conn.execute(ddl)
+                if backfill:
+                    conn.execute(backfill)
+        conn.executescript(_INDEXES)
+
+        # Create and seed the counters in one write transaction so no
+        # insert or update slips in between
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'job_counts'").fetchone():
+                for statement in _COUNTERS:
+                    conn.execute(statement)
+                conn.execute(_RECOUNT)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _job_to_row(job: Job) -> tuple:
+        data = job.to_record()
+        for column in _COLUMNS:
+            data.pop(column, None)
+        return (
+            job.id,
+            job.state.value,
+            job._created_at,
+            job._updated_at,
+            job.due_ts,
+            job.priority,
+            job.dedupe_key,
+            job.tag,
+            job.worker_id,
+            job._lease_expires_at,
+            json.dumps(data, separators=(',', ':')),
+        )
+
+    @staticmethod
+    def _row_to_job(row) -> Job:
+        job_id, state, created_at, updated_at, worker_id, lease_expires_at, data = row
+        job_data = json.loads(data)
+        job_data.update(
+            id=job_id,
+            state=state,
+            created_at=created_at,
+            updated_at=updated_at,
+            worker_id=worker_id,
+            lease_expires_at=lease_expires_at,
+        )
+        return Job.from_dict(job_data)
+
+    def add_job(self, job: Job) -> Optional[Job]:
+        """Add a new job; returns the existing job instead if it is a duplicate"""
+        if job.depends_on or job.dedupe_key:
+            return self.add_jobs([job])[0]
+        try:
+            self._connect().execute(_INSERT, self._job_to_row(job))
+        except sqlite3.IntegrityError:
+            return self.get_job(job.id)  # The primary key caught a duplicate id
+        return None
+
+    def _get_by_dedupe_key(self, key: str) -> Optional[Job]:
+        row = self._connect().execute(
+            f"{_SELECT} WHERE dedupe_key = ? ORDER BY created_at DESC LIMIT 1", (key,)
+        ).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def find_duplicates(self, jobs: List[Job]) -> List[Optional[Job]]:
+        """For each job, the stored job it duplicates or None, adding nothing"""
+        cutoff = dedupe_cutoff()
+        return [find_duplicate(job, self.get_job, self._get_by_dedupe_key, cutoff) for job in jobs]
+
+    def add_jobs(self, jobs: List[Job]) -> List[Optional[Job]]:
+        """Add several new jobs in one transaction, skipping duplicates"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            batch, batch_keys = {}, {}  # Jobs accepted earlier in this call
+            cutoff = dedupe_cutoff()
+            results, added = [], []
+            for job in jobs:
+                # Primary-key and idx_jobs_dedupe lookups, O(log n) each
+                existing = find_duplicate(
+                    job, lambda job_id: batch.get(job_id) or self.get_job(job_id),
+                    lambda key: batch_keys.get(key) or self._get_by_dedupe_key(key), cutoff)
+                results.append(existing)
+                if existing:
+                    continue
+                if job.depends_on:
+                    job.state = dependency_state(
+                        job, lambda dep: batch[dep].state.value if dep in batch else self._state_of(dep))
+                batch[job.id] = job
+                if job.dedupe_key:
+                    batch_keys[job.dedupe_key] = job
+                added.append(job)
+            conn.executemany(_INSERT, [self._job_to_row(job) for job in added])
+            conn.executemany(
+                "INSERT OR IGNORE INTO job_deps (parent_id, child_id) VALUES (?, ?)",
+                [(dep, job.id) for job in added for dep in job.depends_on],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return results
+
+    def _state_of(self, job_id: str) -> Optional[str]:
+        row = self._connect().execute("SELECT state FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row[0] if row else None
+
+    def _write(self, conn, updated_job: Job, worker_id: Optional[str]) -> bool:
+        row = self._job_to_row(updated_job)
+        if worker_id is None:
+            conn.execute(_UPDATE, row[1:] + row[:1])
+            return True
+        cursor = conn.execute(_UPDATE + _FENCE, row[1:] + row[:1] + (worker_id, JobState.PROCESSING.value))
+        return cursor.rowcount == 1
+
+    def update_job(self, updated_job: Job, worker_id: Optional[str] = None) -> bool:
+        """Update an existing job and unblock or fail its dependents
+
+        With `worker_id`, the write only applies while that worker still
+        holds the job's lease; returns False if it was dropped.
+        """
+        conn = self._connect()
+        if updated_job.state not in FINISHED_STATES and not updated_job.depends_on:
+            return self._write(conn, updated_job, worker_id)
+
+        # The job and its dependents change in one transaction
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            applied = self._update(conn, updated_job, worker_id)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return applied
+
+    def _update(self, conn, updated_job: Job, worker_id: Optional[str] = None) -> bool:
+        """Write a job's new state and its dependents'; caller must hold a write transaction"""
+        if updated_job.state == JobState.PENDING and any(
+                self._state_of(dep) not in (JobState.COMPLETED.value, None) for dep in updated_job.depends_on):
+            updated_job.state = JobState.BLOCKED  # Retried from the DLQ before its dependencies
+        if not self._write(conn, updated_job, worker_id):
+            return False
+        params = {
+            "id": updated_job.id, "now": datetime.now().timestamp(), "pending": JobState.PENDING.value,
+            "blocked": JobState.BLOCKED.value, "completed": JobState.COMPLETED.value,
+            "dead": JobState.DEAD.value,
+        }
+        if updated_job.state == JobState.COMPLETED:
+            conn.execute(_UNBLOCK, params)
+        elif updated_job.state == JobState.DEAD:
+            conn.execute(_FAIL_DEPENDENTS, params)
+        return True
+
+    def get_dependents(self, job_id: str) -> List[str]:
+        """IDs of the jobs that list `job_id` in their depends_on"""
+        rows = self._connect().execute(
+            "SELECT child_id FROM job_deps WHERE parent_id = ? ORDER BY child_id", (job_id,))
+        return [row[0] for row in rows]
+
+    def get_job(self, job_id: str) -> Optional[Job]:
+        """Get a job by ID"""
+        row = self._connect().execute(f"{_SELECT} WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def claim_batch(self, limit: int, worker_id: Optional[str] = None) -> List[Job]:
+        """Mark up to `limit` due pending jobs as processing in one operation"""
+        if limit < 1:
+            return []  # LIMIT with a negative value means no limit at all
+        conn = self._connect()
+        now = datetime.now()
+        expires = lease_expiry(now)
+        lease = (worker_id, expires.timestamp() if expires else None)
+        now = now.timestamp()
+        if _HAS_RETURNING and not load_throttles():
+            rows = conn.execute(
+                "UPDATE jobs SET state = ?, updated_at = ?, worker_id = ?, lease_expires_at = ? "
+                "WHERE id IN (SELECT id FROM jobs WHERE state = ? AND due_at <= ? "
+                f"ORDER BY priority DESC, due_at LIMIT ?) RETURNING {_ROW}",
+                (JobState.PROCESSING.value, now, *lease, JobState.PENDING.value, now, limit),
+            ).fetchall()
+            # RETURNING gives no ordering guarantee
+            return sorted(
+                (self._row_to_job(row) for row in rows),
+                key=lambda job: (-job.priority, job.due_at),
+            )
+
+        # Older SQLite, or throttles to consult job by job: take the write
+        # lock up front so select + update still behave as one atomic claim
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            with claim_gate() as gate:
+                jobs = self._pick_due(conn, gate, limit, now, lease[1])
+                conn.executemany(
+                    "UPDATE jobs SET state = ?, updated_at = ?, worker_id = ?, lease_expires_at = ? WHERE id = ?",
+                    [(JobState.PROCESSING.value, now, *lease, job.id) for job in jobs],
+                )
+                conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        for job in jobs:
+            job.mark_processing(worker_id, expires)
+        return jobs
+
+    def _pick_due(self, conn, gate, limit: int, now: float, expires: Optional[float]) -> List[Job]:
+        """Due pending jobs in claim order, up to `limit` of them that the gate admits"""
+        query = f"{_SELECT} WHERE state = ? AND due_at <= ?"
+        params = [JobState.PENDING.value, now]
+        if gate is None:
+            rows = conn.execute(f"{query} ORDER BY priority DESC, due_at LIMIT ?", (*params, limit))
+            return [self._row_to_job(row) for row in rows]
+        if not gate.queue_open(self.queue):
+            return []
+        full = gate.full_tags()
+        if full:
+            # Skip tags already out of capacity without decoding their rows
+            query += f" AND (tag IS NULL OR tag NOT IN ({', '.join('?' for _ in full)}))"
+            params.extend(full)
+        picked = []
+        for row in conn.execute(f"{query} ORDER BY priority DESC, due_at", params):
+            job = self._row_to_job(row)
+            if gate.admit(job.id, job.queue, job.tag, expires):
+                picked.append(job)
+                if len(picked) == limit:
+                    break
+        return picked
+
+    def renew_leases(self, job_ids: List[str], worker_id: Optional[str]) -> int:
+        """Extend the leases `worker_id` holds on the given jobs"""
+        expires = lease_expiry()
+        if not job_ids or expires is None:
+            return 0
+        # Touches only the lease column and its index entry, never the payload
+        cursor = self._connect().execute(
+            f"UPDATE jobs SET lease_expires_at = ? WHERE state = ? AND worker_id IS ? "
+            f"AND id IN ({', '.join('?' for _ in job_ids)})",
+            (expires.timestamp(), JobState.PROCESSING.value, worker_id, *job_ids),
+        )
+        return cursor.rowcount
+
+    def reap_expired_leases(self) -> List[Job]:
+        """Settle processing jobs whose lease ran out"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # A range scan of idx_jobs_state_lease: only expired leases are read
+            rows = conn.execute(
+                f"{_SELECT} WHERE state = ? AND lease_expires_at < ?",
+                (JobState.PROCESSING.value, datetime.now().timestamp()),
+            ).fetchall()
+            reaped = [self._row_to_job(row) for row in rows]
+            for job in reaped:
+                expire_lease(job)
+                self._update(conn, job)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return reaped
+
+    def release_jobs(self, released: List[Job], worker_id: Optional[str] = None) -> List[str]:
+        """Return claimed but unstarted jobs to the pending state; returns the IDs released"""
+        if not released:
+            return []
+        conn = self._connect()
+        placeholders = ", ".join("?" for _ in released)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            done = [row[0] for row in conn.execute(
+                f"SELECT id FROM jobs WHERE state = ? AND id IN ({placeholders}) AND (? IS NULL OR worker_id = ?)",
+                (JobState.PROCESSING.value, *(job.id for job in released), worker_id, worker_id),
+            )]
+            if done:
+                conn.execute(
+                    "UPDATE jobs SET state = ?, updated_at = ?, worker_id = NULL, lease_expires_at = NULL "
+                    f"WHERE id IN ({', '.join('?' for _ in done)})",
+                    (JobState.PENDING.value, datetime.now().timestamp(), *done),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return done
+
+    def remove_jobs(self, job_ids: List[str]) -> int:
+        """Delete the given jobs if they are still completed or dead"""
+        conn = self._connect()
+        finished = [state.value for state in FINISHED_STATES]
+        removed = 0
+        # Stay under SQLite's host-parameter limit on older builds
+        for start in range(0, len(job_ids), 500):
+            chunk = job_ids[start:start + 500]
+            cursor = conn.execute(
+                f"DELETE FROM jobs WHERE state IN (?, ?) AND id IN ({', '.join('?' for _ in chunk)})",
+                (*finished, *chunk),
+            )
+            removed += cursor.rowcount
+            # Index rows of jobs that are gone; unfinished jobs keep theirs
+            for column in ("parent_id", "child_id"):
+                conn.execute(
+                    f"DELETE FROM job_deps WHERE {column} IN ({', '.join('?' for _ in chunk)}) "
+                    f"AND NOT EXISTS (SELECT 1 FROM jobs WHERE id = job_deps.{column})",
+                    chunk,
+                )
+        return removed
+
+    def get_jobs_by_state(self, state: JobState) -> List[Job]:
+        """Get all jobs with a specific state"""
+        rows = self._connect().execute(
+            f"{_SELECT} WHERE state = ? ORDER BY created_at", (state.value,)
+        )
+        return [self._row_to_job(row) for row in rows]
+
+    def get_all_jobs(self) -> List[Job]:
+        """Get all jobs"""
+        rows = self._connect().execute(f"{_SELECT} ORDER BY rowid")
+        return [self._row_to_job(row) for row in rows]
+
+    def iter_jobs(self, state=None, since=None, until=None, command_contains=None,
+                  sort='created_at', descending=False, limit=None) -> Iterator[Job]:
+        """Yield matching jobs in `sort` order, streaming rows from the cursor"""
+        sort_key(sort)  # Validates the column name before it reaches the SQL
+        clauses, params = [], []
+        if state:
+            clauses.append("state = ?")
+            params.append(state.value)
+        if since:
+            clauses.append("created_at >= ?")
+            params.append(since.timestamp())
+        if until:
+            clauses.append("created_at < ?")
+            params.append(until.timestamp())
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        direction = "DESC" if descending else "ASC"
+        sql = f"{_SELECT}{where} ORDER BY {sort} {direction}, id {direction}"
+        if limit is not None and not command_contains:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        # The command lives in the JSON payload, so that filter runs here
+        # while rows stream in; the cursor is only read as far as needed
+        yielded = 0
+        for row in self._connect().execute(sql, params):
+            job = self._row_to_job(row)
+            if command_contains and not job_matches(job, command_contains=command_contains):
+                continue
+            yield job
+            yielded += 1
+            if limit is not None and yielded >= limit:
+                return
+
+    def get_job_stats(self) -> dict:
+        """Get the number of jobs in each state from the trigger-maintained counters"""
+        stats = {state.value: 0 for state in JobState}
+        for state, count in self._connect().execute("SELECT state, count FROM job_counts"):
+            stats[state] = count
+        return stats
+
+    def count_job_states(self) -> dict:
+        """Count jobs per state with a full scan, leaving the counters untouched"""
+        counts = {state.value: 0 for state in JobState}
+        for state, count in self._connect().execute("SELECT state, COUNT(*) FROM jobs GROUP BY state"):
+            counts[state] = count
+        return counts
+
+    def recount_job_stats(self) -> dict:
+        """Recount jobs per state with a full scan and reset the counters"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM job_counts")
+            conn.execute(_RECOUNT)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return self.get_job_stats()
+
+    def get_backlog(self) -> dict:
+        """Count due pending jobs and find the oldest due time"""
+        count, oldest = self._connect().execute(
+            "SELECT COUNT(*), MIN(due_at) FROM jobs WHERE state = ? AND due_at <= ?",
+            (JobState.PENDING.value, datetime.now().timestamp()),
+        ).fetchone()
+        return {
+            "pending": count,
+            "oldest_due_at": datetime.fromtimestamp(oldest) if oldest is not None else None,
+        }
+
+    def compact(self) -> int:
+        """Checkpoint the WAL into the main database file"""
+        _, _, checkpointed = self._connect().execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+        return max(checkpointed, 0)
@@ -0,0 +1,252 @@
+import json
+import os
+import re
+import time
+from contextlib import contextmanager
+from typing import Optional
+from ..config import get_config
+from .locking import exclusive_lock
+
+# `queue:<name>` or `tag:<name>`; names follow the queue name rule
+_TARGET = re.compile(r'^(queue|tag):([A-Za-z0-9_-]{1,64})$')
+
+# Rate suffixes and the seconds they stand for
+_PERIODS = {'s': 1, 'm': 60, 'h': 3600}
+
+# throttles.json contents keyed by (path, mtime), so claims parse it once
+_cache = {}
+
+def _data_dir():
+    return get_config().get_data_dir()
+
+def _throttles_file():
+    return _data_dir() / "throttles.json"
+
+def _state_file():
+    return _data_dir() / "throttle_state.json"
+
+def parse_target(target: str) -> str:
+    """Validate a `queue:<name>` / `tag:<name>` throttle target"""
+    if not _TARGET.match(target or ''):
+        raise ValueError(f"Invalid throttle target '{target}': use queue:<name> or tag:<name>")
+    return target
+
+def validate_tag(tag) -> str:
+    """Return the job tag, or raise ValueError if it cannot name a throttle"""
+    if not isinstance(tag, str) or not _TARGET.match(f"tag:{tag}"):
+        raise ValueError(f"Invalid tag: {tag!r} (use letters, digits, '-' and '_')")
+    return tag
+
+def parse_rate(rate: str) -> float:
+    """Jobs per second from `N`, `N/s`, `N/m` or `N/h`"""
+    count, _, period = str(rate).partition('/')
+    try:
+        value = float(count) / _PERIODS[period or 's']
+    except (KeyError, ValueError):
+        raise ValueError(f"Invalid rate '{rate}': use N/s, N/m or N/h")
+    if value <= 0:
+        raise ValueError(f"Rate must be positive: {rate}")
+    return value
+
+def load_throttles() -> dict:
+    """Registered throttles: target -> {"rate", "burst", "max_in_flight"}"""
+    path = _throttles_file()
+    try:
+        mtime = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return {}
+    if _cache.get('key') != (path, mtime):
+        with open(path, 'r') as f:
+            _cache['throttles'] = json.load(f)
+        _cache['key'] = (path, mtime)
+    return _cache['throttles']
+
+def _write_json(path, data, **options):
+    tmp_file = path.with_suffix('.tmp')
+    with open(tmp_file, 'w') as f:
+        json.dump(data, f, **options)
+    os.replace(tmp_file, path)
+
+def set_throttle(target: str, rate=None, burst=None, max_in_flight=None) -> dict:
+    """Register or replace the limits on a queue or tag"""
+    parse_target(target)
+    if rate is None and max_in_flight is None:
+        raise ValueError("A throttle needs a rate, a max in-flight count or both")
+    if burst is not None and rate is None:
+        raise ValueError("Burst only applies together with a rate")
+    for name, value in (('burst', burst), ('max in-flight', max_in_flight)):
+        if value is not None and value < 1:
+            raise ValueError(f"The {name} must be at least 1")
+    limits = {}
+    if rate is not None:
+        limits['rate'] = parse_rate(rate)
+        limits['burst'] = burst or max(1, int(limits['rate']))
+    if max_in_flight is not None:
+        limits['max_in_flight'] = max_in_flight
+    with exclusive_lock(_throttles_file().with_suffix('.lock')):
+        throttles = dict(load_throttles())
+        throttles[target] = limits
+        _write_json(_throttles_file(), throttles, indent=2)
+    return limits
+
+def remove_throttle(target: str) -> bool:
+    """Unregister a throttle; returns False if it did not exist"""
+    with exclusive_lock(_throttles_file().with_suffix('.lock')):
+        throttles = dict(load_throttles())
+        if throttles.pop(target, None) is None:
+            return False
+        _write_json(_throttles_file(), throttles, indent=2)
+    return True
+
+def _targets(queue, tag):
+    targets = [f"queue:{queue}"]
+    if tag:
+        targets.append(f"tag:{tag}")
+    return targets
+
+class ClaimGate:
+    """Shared token buckets and in-flight counts, consulted job by job during a claim
+
+    The state lives in `throttle_state.json` under `throttle.lock`, so every
+    worker process and backend draws from the same buckets. In-flight jobs
+    are recorded with their lease expiry: a worker that dies without
+    finishing them stops counting against the cap once its lease runs out.
+    """
+
+    def __init__(self, throttles: dict, state: dict, now: float):
+        self.throttles = throttles
+        self.buckets = state.setdefault('buckets', {})
+        self.in_flight = state.setdefault('in_flight', {})
+        self.state = state
+        self.now = now
+        self.changed = False
+        self._full = set()  # Targets with no capacity left in this claim
+        for target, jobs in self.in_flight.items():
+            expired = [job_id for job_id, expires in jobs.items() if expires is not None and expires < now]
+            for job_id in expired:
+                del jobs[job_id]
+            self.changed |= bool(expired)
+
+    def _tokens(self, target, limits) -> float:
+        """Refill a target's bucket up to now"""
+        tokens, at = self.buckets.get(target, (limits['burst'], self.now))
+        return min(limits['burst'], tokens + (self.now - at) * limits['rate'])
+
+    def _has_room(self, target) -> bool:
+        limits = self.throttles.get(target)
+        if not limits:
+            return True
+        if 'max_in_flight' in limits and len(self.in_flight.get(target, ())) >= limits['max_in_flight']:
+            return False
+        return 'rate' not in limits or self._tokens(target, limits) >= 1
+
+    def queue_open(self, queue: str) -> bool:
+        """Whether the queue's own throttle has room, checked before a storage scans anything"""
+        return self._has_room(f"queue:{queue}")
+
+    def full_tags(self) -> list:
+        """Throttled tags with no capacity left, for storages to filter out up front"""
+        return [target[4:] for target in self.throttles
+                if target.startswith('tag:') and not self._has_room(target)]
+
+    def admit(self, job_id: str, queue: str, tag: Optional[str], expires: Optional[float]) -> bool:
+        """Take a token and an in-flight slot for the job, or refuse it"""
+        targets = _targets(queue, tag)
+        if any(target in self._full for target in targets):
+            return False
+        full = [target for target in targets if not self._has_room(target)]
+        if full:
+            self._full.update(full)
+            return False
+        for target in targets:
+            limits = self.throttles.get(target)
+            if not limits:
+                continue
+            if 'rate' in limits:
+                self.buckets[target] = (self._tokens(target, limits) - 1, self.now)
+            if 'max_in_flight' in limits:
+                self.in_flight.setdefault(target, {})[job_id] = expires
+            self.changed = True
+        return True
+
+@contextmanager
+def _locked_state():
+    with exclusive_lock(_data_dir() / "throttle.lock"):
+        try:
+            with open(_state_file(), 'r') as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            state = {}
+        yield state
+
+@contextmanager
+def claim_gate():
+    """Gate for one claim, or None when no throttles are registered
+
+    Storages open it inside their own claim lock, so the lock order is
+    always storage first, then throttle state. The state is saved only if
+    the claim completes.
+    """
+    throttles = load_throttles()
+    if not throttles:
+        yield None
+        return
+    with _locked_state() as state:
+        gate = ClaimGate(throttles, state, time.time())
+        yield gate
+        if gate.changed:
+            _write_json(_state_file(), state)
+
+def _update_in_flight(job_ids, update) -> bool:
+    """Apply `update(jobs, job_id)` to every in-flight entry of the given jobs"""
+    if not load_throttles() or not job_ids:
+        return False
+    changed = False
+    with _locked_state() as state:
+        for jobs in state.get('in_flight', {}).values():
+            for job_id in job_ids:
+                if job_id in jobs:
+                    update(jobs, job_id)
+                    changed = True
+        if changed:
+            _write_json(_state_file(), state)
+    return changed
+
+def release_in_flight(job_ids) -> bool:
+    """Free the in-flight slots of jobs that finished or went back to the queue"""
+    return _update_in_flight(set(job_ids), lambda jobs, job_id: jobs.pop(job_id))
+
+def renew_in_flight(job_ids, expires: Optional[float]):
+    """Keep in-flight slots alive alongside the renewed leases"""
+    _update_in_flight(set(job_ids), lambda jobs, job_id: jobs.__setitem__(job_id, expires))
+
+def next_token_in() -> Optional[float]:
+    """Seconds until the soonest empty bucket holds a token again, None if none is empty"""
+    throttles = load_throttles()
+    if not any('rate' in limits for limits in throttles.values()):
+        return None
+    with _locked_state() as state:
+        buckets = state.get('buckets', {})
+    now = time.time()
+    waits = []
+    for target, (tokens, at) in buckets.items():
+        limits = throttles.get(target)
+        if limits and 'rate' in limits:
+            tokens = min(limits['burst'], tokens + (now - at) * limits['rate'])
+            if tokens < 1:
+                waits.append((1 - tokens) / limits['rate'])
+    return min(waits) if waits else None
+
+def throttle_status() -> dict:
+    """Current tokens and in-flight counts per registered throttle"""
+    throttles = load_throttles()
+    with _locked_state() as state:
+        gate = ClaimGate(throttles, state, time.time())
+    return {
+        target: {
+            **limits,
+            "tokens": gate._tokens(target, limits) if 'rate' in limits else None,
+            "in_flight": len(gate.in_flight.get(target, ())),
+        }
+        for target, limits in throttles.items()
+    }
@@ -0,0 +1,148 @@
+import math
+import multiprocessing
+import os
+import signal
+import time
+from datetime import datetime
+from .scheduler import Scheduler
+
+# Seconds workers get to finish their jobs on shutdown before they are
+# killed; below the 30s `worker stop` waits for the supervisor
+SHUTDOWN_TIMEOUT = 20
+
+class WorkerSupervisor:
+    """Grow and shrink a worker pool with queue depth and claim latency
+
+    Every `autoscale_interval` seconds the supervisor samples the number of
+    due pending jobs and how long the oldest one has been waiting. It sizes
+    the pool at one worker per `autoscale_backlog_per_worker` due jobs (plus
+    one more while the wait exceeds `autoscale_max_latency`), scales up at
+    once, and only scales down after `autoscale_scale_down_after` low samples
+    in a row. Workers that exit unexpectedly are respawned.
+    """
+
+    def __init__(self, manager, min_workers, max_workers, target, args=()):
+        self.manager = manager
+        self.queue = manager.queue
+        self.config = manager.config
+        self.min_workers = max(0, min_workers)
+        self.max_workers = max(self.min_workers, max_workers, 1)
+        self.target = target
+        self.args = args
+        self.workers = []     # live worker processes, oldest first
+        self.retiring = []    # workers asked to stop, not yet exited
+        self.low_samples = 0
+        self.running = True
+        self.pid_file = manager.config.get_data_dir() / "supervisor.pid"
+
+    def _spawn(self):
+        p = multiprocessing.Process(target=self.target, args=self.args)
+        p.start()
+        self.workers.append(p)
+
+    def _retire(self):
+        # Newest worker first; SIGTERM lets it finish its current job
+        p = self.workers.pop()
+        p.terminate()
+        self.retiring.append(p)
+
+    def _reap(self):
+        """Forget exited workers and respawn any that crashed"""
+        self.retiring = [p for p in self.retiring if p.is_alive()]
+        for p in [p for p in self.workers if not p.is_alive()]:
+            self.workers.remove(p)
+            p.join()
+            print(f"Worker {p.pid} exited unexpectedly (code {p.exitcode}), respawning")
+            self._spawn()
+
+    def desired_size(self, backlog, now=None):
+        """Pool size wanted for a backlog sample"""
+        pending = backlog.get("pending", 0)
+        oldest = backlog.get("oldest_due_at")
+        latency = ((now or datetime.now()) - oldest).total_seconds() if oldest else 0
+
+        per_worker = max(1, self.config.get("autoscale_backlog_per_worker", 5))
+        wanted = math.ceil(pending / per_worker)
+        if latency > self.config.get("autoscale_max_latency", 10):
+            wanted = max(wanted, len(self.workers) + 1)
+        return min(self.max_workers, max(self.min_workers, wanted))
+
+    def _scale(self):
+        desired = self.desired_size(self.queue.get_backlog())
+        current = len(self.workers)
+        if desired > current:
+            self.low_samples = 0
+            for _ in range(desired - current):
+                self._spawn()
+            print(f"Scaled up to {len(self.workers)} worker(s)")
+        elif desired < current:
+            # Hysteresis: only shrink after several low samples in a row
+            self.low_samples += 1
+            if self.low_samples >= self.config.get("autoscale_scale_down_after", 3):
+                self.low_samples = 0
+                self._retire()
+                print(f"Scaled down to {len(self.workers)} worker(s)")
+        else:
+            self.low_samples = 0
+
+    def _kill(self, p):
+        """Kill a worker that ignored SIGTERM, and the process groups of the jobs it runs"""
+        try:
+            import psutil
+        except ImportError:
+            psutil = None  # Its jobs outlive it; their leases expire and they are reaped
+        if psutil:
+            try:
+                children = psutil.Process(p.pid).children()
+            except psutil.NoSuchProcess:
+                children = []
+            for child in children:
+                self.manager.kill_process_group(child)
+        p.kill()
+
+    def _save_pids(self):
+        with open(self.manager.pid_file, 'w') as f:
+            f.write('\n'.join(str(p.pid) for p in self.workers))
+
+    def run(self):
+        """Supervise the pool until interrupted"""
+        def signal_handler(sig, frame):
+            print("\nGracefully shutting down supervisor...")
+            self.running = False
+
+        for _ in range(self.min_workers):
+            self._spawn()
+        # Install handlers after forking so workers keep their own
+        signal.signal(signal.SIGINT, signal_handler)
+        if hasattr(signal, 'SIGTERM'):
+            signal.signal(signal.SIGTERM, signal_handler)
+
+        with open(self.pid_file, 'w') as f:
+            f.write(str(os.getpid()))
+        print(f"Supervisor started (PID: {os.getpid()}), {self.min_workers}-{self.max_workers} worker(s)")
+
+        interval = self.config.get("autoscale_interval", 5)
+        scheduler = Scheduler()
+        try:
+            while self.running:
+                self._reap()
+                self._scale()
+                self._save_pids()
+                # Between samples, move scheduled jobs into the queues as they fall due
+                deadline = time.time() + interval
+                scheduler.run_while(lambda: self.running and time.time() < deadline, min(0.5, interval))
+        finally:
+            for p in self.workers:
+                p.terminate()
+            deadline = time.time() + SHUTDOWN_TIMEOUT
+            for p in self.workers + self.retiring:
+                p.join(max(0, deadline - time.time()))
+            for p in self.workers + self.retiring:
+                if p.is_alive():
+                    print(f"Worker {p.pid} did not stop within {SHUTDOWN_TIMEOUT}s, killing it")
+                    self._kill(p)
+                    p.join()
+            for pid_file in (self.pid_file, self.manager.pid_file):
+                if pid_file.exists():
+                    pid_file.unlink()
+        print("Supervisor stopped")
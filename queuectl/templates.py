@@ -0,0 +1,86 @@
+import json
+import os
+import re
+import shlex
+from .config import get_config
+from .storage.locking import exclusive_lock
+
+# Same rule as queue names: safe in file names and on the command line
+_TEMPLATE_NAME = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+# templates.json contents keyed by (path, mtime), so workers parse it once
+_cache = {}
+
+def _templates_file():
+    return get_config().get_data_dir() / "templates.json"
+
+def load_templates() -> dict:
+    """Registered templates: name -> command pattern"""
+    path = _templates_file()
+    try:
+        mtime = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return {}
+    if _cache.get('key') != (path, mtime):
+        with open(path, 'r') as f:
+            _cache['templates'] = json.load(f)
+        _cache['key'] = (path, mtime)
+    return _cache['templates']
+
+def _save_templates(templates: dict):
+    path = _templates_file()
+    tmp_file = path.with_suffix('.tmp')
+    with open(tmp_file, 'w') as f:
+        json.dump(templates, f, indent=2)
+    os.replace(tmp_file, path)
+
+def add_template(name: str, command: str):
+    """Register or replace a command template"""
+    if not _TEMPLATE_NAME.match(name):
+        raise ValueError(f"Invalid template name '{name}': use letters, digits, '-' and '_' (max 64)")
+    try:
+        split_template(command)
+    except ValueError as e:
+        raise ValueError(f"Invalid template command: {e}")
+    with exclusive_lock(_templates_file().with_suffix('.lock')):
+        templates = dict(load_templates())
+        templates[name] = command
+        _save_templates(templates)
+
+def remove_template(name: str) -> bool:
+    """Unregister a template; returns False if it did not exist"""
+    with exclusive_lock(_templates_file().with_suffix('.lock')):
+        templates = dict(load_templates())
+        if templates.pop(name, None) is None:
+            return False
+        _save_templates(templates)
+    return True
+
+def split_template(command: str) -> list:
+    """Split a template into argv tokens; placeholders are filled per token"""
+    tokens = shlex.split(command)
+    if not tokens:
+        raise ValueError("template is empty")
+    return tokens
+
+def render_template(name: str, params: dict) -> list:
+    """Argv for a template with its {placeholders} filled from params"""
+    templates = load_templates()
+    if name not in templates:
+        raise ValueError(f"Unknown template '{name}'")
+    try:
+        # Each parameter lands inside a single argument, so values are never
+        # re-split or interpreted by a shell
+        return [token.format_map(params) for token in split_template(templates[name])]
+    except KeyError as e:
+        raise ValueError(f"Template '{name}' needs parameter {e}")
+    except (IndexError, ValueError) as e:
+        raise ValueError(f"Template '{name}' could not be rendered: {e}")
+
+def job_argv(job):
+    """Argv to exec for `args` and template jobs, None for shell commands"""
+    if job.args:
+        return list(job.args)
+    if job.template:
+        return render_template(job.template, job.params or {})
+    return None
@@ -0,0 +1,131 @@
+import os
+import select
+import socket
+import time
+from .config import get_config
+from .storage.throttle import next_token_in
+
+# First idle wait after a worker runs out of jobs; it doubles up to worker_idle_max
+_FIRST_IDLE_WAIT = 0.05
+
+def _wakeup_dir():
+    return get_config().get_data_dir() / "wakeup"
+
+def notify_workers():
+    """Wake every idle worker on this data dir; never blocks
+
+    Each worker listens on a Unix datagram socket in `wakeup/`, so a
+    notification is one `sendto` per worker and no worker has to poll.
+    """
+    directory = _wakeup_dir()
+    if not hasattr(socket, 'AF_UNIX') or not directory.exists():
+        return
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    sock.setblocking(False)
+    try:
+        for path in directory.glob('*.sock'):
+            try:
+                sock.sendto(b'\0', str(path))
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Left behind by a worker that was killed
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+            except OSError:
+                pass  # Buffer full: the worker already has wakeups waiting
+    finally:
+        sock.close()
+
+class Wakeup:
+    """A worker's end of `notify_workers`: wait until notified or a timeout passes
+
+    Where Unix sockets are unavailable (or the socket path is too long),
+    waiting falls back to plain sleeping, so the idle backoff alone bounds
+    pickup latency.
+    """
+
+    def __init__(self):
+        self.sock = None
+        self.path = None
+        self._woken = False
+        if not hasattr(socket, 'AF_UNIX'):
+            return
+        directory = _wakeup_dir()
+        directory.mkdir(exist_ok=True)
+        path = directory / f"{os.getpid()}.sock"
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            if path.exists():
+                path.unlink()  # From an earlier process with the same PID
+            sock.bind(str(path))
+        except OSError:
+            sock.close()
+            return
+        sock.setblocking(False)
+        self.sock, self.path = sock, path
+
+    def fileno(self):
+        return self.sock.fileno() if self.sock else None
+
+    def drain(self):
+        """Discard pending notifications; one wakeup covers them all"""
+        try:
+            while True:
+                self.sock.recv(64)
+        except OSError:
+            pass
+
+    def wait(self, timeout) -> bool:
+        """Block until notified or `timeout` seconds pass; True if notified"""
+        if self.sock:
+            ready, _, _ = select.select([self.sock], [], [], timeout)
+            self.drain()
+            return bool(ready)
+        deadline = time.monotonic() + timeout
+        while not self._woken and time.monotonic() < deadline:
+            time.sleep(min(0.25, max(0, deadline - time.monotonic())))
+        woken, self._woken = self._woken, False
+        return woken
+
+    def wake(self):
+        """Cut the current wait short, e.g. from a signal handler"""
+        self._woken = True
+        if self.sock:
+            try:
+                self.sock.sendto(b'\0', str(self.path))
+            except OSError:
+                pass
+
+    def close(self):
+        if self.sock:
+            self.sock.close()
+            try:
+                self.path.unlink()
+            except FileNotFoundError:
+                pass
+            self.sock = None
+
+class IdleBackoff:
+    """Exponential wait between empty claims, capped at `worker_idle_max`
+
+    Notified workers wake at once, so the cap mostly bounds how late a
+    worker notices retries and jobs that became due on their own.
+    """
+
+    def __init__(self):
+        self.maximum = max(_FIRST_IDLE_WAIT, get_config().get("worker_idle_max", 5))
+        self.delay = _FIRST_IDLE_WAIT
+
+    def reset(self):
+        self.delay = _FIRST_IDLE_WAIT
+
+    def next(self) -> float:
+        delay = self.delay
+        self.delay = min(self.delay * 2, self.maximum)
+        # Nobody is notified when a token bucket refills, so a worker held
+        # back by a rate limit checks again once the next token is due
+        refill = next_token_in()
+        if refill is not None:
+            delay = min(delay, max(refill, _FIRST_IDLE_WAIT))
+        return delay
@@ -1,91 +1,256 @@
+import random
 import subprocess
+import threading
 import time
 import signal
 import sys
 import os
+from collections import deque
+from datetime import datetime
 from pathlib import Path
 from .job_queue import JobQueue
-from .job import JobState
+from .async_worker import AsyncWorker
+from .callable_pool import CallablePool
+from .scheduler import Scheduler
+from .supervisor import WorkerSupervisor
 from .config import get_config
+from .job_log import open_log_writer
+from .leases import LeaseKeeper
+from .limits import limit_argv, resolve_limits
+from .templates import job_argv
+from .wakeup import IdleBackoff, Wakeup
 
 class WorkerManager:
-    def __init__(self):
-        self.queue = JobQueue()
+    def __init__(self, queues=None):
+        self.queue = JobQueue(queues)
         self.config = get_config()
         self.running = True
         self.pid_file = self.config.get_data_dir() / "workers.pid"
+        self.callable_pool = CallablePool()
     
     def calculate_backoff(self, attempts):
-        """Calculate exponential backoff delay"""
+        """Calculate exponential backoff delay with optional jitter and cap"""
         base = self.config.get("backoff_base", 2)
-        return base ** attempts
+        delay = base ** attempts
+        jitter = self.config.get("retry_jitter", 0)
+        if jitter:
+            delay *= random.uniform(1 - jitter, 1 + jitter)
+        max_backoff = self.config.get("max_backoff", 0)
+        if max_backoff:
+            delay = min(delay, max_backoff)
+        # A retry is never due before the failure that caused it
+        return max(0, delay)
+    
+    def get_timeout(self, job):
+        """Seconds the job may run before it is killed, None for no limit"""
+        return resolve_limits(job)['timeout'] or None
+    
+    @staticmethod
+    def kill_process_group(proc):
+        """Kill a job's shell together with everything it started"""
+        try:
+            if sys.platform != 'win32':
+                os.killpg(proc.pid, signal.SIGKILL)
+            else:
+                proc.kill()
+        except ProcessLookupError:
+            pass
+    
+    def _wait(self, proc, timeout):
+        """Wait for a job's shell, killing its process group on timeout
+
+        Returns (timed_out, rusage). Reaping with wait4 reports the CPU time
+        and peak RSS of the shell and every child it waited for.
+        """
+        if not hasattr(os, 'wait4'):
+            try:
+                proc.wait(timeout=timeout)
+                return False, None
+            except subprocess.TimeoutExpired:
+                self.kill_process_group(proc)
+                proc.wait()
+                return True, None
+        
+        reaped = {}
+        def reap():
+            _, status, reaped['usage'] = os.wait4(proc.pid, 0)
+            proc.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+        
+        waiter = threading.Thread(target=reap, daemon=True)
+        waiter.start()
+        waiter.join(timeout)
+        timed_out = waiter.is_alive()
+        if timed_out:
+            self.kill_process_group(proc)
+            waiter.join()
+        return timed_out, reaped.get('usage')
     
     def execute_job(self, job):
-        """Execute a job command"""
+        """Execute a job command under its resource limits, streaming output to its log file"""
+        if job.callable:
+            return self.callable_pool.run(job, self.get_timeout(job))
+        log = open_log_writer(job)
+        started_at, start = datetime.now(), time.monotonic()
         try:
-            result = subprocess.run(
-                job.command,
-                shell=True,
-                capture_output=True,
-                text=True,
-                timeout=300
+            # argv jobs skip the intermediate /bin/sh unless limits need it
+            argv = job_argv(job)
+            argv = limit_argv(argv or ['/bin/sh', '-c', job.command], resolve_limits(job)) or argv
+            proc = subprocess.Popen(
+                argv or job.command,
+                shell=argv is None,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                # Own process group so a kill reaches the job's children
+                start_new_session=(sys.platform != 'win32'),
             )
-            return result.returncode == 0, result.stdout, result.stderr
-        except subprocess.TimeoutExpired:
-            return False, "", "Job timed out"
         except Exception as e:
-            return False, "", str(e)
+            log.write(f"{e}\n".encode())
+            job.record_attempt(started_at, time.monotonic() - start, None)
+            job.log_path = str(log.close())
+            return False
+        
+        # Output goes to disk chunk by chunk instead of piling up in memory
+        reader = threading.Thread(target=log.copy_from, args=(proc.stdout,), daemon=True)
+        reader.start()
+        timeout = self.get_timeout(job)
+        timed_out, usage = self._wait(proc, timeout)
+        # A child left running in the background can hold the output pipe
+        # open after the shell exits; it gets what is left of the timeout,
+        # then the job's process group is killed so the reader sees EOF
+        reader.join(None if timeout is None else max(0, timeout - (time.monotonic() - start)))
+        if reader.is_alive():
+            timed_out = True
+            self.kill_process_group(proc)
+            reader.join(1)
+        duration = time.monotonic() - start
+        if not reader.is_alive():
+            # Still blocked only if a child left the process group; closing
+            # the pipe under a blocked read would hang on its buffer lock
+            proc.stdout.close()
+        if timed_out:
+            log.write(b"\nJob timed out\n")
+        
+        cpu_seconds = max_rss_kb = None
+        if usage:
+            cpu_seconds = usage.ru_utime + usage.ru_stime
+            # ru_maxrss is in kilobytes on Linux and bytes on macOS
+            max_rss_kb = usage.ru_maxrss // 1024 if sys.platform == 'darwin' else usage.ru_maxrss
+        job.record_attempt(started_at, duration, proc.returncode, cpu_seconds, max_rss_kb)
+        job.log_path = str(log.close())
+        return proc.returncode == 0 and not timed_out
     
     def process_job(self, job):
         """Process a single job with retry logic"""
         job.increment_attempt()
         
-        success, stdout, stderr = self.execute_job(job)
-        
+        success = self.execute_job(job)
+        self.finish_job(job, success)
+    
+    def finish_job(self, job, success):
+        """Record the outcome of an attempt: complete, schedule a retry or move to DLQ"""
+        worker_id = job.worker_id
+        job.clear_lease()
         if success:
             job.mark_completed()
-            print(f"✓ Job {job.id} completed successfully")
+            message = f"✓ Job {job.id} completed successfully"
+        elif job.should_retry():
+            # Record when the retry is due instead of sleeping, so this
+            # worker can move on to other jobs in the meantime
+            delay = self.calculate_backoff(job.attempts)
+            job.schedule_retry(delay)
+            message = f"✗ Job {job.id} failed (attempt {job.attempts}/{job.max_retries}). Retry scheduled in {delay:g}s"
         else:
-            if job.should_retry():
-                job.mark_failed()
-                delay = self.calculate_backoff(job.attempts)
-                print(f"✗ Job {job.id} failed (attempt {job.attempts}/{job.max_retries}). Retrying in {delay}s...")
-                time.sleep(delay)
-                job.state = JobState.PENDING
-            else:
-                job.mark_dead()
-                print(f"☠ Job {job.id} moved to DLQ after {job.attempts} attempts")
+            job.mark_dead()
+            message = f"☠ Job {job.id} moved to DLQ after {job.attempts} attempts"
         
-        self.queue.update_job(job)
+        # Fenced by the lease: if it expired and the job was reaped, this
+        # worker's outcome is stale and must not overwrite the new state
+        if self.queue.update_job(job, worker_id):
+            print(message)
+        else:
+            print(f"⚠ Job {job.id} lease was lost before it finished; result discarded")
     
-    def run_worker(self):
+    def run_worker(self, prefetch=1):
         """Main worker loop"""
         print(f"Worker started (PID: {os.getpid()})")
+        leased = deque()
+        keeper = LeaseKeeper(self.queue.queues)
+        keeper.start()
+        wakeup = Wakeup()
+        backoff = IdleBackoff()
         
         def signal_handler(sig, frame):
             print("\nGracefully shutting down worker...")
             self.running = False
+            wakeup.wake()
         
         signal.signal(signal.SIGINT, signal_handler)
         if hasattr(signal, 'SIGTERM'):
             signal.signal(signal.SIGTERM, signal_handler)
         
         while self.running:
-            job = self.queue.get_next_job()
-            if job:
-                self.process_job(job)
+            if not leased:
+                # Lease up to `prefetch` jobs per storage round-trip
+                try:
+                    leased.extend(self.queue.claim_batch(prefetch, keeper.worker_id))
+                except ConnectionError as e:
+                    # A claim whose reply was lost leases jobs nobody runs;
+                    # their leases lapse and the reaper requeues them
+                    print(f"Storage unavailable ({e}); retrying")
+                    wakeup.wait(backoff.next())
+                    continue
+                keeper.hold(leased)
+            if leased:
+                backoff.reset()
+                job = leased.popleft()
+                try:
+                    self.process_job(job)
+                except ConnectionError as e:
+                    # Dropping the lease lets the reaper run the job again
+                    print(f"⚠ Job {job.id} outcome not recorded ({e}); it runs again once its lease expires")
+                finally:
+                    keeper.drop(job)
             else:
-                time.sleep(1)
+                # Enqueues wake us at once; the growing timeout covers
+                # retries and scheduled jobs that become due on their own
+                wakeup.wait(backoff.next())
+        
+        if leased:
+            try:
+                returned = self.queue.release_jobs(list(leased), keeper.worker_id)
+                print(f"Returned {returned} unstarted job(s) to the queue")
+            except ConnectionError as e:
+                print(f"Could not return {len(leased)} unstarted job(s) ({e}); they run again once their leases expire")
         
+        wakeup.close()
+        keeper.stop()
+        self.callable_pool.shutdown()
         print("Worker stopped")
     
-    def start_workers(self, count):
+    def run_async_worker(self, concurrency):
+        """Worker loop running up to `concurrency` jobs at once on asyncio"""
+        AsyncWorker(self, concurrency).run()
+    
+    def _worker_target(self, prefetch, engine, concurrency):
+        """Worker entry point and arguments for an execution engine"""
+        if engine == 'asyncio':
+            return self.run_async_worker, (concurrency,)
+        return self.run_worker, (prefetch,)
+    
+    def start_autoscaled(self, min_workers, max_workers, prefetch=1, engine='process', concurrency=1):
+        """Run a supervisor that sizes the worker pool to the backlog"""
+        target, args = self._worker_target(prefetch, engine, concurrency)
+        WorkerSupervisor(self, min_workers, max_workers, target, args).run()
+    
+    def start_workers(self, count, prefetch=1, engine='process', concurrency=1):
         """Start multiple worker processes"""
         import multiprocessing
         
+        target, args = self._worker_target(prefetch, engine, concurrency)
+        
         pids = []
         for i in range(count):
-            p = multiprocessing.Process(target=self.run_worker)
+            p = multiprocessing.Process(target=target, args=args)
             p.start()
             pids.append(p.pid)
         
@@ -95,12 +260,41 @@ class WorkerManager:
         
         print(f"Started {count} worker(s)")
         
-        # Wait for all workers
-        for p in multiprocessing.active_children():
-            p.join()
+        # Run the scheduler until all workers have exited
+        Scheduler().run_while(lambda: multiprocessing.active_children())
     
     def stop_workers(self):
         """Stop all running workers"""
+        supervisor_pid_file = self.config.get_data_dir() / "supervisor.pid"
+        if supervisor_pid_file.exists():
+            # The supervisor would respawn its workers, so stop it instead;
+            # it shuts its pool down on the way out
+            with open(supervisor_pid_file, 'r') as f:
+                supervisor_pid = int(f.read().strip() or 0)
+            try:
+                import psutil
+            except ImportError:
+                print("psutil not installed. Please stop the supervisor manually or install psutil.")
+                print(f"Supervisor PID: {supervisor_pid}")
+                return
+            try:
+                p = psutil.Process(supervisor_pid)
+                p.terminate()
+                # Poll rather than wait(): an exited supervisor stays a
+                # zombie until its own parent reaps it
+                deadline = time.time() + 30
+                while p.status() != psutil.STATUS_ZOMBIE:
+                    if time.time() > deadline:
+                        print(f"Supervisor (PID: {supervisor_pid}) did not stop within 30s")
+                        return
+                    time.sleep(0.1)
+            except psutil.NoSuchProcess:
+                pass
+            if supervisor_pid_file.exists():
+                supervisor_pid_file.unlink()
+            print(f"Stopped supervisor (PID: {supervisor_pid})")
+            return
+        
         if not self.pid_file.exists():
             print("No workers running")
             return
@@ -5,10 +5,14 @@ Validates core functionality
 """
 
 import subprocess
+import signal
+import socket
 import time
 import json
 import sys
 import os
+from datetime import datetime, timedelta, timezone
+from queuectl.storage.daemon_storage import encode_frame
 
 def run_command(cmd):
     """Run a shell command and return output"""
@@ -63,12 +67,8 @@ def test_worker_basic():
     run_command('queuectl enqueue \'{"id":"worker_test","command":"echo Worker Test"}\'')
     
     # Start worker in background
-    import multiprocessing
-    def run_worker():
-        os.system('timeout 5 queuectl worker start 2>/dev/null || true')
-    
-    p = multiprocessing.Process(target=run_worker)
-    p.start()
+    worker = subprocess.Popen('queuectl worker start', shell=True, start_new_session=True,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
     
     # Wait for job to process
     time.sleep(3)
@@ -76,9 +76,9 @@ def test_worker_basic():
     # Check if job completed
     code, out, err = run_command('queuectl list --state completed')
     
-    # Terminate worker
-    p.terminate()
-    p.join()
+    # Terminate worker, so it cannot claim jobs later tests expect to stay pending
+    os.killpg(worker.pid, signal.SIGTERM)
+    worker.wait(timeout=10)
     
     if "worker_test" in out:
         print("✓ Worker processed job successfully")
@@ -93,12 +93,8 @@ def test_dlq():
     run_command('queuectl enqueue \'{"id":"fail_test","command":"exit 1","max_retries":1}\'')
     
     # Start worker briefly
-    import multiprocessing
-    def run_worker():
-        os.system('timeout 10 queuectl worker start 2>/dev/null || true')
-    
-    p = multiprocessing.Process(target=run_worker)
-    p.start()
+    worker = subprocess.Popen('queuectl worker start', shell=True, start_new_session=True,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
     
     # Wait for retries
     time.sleep(8)
@@ -106,8 +102,8 @@ def test_dlq():
     # Check DLQ
     code, out, err = run_command('queuectl dlq list')
     
-    p.terminate()
-    p.join()
+    os.killpg(worker.pid, signal.SIGTERM)
+    worker.wait(timeout=10)
     
     if code == 0:
         print("✓ DLQ command works")
@@ -118,6 +114,1165 @@ def test_dlq():
     else:
         print("✗ DLQ command failed")
 
+def test_sqlite_backend():
+    """Test SQLite storage backend"""
+    print("\n=== Test 7: SQLite Backend ===")
+    
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists('.queuectl/jobs.db' + suffix):
+            os.remove('.queuectl/jobs.db' + suffix)
+    
+    code, out, err = run_command('queuectl config set storage_backend sqlite')
+    assert code == 0, f"Config set failed: {err}"
+    try:
+        code, out, err = run_command('queuectl enqueue \'{"id":"sqlite1","command":"echo SQLite"}\'')
+        assert code == 0, f"Enqueue failed: {err}"
+        
+        code, out, err = run_command('queuectl list --state pending')
+        assert code == 0, f"List failed: {err}"
+        assert "sqlite1" in out, "Job not stored in SQLite backend"
+        assert os.path.exists('.queuectl/jobs.db'), "SQLite database not created"
+        print("✓ SQLite backend works")
+    finally:
+        run_command('queuectl config set storage_backend json')
+
+# One process replays the journal; another compacts it and appends past
+# the first one's offset; the first then sees the new journal under its old
+# inode, as it would if the filesystem reused the inode number
+JOURNAL_EPOCH_SCRIPT = """
+import os, tempfile
+from pathlib import Path
+from queuectl.job import Job
+from queuectl.storage import JournalJobStorage
+data_dir = Path(tempfile.mkdtemp())
+reader, writer = JournalJobStorage(data_dir), JournalJobStorage(data_dir)
+reader.add_jobs([Job(id=f'old{i}', command='true') for i in range(3)])
+writer.compact()
+writer.add_jobs([Job(id=f'new{i}', command='true') for i in range(7)])
+st = os.stat(data_dir / 'journal.log')
+reader._journal_id = (st.st_dev, st.st_ino)
+print(len(reader.get_all_jobs()), sum(reader.recount_job_stats().values()))
+"""
+
+def test_journal_backend():
+    """Test journal storage backend and compaction"""
+    print("\n=== Test 8: Journal Backend ===")
+    
+    code, out, err = run_command('queuectl config set storage_backend journal')
+    assert code == 0, f"Config set failed: {err}"
+    try:
+        code, out, err = run_command('queuectl enqueue \'{"id":"journal1","command":"echo Journal"}\'')
+        assert code == 0, f"Enqueue failed: {err}"
+        
+        code, out, err = run_command('queuectl storage compact')
+        assert code == 0, f"Compact failed: {err}"
+        
+        code, out, err = run_command('queuectl list --state pending')
+        assert code == 0, f"List failed: {err}"
+        assert "journal1" in out, "Job lost after compaction"
+        
+        code, out, err = run_command(f'{sys.executable} -c "{JOURNAL_EPOCH_SCRIPT}"')
+        assert code == 0 and out.strip() == "10 10", f"Compaction missed on a reused inode: {out}{err}"
+        print("✓ Journal backend and compaction work")
+    finally:
+        run_command('queuectl config set storage_backend json')
+
+def test_concurrent_claim():
+    """Test that concurrent workers execute each job exactly once"""
+    print("\n=== Test 9: Concurrent Claim ===")
+    
+    code, out, err = run_command(f'{sys.executable} benchmarks/stress_claim.py --workers 4 --jobs 40')
+    assert code == 0, f"Stress benchmark failed: {out}{err}"
+    assert "exactly once" in out, "Stress benchmark output malformed"
+    print("✓ Every job executed exactly once")
+
+def test_bulk_enqueue():
+    """Test bulk enqueue from a JSON Lines file"""
+    print("\n=== Test 10: Bulk Enqueue ===")
+    
+    with open('.queuectl/bulk_jobs.jsonl', 'w') as f:
+        for i in range(25):
+            f.write(json.dumps({"id": f"bulk{i}", "command": "echo Bulk"}) + "\n")
+    
+    code, out, err = run_command('queuectl enqueue --file .queuectl/bulk_jobs.jsonl --chunk-size 10')
+    assert code == 0, f"Bulk enqueue failed: {err}"
+    assert "Enqueued 25 job(s)" in out, "Bulk enqueue count not reported"
+    
+    code, out, err = run_command('queuectl list --state pending')
+    assert "bulk24" in out, "Bulk job missing"
+    
+    code, out, err = run_command('queuectl enqueue --file .queuectl/bulk_jobs.jsonl --chunk-size -1')
+    assert code == 2 and "at least 1" in err, f"--chunk-size -1 accepted: {out}{err}"
+    print("✓ Bulk enqueue works")
+
+# A fake daemon that never answers the first request it gets or any
+# update_job, and echoes the method name otherwise; then a worker whose
+# first claim loses its connection
+DAEMON_LOSS_SCRIPT = """
+import socket, tempfile, threading
+from pathlib import Path
+from queuectl.config import get_config
+from queuectl.storage.daemon_storage import DaemonStorage, decode_body, encode_frame, recv_frame
+data_dir = Path(tempfile.mkdtemp())
+get_config().config.update(data_dir=str(data_dir), daemon_timeout=0.3)
+server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+server.bind(str(data_dir / 'daemon.sock'))
+server.listen(8)
+requests = []
+def answer(conn):
+    while True:
+        try:
+            method = recv_frame(conn)['m']
+        except OSError:
+            return
+        requests.append(method)
+        if len(requests) > 1 and method != 'update_job':
+            conn.sendall(encode_frame({'r': method}))
+def serve():
+    while True:
+        threading.Thread(target=answer, args=(server.accept()[0],), daemon=True).start()
+threading.Thread(target=serve, daemon=True).start()
+proxy = DaemonStorage.try_connect()
+print(proxy.get_backlog())
+try:
+    proxy.update_job(None, None)
+except ConnectionError as e:
+    print(type(e).__name__)
+print(proxy.get_job('x'))
+server.close()
+(data_dir / 'daemon.sock').unlink()
+from queuectl.worker_manager import WorkerManager
+manager = WorkerManager()
+claims = []
+def claim_batch(limit, worker_id=None):
+    claims.append(1)
+    if len(claims) == 1:
+        raise ConnectionError('Lost connection to queuectl daemon')
+    manager.running = False
+    return []
+manager.queue.claim_batch = claim_batch
+manager.run_worker()
+print('claims', len(claims))
+"""
+
+def test_daemon():
+    """Test the queue daemon"""
+    print("\n=== Test 11: Daemon ===")
+    
+    daemon = subprocess.Popen('queuectl daemon start', shell=True,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        for _ in range(50):
+            code, out, err = run_command('queuectl daemon status')
+            if "Daemon running" in out:
+                break
+            time.sleep(0.1)
+        assert "Daemon running" in out, "Daemon did not start"
+        assert os.stat('.queuectl/daemon.sock').st_mode & 0o777 == 0o600, "Daemon socket not owner-only"
+        
+        # A client that pipelines requests and never reads the replies must not stall the daemon
+        stalled = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stalled.connect('.queuectl/daemon.sock')
+        stalled.setblocking(False)
+        stalled.send(encode_frame({"m": "ping"}) * 20000)
+        code, out, err = run_command('timeout 10 queuectl daemon status')
+        stalled.close()
+        assert "Daemon running" in out, "Daemon blocked on a client that stopped reading"
+        
+        code, out, err = run_command('queuectl enqueue \'{"id":"daemon1","command":"echo Daemon"}\'')
+        assert code == 0, f"Enqueue via daemon failed: {err}"
+        
+        code, out, err = run_command('queuectl status')
+        assert "Daemon: running" in out, "Status not served by daemon"
+        
+        code, out, err = run_command('queuectl daemon stop')
+        assert code == 0, f"Daemon stop failed: {err}"
+        daemon.wait(timeout=5)
+    finally:
+        if daemon.poll() is None:
+            daemon.terminate()
+    
+    code, out, err = run_command('queuectl list --state pending')
+    assert "daemon1" in out, "Job enqueued via daemon not persisted"
+    
+    code, out, err = run_command(f'{sys.executable} -c "{DAEMON_LOSS_SCRIPT}"')
+    assert code == 0, f"Daemon loss script failed: {err}"
+    lines = out.splitlines()
+    assert lines[:3] == ["get_backlog", "ConnectionError", "get_job"], f"Lost daemon connection not handled: {out}"
+    assert "Storage unavailable" in out and lines[-1] == "claims 2", f"Worker did not survive a lost connection: {out}"
+    print("✓ Daemon works")
+
+def test_asyncio_engine():
+    """Test the asyncio execution engine"""
+    print("\n=== Test 12: Asyncio Engine ===")
+    
+    for i in range(3):
+        run_command(f'queuectl enqueue \'{{"id":"async{i}","command":"sleep 1"}}\'')
+    
+    worker = subprocess.Popen('queuectl worker start --engine asyncio --concurrency 50',
+                              shell=True, start_new_session=True,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        for _ in range(100):
+            code, out, err = run_command('queuectl list --state completed')
+            if all(f"async{i}" in out for i in range(3)):
+                break
+            time.sleep(0.1)
+    finally:
+        os.killpg(worker.pid, signal.SIGTERM)
+        worker.wait(timeout=10)
+    
+    assert all(f"async{i}" in out for i in range(3)), "Asyncio worker did not complete jobs"
+    
+    code, out, err = run_command('timeout 5 queuectl worker start --engine asyncio --concurrency 0')
+    assert code == 2 and "at least 1" in err, f"--concurrency 0 accepted: {out}{err}"
+    print("✓ Asyncio engine works")
+
+def test_priority():
+    """Test that higher-priority jobs are claimed first on every backend"""
+    print("\n=== Test 13: Priority Claim ===")
+    
+    claim = (f'{sys.executable} -c "from queuectl.job_queue import JobQueue; '
+             f'q = JobQueue(); jobs = q.claim_batch(1); q.release_jobs(jobs); print(jobs[0].id)"')
+    try:
+        for backend in ('json', 'sqlite', 'journal'):
+            run_command(f'queuectl config set storage_backend {backend}')
+            run_command(f'queuectl enqueue \'{{"id":"prio_low_{backend}","command":"echo low"}}\'')
+            code, out, err = run_command(
+                f'queuectl enqueue \'{{"id":"prio_high_{backend}","command":"echo high","priority":10}}\'')
+            assert code == 0, f"Enqueue failed: {err}"
+            
+            code, out, err = run_command(claim)
+            assert code == 0, f"Claim failed: {err}"
+            assert out.strip() == f"prio_high_{backend}", f"{backend} claimed {out.strip()} first"
+    finally:
+        run_command('queuectl config set storage_backend json')
+    
+    code, out, err = run_command('queuectl enqueue \'{"command":"echo bad","priority":"high"}\'')
+    assert code != 0, "Non-integer priority accepted"
+    print("✓ Highest-priority job claimed first")
+
+def test_named_queues():
+    """Test enqueueing to and listing named queues"""
+    print("\n=== Test 14: Named Queues ===")
+    
+    code, out, err = run_command('queuectl enqueue --queue emails \'{"id":"q_email","command":"echo mail"}\'')
+    assert code == 0, f"Enqueue failed: {err}"
+    assert os.path.isdir('.queuectl/queues/emails'), "Queue storage not partitioned"
+    
+    code, out, err = run_command('queuectl list --queue emails')
+    assert "q_email" in out and "test1" not in out, "Queue filter not applied"
+    
+    code, out, err = run_command('queuectl status')
+    assert "emails" in out, "Per-queue stats missing from status"
+    
+    code, out, err = run_command('queuectl enqueue \'{"command":"echo bad","queue":"../etc"}\'')
+    assert code != 0, "Unsafe queue name accepted"
+    print("✓ Named queues work")
+
+def test_gc_archive():
+    """Test archiving finished jobs out of the hot storage"""
+    print("\n=== Test 15: GC and Archive ===")
+    
+    run_command('queuectl config set completed_ttl 0')
+    try:
+        code, out, err = run_command('queuectl gc')
+        assert code == 0, f"GC failed: {err}"
+        assert "Archived" in out, "GC output malformed"
+    finally:
+        run_command('queuectl config set completed_ttl 86400')
+    
+    code, out, err = run_command('queuectl status')
+    assert "Completed:  0" in out, "Completed jobs left in hot storage"
+    
+    code, out, err = run_command('queuectl list --state completed')
+    assert "async0" in out, "Archived job not listed"
+    print("✓ Finished jobs archived and still listed")
+
+def test_list_pagination():
+    """Test paginated, filtered and JSON Lines listing"""
+    print("\n=== Test 16: List Pagination ===")
+    
+    code, out, err = run_command('queuectl list --command-contains Bulk --limit 3 --format jsonl')
+    assert code == 0, f"List failed: {err}"
+    page = [json.loads(line) for line in out.strip().splitlines()]
+    assert len(page) == 3, f"Expected 3 jobs, got {len(page)}"
+    assert all("Bulk" in job["command"] for job in page), "Filter not applied"
+    
+    code, out, err = run_command('queuectl list --command-contains Bulk --offset 3 --limit 1 --format jsonl')
+    assert json.loads(out)["id"] not in {job["id"] for job in page}, "Offset not applied"
+    
+    code, out, err = run_command('queuectl list --until 2000-01-01')
+    assert "No jobs found" in out, "Time filter not applied"
+    
+    for option in ('--limit 0', '--limit -1', '--offset -1'):
+        code, out, err = run_command(f'queuectl list {option}')
+        assert code == 2 and "usage:" in err and "Traceback" not in err, f"list {option} accepted: {out}{err}"
+    print("✓ List pagination and filters work")
+
+# Reads the journal backend's counts in a fresh process, counting how
+# often the snapshot is replayed
+JOURNAL_COUNTS_SCRIPT = """
+from queuectl.config import get_config
+get_config().config.update(storage_backend='journal')
+from queuectl.storage import JournalJobStorage
+replays = []
+load_snapshot = JournalJobStorage._load_snapshot
+JournalJobStorage._load_snapshot = lambda self: replays.append(1) or load_snapshot(self)
+from queuectl.job_queue import JobQueue
+print(sum(JobQueue().get_stats().values()) > 0, 'replays', len(replays))
+"""
+
+def test_status_counters():
+    """Test that maintained state counters match a full recount"""
+    print("\n=== Test 17: Status Counters ===")
+    
+    for backend in ('json', 'sqlite', 'journal'):
+        run_command(f'queuectl config set storage_backend {backend}')
+        try:
+            code, out, err = run_command('queuectl status --verify')
+            assert code == 0, f"Status failed: {err}"
+            assert "Counters match" in out, f"{backend} counters drifted: {out}"
+        finally:
+            run_command('queuectl config set storage_backend json')
+    
+    # Replace jobs.json as a write that crashed before updating stats.json would
+    with open('.queuectl/jobs.json') as f:
+        records = json.load(f)
+    for stored in (records + [{**records[0], "id": "crash_copy"}], records):
+        with open('.queuectl/jobs.tmp', 'w') as f:
+            json.dump(stored, f)
+        os.replace('.queuectl/jobs.tmp', '.queuectl/jobs.json')
+        code, out, err = run_command('queuectl status --verify')
+        assert "Counters match" in out, f"Stale stats.json served after jobs.json changed: {out}"
+    
+    run_command('queuectl config set storage_backend journal')
+    try:
+        code, out, err = run_command(f'{sys.executable} -c "{JOURNAL_COUNTS_SCRIPT}"')
+        assert code == 0, f"Journal counts script failed: {err}"
+        assert "True replays 0" in out, f"Journal replayed to read its counts: {out}"
+        with open('.queuectl/journal_stats.json') as f:
+            stats = json.load(f)
+        stats["counts"]["pending"] += 5
+        with open('.queuectl/journal_stats.json', 'w') as f:
+            json.dump(stats, f)
+        for _ in range(2):
+            # A plain --verify only reports, so the drift is still there the second time
+            code, out, err = run_command('queuectl status --verify')
+            assert "Drift in default/pending" in out and "(repaired)" not in out, \
+                f"Drifted journal counts not reported read-only: {out}"
+        code, out, err = run_command('queuectl status --verify --repair')
+        assert "Drift in default/pending" in out and "(repaired)" in out, f"Drift not repaired: {out}"
+        code, out, err = run_command('queuectl status --verify')
+        assert "Counters match" in out, f"Drifted journal counts not repaired: {out}"
+    finally:
+        run_command('queuectl config set storage_backend json')
+    print("✓ State counters match a full recount")
+
+def test_job_logs():
+    """Test that job output is captured to a capped log file"""
+    print("\n=== Test 18: Job Logs ===")
+    
+    run_command('queuectl config set log_max_bytes 1000')
+    try:
+        run_command('queuectl enqueue \'{"id":"log_job","command":"seq 1 5000; exit 4","max_retries":1}\'')
+        run_command('timeout 3 queuectl worker start')
+    finally:
+        run_command('queuectl config set log_max_bytes 10485760')
+    
+    code, out, err = run_command('queuectl logs log_job')
+    assert code == 0, f"Logs failed: {err}"
+    assert out.startswith("1\n2\n") and out.rstrip().endswith("5000"), "Head or tail of output missing"
+    assert "bytes truncated" in out and len(out) < 1100, "Log not capped"
+    
+    code, out, err = run_command('queuectl list --state dead --format jsonl')
+    job = next(json.loads(line) for line in out.splitlines() if '"log_job"' in line)
+    assert job["exit_code"] == 4, "Exit code not recorded"
+    
+    # IDs that differ only in characters unsafe in file names keep separate logs
+    ids = ('log/x', 'log:x', 'log_x')
+    for job_id in ids:
+        run_command(f'queuectl enqueue \'{{"id":"{job_id}","command":"echo output of {job_id}"}}\'')
+    run_command('timeout 3 queuectl worker start')
+    for job_id in ids:
+        code, out, err = run_command(f'queuectl logs {job_id}')
+        assert out.strip() == f"output of {job_id}", f"Log of {job_id} overwritten: {out}{err}"
+    print("✓ Job output captured to capped log")
+
+def test_resource_limits():
+    """Test per-job timeout and memory limits with per-attempt usage"""
+    print("\n=== Test 19: Resource Limits ===")
+    
+    code, out, err = run_command('queuectl enqueue \'{"command":"true","timeout":-1}\'')
+    assert code != 0 and "timeout" in out + err, "Invalid timeout accepted"
+    
+    run_command('queuectl enqueue \'{"id":"slow_job","command":"sleep 10","timeout":1,"max_retries":1}\'')
+    run_command('queuectl enqueue \'{"id":"big_job","command":"python3 -c \\"x = bytearray(500 * 2**20)\\"","memory_mb":100,"max_retries":1}\'')
+    run_command('timeout 5 queuectl worker start')
+    
+    code, out, err = run_command('queuectl list --state dead --format jsonl')
+    jobs = {job["id"]: job for job in map(json.loads, out.splitlines())}
+    slow, big = jobs["slow_job"], jobs["big_job"]
+    assert slow["exit_code"] != 0 and slow["attempt_history"][0]["duration"] < 5, "Timeout not enforced"
+    assert big["exit_code"] != 0, "Memory limit not enforced"
+    attempt = big["attempt_history"][-1]
+    assert attempt["attempt"] == 1 and attempt["max_rss_kb"], "Attempt usage not recorded"
+    print("✓ Limits enforced and usage recorded")
+
+def test_templates():
+    """Test argv jobs and command templates run without a shell"""
+    print("\n=== Test 20: Argv Jobs and Templates ===")
+    
+    code, out, err = run_command('queuectl template add greet "echo hello {name}"')
+    assert code == 0, f"Template add failed: {err}"
+    code, out, err = run_command('queuectl enqueue \'{"id":"tpl_missing","template":"greet"}\'')
+    assert code != 0 and "name" in err, "Missing template parameter accepted"
+    
+    run_command('queuectl enqueue \'{"id":"tpl_job","template":"greet","params":{"name":"a;b $HOME"}}\'')
+    run_command('queuectl enqueue \'{"id":"argv_job","args":["echo","x  y","*"]}\'')
+    run_command('timeout 3 queuectl worker start')
+    
+    code, out, err = run_command('queuectl logs tpl_job')
+    assert out == "hello a;b $HOME\n", f"Template parameters went through a shell: {out!r}"
+    code, out, err = run_command('queuectl logs argv_job')
+    assert out == "x  y *\n", f"Args went through a shell: {out!r}"
+    
+    code, out, err = run_command('queuectl list --command-contains greet')
+    assert "tpl_job" in out, "Template job not matched by its description"
+    run_command('queuectl template remove greet')
+    print("✓ Argv and template jobs executed directly")
+
+def test_callable_jobs():
+    """Test Python callable jobs in the worker's process pool"""
+    print("\n=== Test 21: Callable Jobs ===")
+    
+    code, out, err = run_command('queuectl enqueue \'{"callable":"not a path"}\'')
+    assert code != 0, "Malformed callable accepted"
+    code, out, err = run_command('queuectl enqueue \'{"callable":"builtins:print","nice":5}\'')
+    assert code != 0 and "nice" in err, "Per-job nice accepted for a callable"
+    
+    run_command('queuectl enqueue \'{"id":"call_mem","callable":"builtins:bytearray","kwargs":{"source":4000000000},"memory_mb":500,"max_retries":1}\'')
+    run_command('queuectl enqueue \'{"id":"call_ok","callable":"builtins:print","kwargs":{"end":"from pool\\n"}}\'')
+    run_command('queuectl enqueue \'{"id":"call_bad","callable":"builtins:int","kwargs":{"nope":1},"max_retries":1}\'')
+    run_command('timeout 5 queuectl worker start')
+    
+    code, out, err = run_command('queuectl logs call_ok')
+    assert out == "from pool\n", f"Callable output not captured: {out!r}"
+    code, out, err = run_command('queuectl logs call_bad')
+    assert "TypeError" in out, "Callable traceback not logged"
+    code, out, err = run_command('queuectl logs call_mem')
+    assert "MemoryError" in out, "memory_mb not applied to a callable"
+    
+    code, out, err = run_command('queuectl list --format jsonl')
+    states = {job["id"]: job["state"] for job in map(json.loads, out.splitlines())}
+    assert states["call_ok"] == "completed" and states["call_bad"] == "dead", "Callable outcomes not recorded"
+    assert states["call_mem"] == "dead", "Memory-limited callable not failed"
+    
+    # A timeout kills the shared pool; the job running beside it is resubmitted, not failed
+    run_command('queuectl enqueue \'{"id":"call_slow","callable":"subprocess:run","kwargs":{"args":["sleep","30"]},"timeout":2,"max_retries":1}\'')
+    run_command('queuectl enqueue \'{"id":"call_sib","callable":"subprocess:run","kwargs":{"args":["sleep","4"]},"max_retries":1}\'')
+    run_command('timeout 10 queuectl worker start --engine asyncio --concurrency 2')
+    code, out, err = run_command('queuectl list --format jsonl')
+    jobs = {job["id"]: job for job in map(json.loads, out.splitlines())}
+    assert jobs["call_slow"]["state"] == "dead", "Timed-out callable not failed"
+    assert jobs["call_sib"]["state"] == "completed" and jobs["call_sib"]["attempts"] == 1, \
+        "Callable sharing a killed pool lost an attempt"
+    print("✓ Callable jobs run through the retry and DLQ flow")
+
+def test_dependencies():
+    """Test depends_on blocking, unblocking and failure propagation on each backend"""
+    print("\n=== Test 22: Job Dependencies ===")
+    
+    code, out, err = run_command('queuectl enqueue \'{"command":"true","depends_on":["no_such_job"]}\'')
+    assert code != 0 and "unknown job" in err, "Unknown dependency accepted"
+    
+    for backend in ('json', 'sqlite', 'journal'):
+        run_command(f'queuectl config set storage_backend {backend}')
+        try:
+            run_command(f'queuectl enqueue \'{{"id":"{backend}_a","command":"echo a"}}\'')
+            run_command(f'queuectl enqueue \'{{"id":"{backend}_b","command":"echo b","depends_on":["{backend}_a"]}}\'')
+            run_command(f'queuectl enqueue \'{{"id":"{backend}_bad","command":"exit 1","max_retries":1}}\'')
+            run_command(f'queuectl enqueue \'{{"id":"{backend}_c","command":"echo c","depends_on":["{backend}_bad"]}}\'')
+            run_command(f'queuectl enqueue \'{{"id":"{backend}_d","command":"echo d","depends_on":["{backend}_c","{backend}_a"]}}\'')
+            
+            code, out, err = run_command('queuectl list --state blocked')
+            assert all(f"{backend}_{name}" in out for name in "bcd"), f"Dependents not blocked on {backend}"
+            code, out, err = run_command(f'queuectl graph {backend}_a')
+            assert f"{backend}_b [blocked]" in out and f"{backend}_d [blocked]" in out, f"Graph incomplete on {backend}"
+            
+            run_command('timeout 4 queuectl worker start')
+            code, out, err = run_command('queuectl list --format jsonl')
+            states = {job["id"]: job["state"] for job in map(json.loads, out.splitlines())}
+            assert states[f"{backend}_b"] == "completed", f"Dependent not unblocked on {backend}"
+            assert states[f"{backend}_c"] == "dead" and states[f"{backend}_d"] == "dead", \
+                f"Failure not propagated on {backend}"
+            code, out, err = run_command('queuectl status --verify')
+            assert "Counters match" in out, f"Counters drifted through dependency updates on {backend}"
+        finally:
+            run_command('queuectl config set storage_backend json')
+    print("✓ Dependents unblocked on completion and failed with their dependencies")
+
+def test_dedupe():
+    """Test duplicate ids and dedupe keys on each backend"""
+    print("\n=== Test 23: Deduplication ===")
+    
+    for backend in ('json', 'sqlite', 'journal'):
+        run_command(f'queuectl config set storage_backend {backend}')
+        try:
+            run_command(f'queuectl enqueue \'{{"id":"{backend}_once","command":"echo 1"}}\'')
+            code, out, err = run_command(f'queuectl enqueue \'{{"id":"{backend}_once","command":"echo 2"}}\'')
+            assert code == 0 and f"already enqueued: {backend}_once" in out, f"Duplicate id not detected on {backend}"
+            
+            run_command(f'queuectl enqueue \'{{"id":"{backend}_k1","command":"echo k","dedupe_key":"{backend}-key"}}\'')
+            code, out, err = run_command(f'queuectl enqueue \'{{"id":"{backend}_k2","command":"echo k","dedupe_key":"{backend}-key"}}\'')
+            assert f"already enqueued: {backend}_k1" in out, f"Duplicate dedupe_key not detected on {backend}"
+            
+            lines = [
+                f'{{"id":"{backend}_once","command":"echo 3"}}',
+                f'{{"command":"echo k","dedupe_key":"{backend}-key"}}',
+                f'{{"command":"echo n","dedupe_key":"{backend}-new"}}',
+                f'{{"command":"echo n","dedupe_key":"{backend}-new"}}',
+            ]
+            code, out, err = run_command(f"printf '%s\\n' {' '.join(repr(line) for line in lines)} | queuectl enqueue --stdin")
+            assert "Enqueued 1 job(s)" in out and "3 duplicate(s) skipped" in out, f"Bulk dedupe wrong on {backend}: {out}"
+            
+            code, out, err = run_command('queuectl list --format jsonl')
+            ids = [job["id"] for job in map(json.loads, out.splitlines())]
+            assert f"{backend}_k2" not in ids and ids.count(f"{backend}_once") == 1, f"Duplicate stored on {backend}"
+        finally:
+            run_command('queuectl config set storage_backend json')
+    print("✓ Duplicate ids and dedupe keys return the existing job")
+
+def test_leases():
+    """Test that expired leases are reaped and live ones renewed"""
+    print("\n=== Test 24: Leases and Heartbeats ===")
+    
+    run_command('queuectl config set lease_timeout 1')
+    try:
+        for backend in ('json', 'sqlite', 'journal'):
+            run_command(f'queuectl config set storage_backend {backend}')
+            try:
+                run_command(f'queuectl enqueue \'{{"id":"{backend}_orphan","command":"echo back","queue":"leases"}}\'')
+                # Claim from a process that exits without finishing, like a killed worker
+                code, out, err = run_command(
+                    'python -c "from queuectl.job_queue import JobQueue; '
+                    'print(JobQueue([(\'leases\', 1)]).claim_batch(1, \'gone:1\')[0].id)"')
+                assert f"{backend}_orphan" in out, f"Claim failed on {backend}"
+                time.sleep(1.5)
+                run_command('timeout 3 queuectl worker start --queue leases')
+                code, out, err = run_command('queuectl list --format jsonl')
+                job = next(job for job in map(json.loads, out.splitlines()) if job["id"] == f"{backend}_orphan")
+                assert job["state"] == "completed" and job["attempts"] == 2, f"Orphan not reaped on {backend}: {job}"
+            finally:
+                run_command('queuectl config set storage_backend json')
+        
+        # A job outliving its lease keeps it while the worker heartbeats
+        run_command('queuectl enqueue \'{"id":"lease_long","command":"sleep 3","queue":"leases"}\'')
+        run_command('timeout 6 queuectl worker start --count 2 --queue leases')
+        code, out, err = run_command('queuectl list --format jsonl')
+        job = next(job for job in map(json.loads, out.splitlines()) if job["id"] == "lease_long")
+        assert job["state"] == "completed" and job["attempts"] == 1, f"Live lease was reaped: {job}"
+    finally:
+        run_command('queuectl config set lease_timeout 60')
+    print("✓ Expired leases requeued, renewed leases kept")
+
+def test_wakeup():
+    """Test that an idle worker picks up a new job without waiting out its backoff"""
+    print("\n=== Test 25: Enqueue Wakeup ===")
+    
+    worker = subprocess.Popen('queuectl worker start --queue wakeup', shell=True, start_new_session=True,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        # Let the idle backoff grow well past the pickup time we expect
+        time.sleep(4)
+        run_command('queuectl enqueue \'{"id":"wake1","command":"true","queue":"wakeup"}\'')
+        for _ in range(50):
+            code, out, err = run_command('queuectl list --state completed --format jsonl')
+            done = [job for job in map(json.loads, out.splitlines()) if job["id"] == "wake1"]
+            if done:
+                break
+            time.sleep(0.1)
+    finally:
+        os.killpg(worker.pid, signal.SIGTERM)
+        worker.wait(timeout=10)
+    
+    assert done, "Idle worker did not run the new job"
+    started = datetime.fromisoformat(done[0]["attempt_history"][-1]["started_at"])
+    latency = (started - datetime.fromisoformat(done[0]["created_at"])).total_seconds()
+    assert latency < 0.5, f"Worker was not woken by the enqueue ({latency:.2f}s)"
+    print(f"✓ Idle worker started the job {latency * 1000:.0f}ms after enqueue")
+
+def test_throttle():
+    """Test that a tag's in-flight cap holds across claims and other work is claimed instead"""
+    print("\n=== Test 26: Throttles ===")
+    
+    code, out, err = run_command('queuectl throttle set tag:slowapi --rate 5/x')
+    assert code != 0 and "Invalid rate" in err, "Bad rate accepted"
+    code, out, err = run_command('queuectl throttle set tag:slowapi --max-in-flight 1')
+    assert code == 0, f"Throttle set failed: {err}"
+    for job in ('{"id":"thr1","command":"true","tag":"slowapi","priority":5,"queue":"throttled"}',
+                '{"id":"thr2","command":"true","tag":"slowapi","priority":5,"queue":"throttled"}',
+                '{"id":"thr3","command":"true","queue":"throttled"}'):
+        run_command(f"queuectl enqueue '{job}'")
+    
+    claim = (f'{sys.executable} -c "from queuectl.job_queue import JobQueue; '
+             f'print(\' \'.join(job.id for job in JobQueue([(\'throttled\', 1)]).claim_batch(5, \'w\')))"')
+    try:
+        code, out, err = run_command(claim)
+        assert out.split() == ["thr1", "thr3"], f"Throttle not applied at claim: {out or err}"
+        code, out, err = run_command(claim)
+        assert out.split() == [], f"Second claim exceeded the in-flight cap: {out or err}"
+        code, out, err = run_command('queuectl throttle list')
+        assert "tag:slowapi" in out and "max 1 in flight" in out, "Throttle not listed"
+        
+        run_command('queuectl throttle set queue:throttled --max-in-flight 1')
+        for job_id in ('thr4', 'thr5'):
+            run_command(f'queuectl enqueue \'{{"id":"{job_id}","command":"true","queue":"throttled"}}\'')
+        code, out, err = run_command(claim)
+        assert out.split() == ["thr4"], f"Queue cap not applied at claim: {out or err}"
+        code, out, err = run_command(claim)
+        assert out.split() == [], f"Claim from a full queue returned jobs: {out or err}"
+    finally:
+        run_command('queuectl throttle remove tag:slowapi')
+        run_command('queuectl throttle remove queue:throttled')
+    print("✓ Throttled tag capped; untagged work claimed instead")
+
+def test_scheduled_jobs():
+    """Test that run_at jobs wait outside the queue and a worker pool enqueues them when due"""
+    print("\n=== Test 27: Scheduled Jobs ===")
+    
+    code, out, err = run_command('queuectl enqueue \'{"id":"cron1","command":"true","schedule":"61 * * * *"}\'')
+    assert code != 0 and "Invalid minute" in err, "Bad cron expression accepted"
+    for bad in ('true', '[1]', '"soon"'):
+        code, out, err = run_command(f'queuectl enqueue \'{{"command":"true","run_at":{bad}}}\'')
+        assert code != 0 and "run_at" in err, f"run_at {bad} accepted"
+    code, out, err = run_command('queuectl enqueue \'{"id":"cron2","command":"true","schedule":"*/5 * * * *"}\'')
+    assert "Job scheduled: cron2" in out, f"Cron job not scheduled: {out}{err}"
+    
+    run_at = datetime.fromtimestamp(time.time() + 1).isoformat()
+    code, out, err = run_command(f'queuectl enqueue \'{{"id":"later1","command":"true","queue":"scheduled","run_at":"{run_at}"}}\'')
+    assert "Job scheduled: later1" in out, f"run_at job not scheduled: {out}{err}"
+    code, out, err = run_command('queuectl list --queue scheduled')
+    assert "later1" not in out, "Future job stored in its queue before it was due"
+    code, out, err = run_command('queuectl schedule list')
+    assert "later1" in out and "cron2" in out, "Scheduled jobs not listed"
+    
+    worker = subprocess.Popen('queuectl worker start --queue scheduled', shell=True, start_new_session=True,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        for _ in range(50):
+            code, out, err = run_command('queuectl list --state completed --queue scheduled')
+            if "later1" in out:
+                break
+            time.sleep(0.2)
+    finally:
+        os.killpg(worker.pid, signal.SIGTERM)
+        worker.wait(timeout=10)
+        run_command('queuectl schedule remove cron2')
+    
+    assert "later1" in out, "Scheduled job was not enqueued and run when due"
+    
+    run_at = datetime.fromtimestamp(time.time() + 3600).isoformat()
+    code, out, err = run_command(f'queuectl enqueue \'{{"id":"later1","command":"true","queue":"scheduled","run_at":"{run_at}"}}\'')
+    assert "already enqueued: later1" in out, f"Scheduled job duplicating a stored one accepted: {out}{err}"
+    code, out, err = run_command('queuectl schedule list')
+    assert "later1" not in out, "Duplicate of a stored job was scheduled"
+    print("✓ run_at job enqueued by the worker pool's scheduler and completed")
+
+# Claims a job as "old", lets the lease lapse and be reaped, re-claims it as
+# "new", then finishes it from the old worker, which must not land
+FENCE_SCRIPT = """
+import sys, time
+from queuectl.config import get_config
+get_config().config.update(storage_backend=sys.argv[1], lease_timeout=0.2)
+from queuectl.job_queue import JobQueue
+from queuectl.worker_manager import WorkerManager
+queue = JobQueue([('fence', 1)])
+queue.enqueue({'id': sys.argv[1] + '_fenced', 'command': 'true', 'queue': 'fence'})
+stale = queue.claim_batch(1, 'old:1')[0]
+time.sleep(0.3)
+queue.reap_expired_leases()
+fresh = queue.claim_batch(1, 'new:1')[0]
+print('released', queue.release_jobs([stale], 'old:1'))
+manager = WorkerManager([('fence', 1)])
+stale.increment_attempt()
+manager.finish_job(stale, False)
+job = queue.get_job(fresh.id)
+print(job.state.value, job.worker_id)
+fresh.increment_attempt()
+manager.finish_job(fresh, True)
+print(queue.get_job(fresh.id).state.value)
+"""
+
+# On a JSON queue with nothing processing, reaps leases and releases a job
+# that is no longer leased; neither should parse or rewrite jobs.json
+IDLE_LEASE_SCRIPT = """
+import os, tempfile
+from pathlib import Path
+from queuectl.job import Job
+from queuectl.storage import JobStorage
+storage = JobStorage(Path(tempfile.mkdtemp()))
+job = Job(command='true')
+storage.add_job(job)
+storage.get_job_stats()
+reads = []
+read_records = storage._read_records
+storage._read_records = lambda: reads.append(1) or read_records()
+storage.reap_expired_leases()
+print('reap_reads', len(reads))
+before = os.stat(storage.jobs_file).st_ino
+storage.release_jobs([job])
+print('rewritten', os.stat(storage.jobs_file).st_ino != before)
+"""
+
+def test_lease_fencing():
+    """Test that a worker whose lease was reaped cannot record its outcome or release the job"""
+    print("\n=== Test 28: Lease Fencing ===")
+    
+    for backend in ('json', 'sqlite', 'journal'):
+        code, out, err = run_command(f'{sys.executable} -c "{FENCE_SCRIPT}" {backend}')
+        assert code == 0, f"Fencing script failed on {backend}: {err}"
+        assert "result discarded" in out, f"Stale outcome not dropped on {backend}: {out}"
+        lines = out.splitlines()
+        assert "processing new:1" in lines, f"Stale worker overwrote the new owner on {backend}: {out}"
+        assert "released 0" in lines, f"Stale worker released the new owner's job on {backend}: {out}"
+        assert lines[-1] == "completed", f"New owner could not finish on {backend}: {out}"
+    
+    code, out, err = run_command(f'{sys.executable} -c "{IDLE_LEASE_SCRIPT}"')
+    assert code == 0, f"Idle lease script failed: {err}"
+    assert out.split() == ["reap_reads", "0", "rewritten", "False"], f"Idle lease work touched jobs.json: {out}"
+    print("✓ Outcome from a reaped lease discarded on every backend")
+
+# Round-trips one job through every encoding: compact records, the legacy
+# indented/ISO layout in jobs.json, the SQLite data column and the journal
+# snapshot, archive segments, daemon frames and journal records; prints each
+# path whose Job comes back changed
+ENCODING_SCRIPT = """
+import json, tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+from queuectl.job import Job
+from queuectl.storage import JobStorage, JournalJobStorage, SQLiteJobStorage
+from queuectl.storage.archive import JobArchive
+from queuectl.storage.daemon_storage import FRAME_HEADER, decode_body, encode_frame
+from queuectl.storage.sqlite_storage import _COLUMNS
+job = Job(id='enc1', command='echo hi', priority=2, dedupe_key='k', tag='t', max_retries=4,
+          next_run_at=datetime.now() + timedelta(minutes=5), timeout=30)
+job.increment_attempt()
+job.record_attempt(datetime.now(), 1.5, 1, 0.25, 2048)
+expected = job.to_dict()
+data_dir = Path(tempfile.mkdtemp())
+loaded = {'record': Job.from_dict(json.loads(json.dumps(job.to_record())))}
+(data_dir / 'jobs.json').write_text(json.dumps([expected], indent=2))
+loaded['legacy jobs.json'] = JobStorage(data_dir).get_job('enc1')
+sqlite = SQLiteJobStorage(data_dir)
+sqlite.add_job(job)
+legacy = {key: value for key, value in expected.items() if key not in _COLUMNS}
+sqlite._connect().execute('UPDATE jobs SET data = ? WHERE id = ?', (json.dumps(legacy), 'enc1'))
+loaded['legacy sqlite'] = sqlite.get_job('enc1')
+JobArchive(data_dir).append([job])
+loaded['archive'] = next(JobArchive(data_dir).iter_jobs())
+loaded['daemon'] = decode_body(encode_frame({'r': [job]})[FRAME_HEADER.size:])['r'][0]
+journal_dir = Path(tempfile.mkdtemp())
+(journal_dir / 'snapshot.json').write_text(json.dumps([expected]))
+loaded['legacy journal'] = JournalJobStorage(journal_dir).get_job('enc1')
+journal_dir = Path(tempfile.mkdtemp())
+JournalJobStorage(journal_dir).add_job(job)
+loaded['journal'] = JournalJobStorage(journal_dir).get_job('enc1')
+logged = json.loads((journal_dir / 'journal.log').read_text().splitlines()[-1])['job']
+if not isinstance(logged['created_at'], float) or 'log_path' in logged:
+    print('changed: journal record')
+for path, other in loaded.items():
+    if other is None or other.to_dict() != expected:
+        print('changed:', path)
+print('checked', len(loaded))
+"""
+
+def test_record_encoding():
+    """Test that jobs survive compact records, legacy data files, archive segments, daemon frames and the journal"""
+    print("\n=== Test 29: Record Encoding ===")
+    
+    code, out, err = run_command(f'{sys.executable} -c "{ENCODING_SCRIPT}"')
+    assert code == 0, f"Encoding script failed: {err}"
+    assert "changed:" not in out and "checked 7" in out, f"Job changed through an encoding: {out}"
+    print("✓ Jobs round-trip through every record encoding")
+
+# Feeds WorkerSupervisor scripted backlog samples (workers just sleep):
+# 12 due jobs at 5 per worker, then empty samples, then a crashed worker
+AUTOSCALE_SCRIPT = """
+import time
+from types import SimpleNamespace
+from queuectl.config import get_config
+from queuectl.supervisor import WorkerSupervisor
+config = get_config()
+config.config.update(autoscale_backlog_per_worker=5, autoscale_scale_down_after=3)
+samples = [{'pending': 12}] + [{'pending': 0}] * 3
+queue = SimpleNamespace(get_backlog=lambda: samples.pop(0))
+manager = SimpleNamespace(queue=queue, config=config, pid_file=None)
+supervisor = WorkerSupervisor(manager, 1, 4, time.sleep, (60,))
+supervisor._spawn()
+sizes = []
+try:
+    for _ in range(4):
+        supervisor._scale()
+        sizes.append(len(supervisor.workers))
+    print('sizes', *sizes)
+    crashed = supervisor.workers[0]
+    crashed.kill()
+    crashed.join()
+    supervisor._reap()
+    print('respawned', len(supervisor.workers), crashed not in supervisor.workers)
+finally:
+    for p in supervisor.workers + supervisor.retiring:
+        p.kill()
+        p.join()
+"""
+
+def test_autoscaler():
+    """Test that the supervisor grows at once, shrinks one worker after several low samples and respawns crashes"""
+    print("\n=== Test 30: Autoscaler Sizing ===")
+    
+    code, out, err = run_command(f'{sys.executable} -c "{AUTOSCALE_SCRIPT}"')
+    assert code == 0, f"Autoscale script failed: {err}"
+    assert "sizes 3 3 3 2" in out, f"Pool not sized from the backlog samples: {out}"
+    assert "respawned 2 True" in out, f"Crashed worker not respawned: {out}"
+    print("✓ Pool grows at once, shrinks after 3 low samples and respawns crashed workers")
+
+# Loads a config file holding an out-of-range retry_jitter and samples the
+# backoff with it, also when jitter is forced past 1 in memory
+JITTER_SCRIPT = """
+import json
+from queuectl.config import Config, get_config
+config = get_config()
+data = json.loads(config.config_file.read_text())
+config.config_file.write_text(json.dumps({**data, 'retry_jitter': 5}))
+print(Config().get('retry_jitter'))
+from queuectl.worker_manager import WorkerManager
+manager = WorkerManager()
+manager.config.config['retry_jitter'] = 5
+print(all(manager.calculate_backoff(3) >= 0 for _ in range(200)))
+"""
+
+# Stops a supervisor whose worker ignores SIGTERM while its job runs in its
+# own session; prints how long shutdown took and whether the job survived
+STUBBORN_SCRIPT = """
+import os, signal, subprocess, threading, time, tempfile
+from pathlib import Path
+from types import SimpleNamespace
+from queuectl import supervisor as supervision
+from queuectl.config import get_config
+from queuectl.worker_manager import WorkerManager
+supervision.SHUTDOWN_TIMEOUT = 1
+pid_path = Path(tempfile.mkdtemp()) / 'job.pid'
+def stubborn():
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    job = subprocess.Popen(['sleep', '60'], start_new_session=True)
+    pid_path.write_text(str(job.pid))
+    time.sleep(60)
+queue = SimpleNamespace(get_backlog=lambda: {'pending': 0})
+manager = SimpleNamespace(queue=queue, config=get_config(), pid_file=pid_path.with_name('workers.pid'),
+                          kill_process_group=WorkerManager.kill_process_group)
+supervisor = supervision.WorkerSupervisor(manager, 1, 1, stubborn)
+def stop():
+    while not pid_path.exists():
+        time.sleep(0.05)
+    supervisor.running = False
+threading.Thread(target=stop, daemon=True).start()
+start = time.time()
+supervisor.run()
+print('stopped', time.time() - start < 10)
+job_pid = int(pid_path.read_text())
+for _ in range(40):
+    try:
+        os.kill(job_pid, 0)
+    except ProcessLookupError:
+        break
+    time.sleep(0.05)
+else:
+    os.kill(job_pid, signal.SIGKILL)
+    print('job survived')
+"""
+
+def test_supervisor_shutdown():
+    """Test that the supervisor kills workers and their jobs that ignore SIGTERM past the shutdown timeout"""
+    print("\n=== Test 38: Supervisor Shutdown ===")
+    
+    code, out, err = run_command(f'{sys.executable} -c "{STUBBORN_SCRIPT}"')
+    assert code == 0, f"Supervisor shutdown script failed: {err}"
+    assert "did not stop within 1s, killing it" in out, f"Stuck worker not killed: {out}"
+    assert "stopped True" in out and "job survived" not in out, f"Stuck worker or its job outlived shutdown: {out}"
+    print("✓ Workers stuck past the shutdown timeout are killed with their jobs")
+
+def test_retry_backoff():
+    """Test that a failed job is requeued with next_run_at and not claimed before it is due"""
+    print("\n=== Test 31: Retry Backoff ===")
+    
+    run_command('queuectl config set backoff_base 30')
+    try:
+        run_command('queuectl enqueue \'{"id":"retry1","command":"exit 1","max_retries":3,"queue":"retry"}\'')
+        # The worker keeps polling after the failure; the retry is 30s away
+        run_command('timeout 3 queuectl worker start --queue retry')
+        code, out, err = run_command('queuectl list --queue retry --format jsonl')
+        job = json.loads(out)
+        assert job["state"] == "pending" and job["attempts"] == 1, f"Failed job not requeued once: {job}"
+        assert datetime.fromisoformat(job["next_run_at"]).timestamp() > time.time() + 20, "Retry not delayed by the backoff"
+        code, out, err = run_command(f'{sys.executable} -c "from queuectl.job_queue import JobQueue; '
+                                     f'print(JobQueue([(\'retry\', 1)]).claim_batch(1))"')
+        assert out.strip() == "[]", f"Job claimed before its retry was due: {out or err}"
+    finally:
+        run_command('queuectl config set backoff_base 2')
+    
+    try:
+        code, out, err = run_command('queuectl config set retry_jitter 3')
+        assert "retry_jitter = 1.0" in out, f"retry_jitter not clamped when set: {out}"
+        code, out, err = run_command(f'{sys.executable} -c "{JITTER_SCRIPT}"')
+        assert out.split() == ["1.0", "True"], f"Jitter not bounded: {out or err}"
+    finally:
+        run_command('queuectl config set retry_jitter 0')
+    print("✓ Failed job waits out its backoff before it can be claimed")
+
+# Claims with limits below 1 from a SQLite queue holding two due jobs
+CLAIM_LIMIT_SCRIPT = """
+import tempfile
+from pathlib import Path
+from queuectl.job import Job
+from queuectl.storage import SQLiteJobStorage
+storage = SQLiteJobStorage(Path(tempfile.mkdtemp()))
+storage.add_jobs([Job(command='true'), Job(command='true')])
+for limit in (-1, 0, 1):
+    print(len(storage.claim_batch(limit)))
+"""
+
+def test_prefetch():
+    """Test that --prefetch leases K jobs at once and a stopped worker returns the unstarted ones"""
+    print("\n=== Test 32: Prefetch ===")
+    
+    for i in range(3):
+        run_command(f'queuectl enqueue \'{{"id":"pre{i}","command":"sleep 2","queue":"prefetch"}}\'')
+    worker = subprocess.Popen('queuectl worker start --queue prefetch --prefetch 3', shell=True,
+                              start_new_session=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        for _ in range(50):
+            code, out, err = run_command('queuectl list --queue prefetch --state processing')
+            if all(f"pre{i}" in out for i in range(3)):
+                break
+            time.sleep(0.1)
+        assert all(f"pre{i}" in out for i in range(3)), f"Worker did not lease 3 jobs at once: {out}"
+    finally:
+        os.killpg(worker.pid, signal.SIGTERM)
+        worker.wait(timeout=15)
+    
+    # The worker process finishes the job in hand after the parent exits
+    for _ in range(50):
+        code, out, err = run_command('queuectl list --queue prefetch --format jsonl')
+        if '"processing"' not in out:
+            break
+        time.sleep(0.2)
+    jobs = sorted(map(json.loads, out.splitlines()), key=lambda job: job["state"])
+    assert [job["state"] for job in jobs] == ["completed", "pending", "pending"], f"Unexpected states: {out}"
+    assert all(job["attempts"] == 0 and not job.get("worker_id") for job in jobs[1:]), \
+        f"Unstarted jobs not returned untouched: {out}"
+    
+    for bad in ('0', '-1'):
+        code, out, err = run_command(f'timeout 5 queuectl worker start --queue prefetch --prefetch {bad}')
+        assert code == 2 and "at least 1" in err, f"--prefetch {bad} accepted: {out}{err}"
+    code, out, err = run_command(f'{sys.executable} -c "{CLAIM_LIMIT_SCRIPT}"')
+    assert out.split() == ["0", "0", "1"], f"Claim limit below 1 leased jobs: {out or err}"
+    print("✓ Prefetched jobs leased together; unstarted ones released on SIGTERM")
+
+# Archives jobs on both sides of a hot one: arch_a is oldest by creation but
+# sits in a later segment than arch_b; merge_new was created after the hot job
+ARCHIVE_SCRIPT = """
+from datetime import datetime, timedelta
+from queuectl.job import Job, JobState
+from queuectl.storage import queue_data_dir
+from queuectl.storage.archive import JobArchive
+now = datetime.now()
+jobs = [
+    Job(id='arch_a', command='true', created_at=now - timedelta(days=2), updated_at=now - timedelta(hours=1)),
+    Job(id='arch_b', command='true', created_at=now - timedelta(days=1), updated_at=now - timedelta(days=1)),
+    Job(id='merge_new', command='true', created_at=now, updated_at=now),
+]
+for job in jobs:
+    job.queue, job.state = 'merge', JobState.COMPLETED
+JobArchive(queue_data_dir('merge')).append(jobs)
+"""
+
+def test_archive_merge():
+    """Test that listings interleave archived and hot jobs by the sort key"""
+    print("\n=== Test 33: Archive Merge ===")
+    
+    run_command('queuectl enqueue \'{"id":"merge_old","command":"true","queue":"merge"}\'')
+    time.sleep(0.1)
+    code, out, err = run_command(f'{sys.executable} -c "{ARCHIVE_SCRIPT}"')
+    assert code == 0, f"Archive script failed: {err}"
+    
+    def listed(options):
+        code, out, err = run_command(f'queuectl list --queue merge --format jsonl {options}')
+        return [json.loads(line)["id"] for line in out.splitlines()]
+    
+    assert listed('') == ["arch_a", "arch_b", "merge_old", "merge_new"], f"Not merged by created_at: {listed('')}"
+    assert listed('--desc --limit 2') == ["merge_new", "merge_old"], "Not merged newest first"
+    assert listed('--sort updated') == ["arch_b", "arch_a", "merge_old", "merge_new"], \
+        f"Not merged by updated_at: {listed('--sort updated')}"
+    print("✓ Archived jobs interleaved with hot jobs in sort order")
+
+# Archives one job a day for 30 days, then takes the first job of each sort
+# order and counts the segments read; rebuilding the index must not change
+# the order
+LAZY_ARCHIVE_SCRIPT = """
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+from queuectl.job import Job, JobState
+from queuectl.storage.archive import JobArchive
+data_dir = Path(tempfile.mkdtemp())
+archive = JobArchive(data_dir)
+now = datetime.now()
+jobs = [Job(id=f'day{i:02d}', command='true', created_at=now - timedelta(days=i, hours=1),
+            updated_at=now - timedelta(days=i)) for i in range(30)]
+for job in jobs:
+    job.state = JobState.COMPLETED
+archive.append(jobs)
+reads = []
+read_segment = JobArchive._read_segment
+JobArchive._read_segment = staticmethod(lambda segment: reads.append(segment) or read_segment(segment))
+for field, descending in (('created_at', False), ('created_at', True), ('updated_at', False)):
+    reads.clear()
+    first = next(archive.iter_sorted(field, descending=descending))
+    print(field, descending, first.id, len(reads))
+JobArchive._read_segment = staticmethod(read_segment)
+ordered = [job.id for job in archive.iter_sorted('created_at')]
+archive.index_file.unlink()
+print('rebuilt', [job.id for job in archive.iter_sorted('created_at')] == ordered == sorted(ordered, reverse=True))
+"""
+
+def test_lazy_archive():
+    """Test that a sorted archive read opens only the segments the first page can reach"""
+    print("\n=== Test 34: Lazy Archive Reads ===")
+    
+    code, out, err = run_command(f'{sys.executable} -c "{LAZY_ARCHIVE_SCRIPT}"')
+    assert code == 0, f"Lazy archive script failed: {err}"
+    lines = out.splitlines()
+    assert "created_at False day29 1" in lines, f"Oldest-first read opened extra segments: {out}"
+    assert "created_at True day00 1" in lines, f"Newest-first read opened extra segments: {out}"
+    assert "updated_at False day29 1" in lines, f"updated_at read opened extra segments: {out}"
+    assert "rebuilt True" in lines, f"Order changed after rebuilding the segment index: {out}"
+    print("✓ First archived job read from a single segment; index rebuilt for older archives")
+
+def test_list_time_offsets():
+    """Test that --since/--until with a UTC offset filter by the same instant on every backend"""
+    print("\n=== Test 35: List Time Offsets ===")
+    
+    before = (datetime.now(timezone.utc) - timedelta(minutes=1)).astimezone(timezone(timedelta(hours=5, minutes=30)))
+    after = datetime.now(timezone.utc) + timedelta(minutes=1)
+    for backend in ('json', 'sqlite', 'journal'):
+        run_command(f'queuectl config set storage_backend {backend}')
+        try:
+            run_command(f'queuectl enqueue \'{{"id":"tz_{backend}","command":"true","queue":"tz_{backend}"}}\'')
+            code, out, err = run_command(f'queuectl list --queue tz_{backend} --since {before.isoformat()}')
+            assert code == 0, f"List with an offset failed on {backend}: {err}"
+            assert f"tz_{backend}" in out, f"Job created after --since missing on {backend}: {out}"
+            code, out, err = run_command(f'queuectl list --queue tz_{backend} --since {after.isoformat()}')
+            assert "No jobs found" in out, f"Job created before --since listed on {backend}: {out}"
+            code, out, err = run_command(f'queuectl list --queue tz_{backend} --until {after.isoformat()}')
+            assert f"tz_{backend}" in out, f"Job created before --until missing on {backend}: {out}"
+        finally:
+            run_command('queuectl config set storage_backend json')
+    print("✓ Offset-aware --since/--until compared as the same instant on every backend")
+
+# Enqueues a job in the reuse queue, then moves it to the archive as gc would
+ARCHIVE_ID_SCRIPT = """
+from queuectl.job import JobState
+from queuectl.job_queue import JobQueue
+from queuectl.storage import queue_data_dir
+from queuectl.storage.archive import JobArchive
+queue = JobQueue()
+job = queue.enqueue({'id': 'arch_id', 'command': 'true', 'queue': 'reuse'})
+job.state = JobState.COMPLETED
+queue.update_job(job)
+JobArchive(queue_data_dir('reuse')).append([job])
+queue.storage_for('reuse').remove_jobs([job.id])
+"""
+
+def test_unique_ids_across_queues():
+    """Test that a job ID taken in another queue or in an archive is not stored again"""
+    print("\n=== Test 36: IDs Unique Across Queues ===")
+    
+    run_command('queuectl enqueue \'{"id":"dup_q","command":"true","queue":"alpha"}\'')
+    code, out, err = run_command('queuectl enqueue \'{"id":"dup_q","command":"true","queue":"beta"}\'')
+    assert code == 0 and "already enqueued: dup_q" in out, f"ID from another queue reused: {out}{err}"
+    code, out, err = run_command('queuectl list --queue beta')
+    assert "dup_q" not in out, "Duplicate ID stored in a second queue"
+    
+    lines = [
+        '{"id":"dup_b","command":"true","queue":"alpha"}',
+        '{"id":"dup_b","command":"true","queue":"beta"}',
+        '{"id":"dup_q","command":"true","queue":"gamma"}',
+    ]
+    code, out, err = run_command(f"printf '%s\\n' {' '.join(repr(line) for line in lines)} | queuectl enqueue --stdin")
+    assert "Enqueued 1 job(s)" in out and "2 duplicate(s) skipped" in out, f"Bulk IDs not unique across queues: {out}{err}"
+    
+    code, out, err = run_command(f'{sys.executable} -c "{ARCHIVE_ID_SCRIPT}"')
+    assert code == 0, f"Archive script failed: {err}"
+    # The second pass rebuilds a missing archive id index
+    for _ in range(2):
+        code, out, err = run_command('queuectl enqueue \'{"id":"arch_id","command":"true"}\'')
+        assert "already enqueued: arch_id (state: completed)" in out, f"Archived ID reused: {out}{err}"
+        run_command('rm -rf .queuectl/queues/reuse/archive/ids')
+    code, out, err = run_command('queuectl list --state pending')
+    assert "arch_id" not in out, "Archived ID stored again"
+    
+    # The same ID sent to two queues at once is stored once
+    for i in range(5):
+        racers = [subprocess.Popen(f'queuectl enqueue \'{{"id":"race_{i}","command":"true","queue":"{queue}"}}\'',
+                                   shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                  for queue in ('alpha', 'beta')]
+        for racer in racers:
+            racer.communicate()
+    code, out, err = run_command('queuectl list --format jsonl')
+    stored = [json.loads(line)["id"] for line in out.splitlines()]
+    assert all(stored.count(f"race_{i}") == 1 for i in range(5)), f"Concurrent enqueues stored an ID twice: {stored}"
+    print("✓ IDs taken in other queues or archives return the existing job")
+
+# Runs a claimed callable job on the asyncio engine with a pool whose
+# submission raises, then prints whether the outcome was recorded on the
+# event loop thread and the job's stored state and attempts
+ASYNC_FAILURE_SCRIPT = """
+import asyncio, threading
+from queuectl.job_queue import JobQueue
+from queuectl.worker_manager import WorkerManager
+from queuectl.async_worker import AsyncWorker
+from queuectl.leases import LeaseKeeper
+queue = JobQueue([('asyncfail', 1)])
+queue.enqueue({'id': 'async_raise', 'callable': 'builtins:print', 'queue': 'asyncfail', 'max_retries': 1})
+manager = WorkerManager([('asyncfail', 1)])
+worker = AsyncWorker(manager, 2)
+worker.keeper = LeaseKeeper(queue.queues)
+async def broken(job, timeout=None):
+    raise RuntimeError('pool unavailable')
+worker.callable_pool.run_async = broken
+on_loop = []
+finish_job = manager.finish_job
+manager.finish_job = lambda job, success: on_loop.append(threading.current_thread() is threading.main_thread()) or finish_job(job, success)
+job = queue.claim_batch(1, worker.keeper.worker_id)[0]
+asyncio.run(worker.process_job(job))
+print('on_loop', on_loop)
+job = queue.get_job('async_raise')
+print(job.state.value, job.attempts)
+"""
+
+def test_asyncio_job_errors():
+    """Test that an asyncio job whose execution raises is recorded as a failed attempt"""
+    print("\n=== Test 37: Asyncio Job Errors ===")
+    
+    code, out, err = run_command(f'{sys.executable} -c "{ASYNC_FAILURE_SCRIPT}"')
+    assert code == 0, f"Asyncio failure script failed: {err}"
+    assert "raised RuntimeError: pool unavailable" in out, f"Execution error not logged: {out}"
+    assert "on_loop [False]" in out, f"Outcome recorded on the event loop thread: {out}"
+    assert out.splitlines()[-1] == "dead 1", f"Failed attempt not recorded: {out}"
+    print("✓ Execution errors on the asyncio engine fail the attempt")
+
 def cleanup():
     """Clean up test data"""
     print("\n=== Cleanup ===")
@@ -138,6 +1293,38 @@ def main():
         test_config()
         test_worker_basic()
         test_dlq()
+        test_sqlite_backend()
+        test_journal_backend()
+        test_concurrent_claim()
+        test_bulk_enqueue()
+        test_daemon()
+        test_asyncio_engine()
+        test_priority()
+        test_named_queues()
+        test_gc_archive()
+        test_list_pagination()
+        test_status_counters()
+        test_job_logs()
+        test_resource_limits()
+        test_templates()
+        test_callable_jobs()
+        test_dependencies()
+        test_dedupe()
+        test_leases()
+        test_wakeup()
+        test_throttle()
+        test_scheduled_jobs()
+        test_lease_fencing()
+        test_record_encoding()
+        test_autoscaler()
+        test_retry_backoff()
+        test_prefetch()
+        test_archive_merge()
+        test_lazy_archive()
+        test_list_time_offsets()
+        test_unique_ids_across_queues()
+        test_asyncio_job_errors()
+        test_supervisor_shutdown()
         
         print("\n" + "=" * 60)
         print("ALL TESTS COMPLETED")